@@ -1,89 +1,244 @@
-import json
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import os
 import re
+import json
 import string
+import hashlib
+import argparse
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 
-# --------------------------------------
-# Load the JSON data
-# --------------------------------------
-with open("gallery_data_augmented.json", "r") as f:
-    data = json.load(f)
-
-df = pd.json_normalize(data)
+from gallery_stream import iter_records
+from instrumentation import span, count, add_metrics_arguments, metrics_from_args
 
-# --------------------------------------
-# Clean and Extract Sentiment Labels
-# --------------------------------------
-sentiment_raw = df["sentiment"].dropna()
-
-# Extract label inside **...**, clean punctuation, standardize casing
-sentiment_cleaned = (
-    sentiment_raw
-    .str.extract(r"\*\*(.*?)\*\*")[0]
-    .str.strip()
-    .str.strip(string.punctuation)
-    .str.capitalize()
-)
+INPUT_JSON = "gallery_data_augmented.json"
+RESULTS_DIR = "results"
+REPORT_STATE = ".report_state.json"
+MATRIX_NAME = "loss_vs_resilience_matrix"
+SENTIMENT_LABEL = re.compile(r"\*\*(.*?)\*\*")
 
 # Custom sentiment order: most severe to most positive
 sentiment_order = ["Tragic", "Distressing", "Concerned", "Hopeful"]
 
-# --------------------------------------
-# Load and Clean Loss and Resilience Levels
-# --------------------------------------
-loss_levels = df["lossLevel"].dropna().astype(int)
-resilience_levels = df["resilienceLevel"].dropna().astype(int)
+FIGURES = {
+    "sentiment_histogram": {
+        "column": "sentiment", "figsize": (8, 5), "order": sentiment_order, "palette": "Blues",
+        "title": "Histogram of Sentiment Levels", "xlabel": "Sentiment", "rotation": 45,
+    },
+    "loss_histogram": {
+        "column": "lossLevel", "figsize": (6, 4), "order": None, "palette": "Reds",
+        "title": "Histogram of Loss Levels", "xlabel": "Loss Level (1=None, 2=Moderate, 3=High)", "rotation": 0,
+    },
+    "resilience_histogram": {
+        "column": "resilienceLevel", "figsize": (6, 4), "order": None, "palette": "Greens",
+        "title": "Histogram of Resilience Levels", "xlabel": "Resilience Level (1=None, 2=Moderate, 3=High)",
+        "rotation": 0,
+    },
+}
 
-# Set Seaborn style
-sns.set(style="whitegrid")
 
 # --------------------------------------
-# Plot 1: Sentiment Histogram (Custom Order)
+# Load the gallery data
 # --------------------------------------
-plt.figure(figsize=(8, 5))
-sns.countplot(
-    x=sentiment_cleaned,
-    hue=sentiment_cleaned,
-    order=sentiment_order,
-    palette="Blues",
-    legend=False
-)
-plt.title("Histogram of Sentiment Levels")
-plt.xlabel("Sentiment")
-plt.ylabel("Count")
-plt.xticks(rotation=45)
-plt.tight_layout()
-plt.show()
+def load_columns(path=INPUT_JSON):
+    """Cleaned sentiment labels and integer loss/resilience levels."""
+    if path.endswith((".parquet", ".arrow")):
+        # Typed columnar export: only these three columns are read, already cleaned
+        from gallery_columnar import read_columns, STATS_COLUMNS
+
+        df = read_columns(path, STATS_COLUMNS)
+        return {
+            "sentiment": df["sentiment"].dropna().astype(str),
+            "lossLevel": df["lossLevel"].dropna().astype(int),
+            "resilienceLevel": df["resilienceLevel"].dropna().astype(int),
+        }
+
+    # Records are streamed; only the three fields the figures need are kept,
+    # indexed by record position so the matrix pairs levels of the same record
+    sentiments, losses, resiliences = {}, {}, {}
+    for i, record in enumerate(iter_records(path)):
+        if record.get("sentiment") is not None:
+            # Extract label inside **...**
+            match = SENTIMENT_LABEL.search(record["sentiment"])
+            sentiments[i] = match.group(1) if match else None
+        if record.get("lossLevel") is not None:
+            losses[i] = record["lossLevel"]
+        if record.get("resilienceLevel") is not None:
+            resiliences[i] = record["resilienceLevel"]
+
+    # Clean punctuation, standardize casing
+    sentiment_cleaned = (
+        pd.Series(sentiments, dtype="object", name="sentiment")
+        .str.strip()
+        .str.strip(string.punctuation)
+        .str.capitalize()
+    )
+    return {
+        "sentiment": sentiment_cleaned,
+        "lossLevel": pd.Series(losses, dtype="float64", name="lossLevel").astype(int),
+        "resilienceLevel": pd.Series(resiliences, dtype="float64", name="resilienceLevel").astype(int),
+    }
+
+
+def loss_resilience_matrix(columns):
+    return pd.crosstab(columns["lossLevel"], columns["resilienceLevel"])
 
-# --------------------------------------
-# Plot 2: Loss Level Histogram
-# --------------------------------------
-plt.figure(figsize=(6, 4))
-sns.countplot(x=loss_levels, hue=loss_levels, palette="Reds", legend=False)
-plt.title("Histogram of Loss Levels")
-plt.xlabel("Loss Level (1=None, 2=Moderate, 3=High)")
-plt.ylabel("Count")
-plt.xticks(rotation=0)
-plt.tight_layout()
-plt.show()
 
 # --------------------------------------
-# Plot 3: Resilience Level Histogram
+# Plots
 # --------------------------------------
-plt.figure(figsize=(6, 4))
-sns.countplot(x=resilience_levels, hue=resilience_levels, palette="Greens", legend=False)
-plt.title("Histogram of Resilience Levels")
-plt.xlabel("Resilience Level (1=None, 2=Moderate, 3=High)")
-plt.ylabel("Count")
-plt.xticks(rotation=0)
-plt.tight_layout()
-plt.show()
+def plot_histogram(values, spec):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    # Set Seaborn style
+    sns.set(style="whitegrid")
+    values = pd.Series(values, name=spec["column"])
+    fig = plt.figure(figsize=spec["figsize"])
+    sns.countplot(x=values, hue=values, order=spec["order"], palette=spec["palette"], legend=False)
+    plt.title(spec["title"])
+    plt.xlabel(spec["xlabel"])
+    plt.ylabel("Count")
+    plt.xticks(rotation=spec["rotation"])
+    plt.tight_layout()
+    return fig
+
+
+def plot_matrix(matrix):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    sns.set(style="whitegrid")
+    fig = plt.figure(figsize=(5, 4))
+    sns.heatmap(matrix, annot=True, fmt="d", cmap="Purples", cbar=False)
+    plt.title("Loss Level vs Resilience Level")
+    plt.xlabel("Resilience Level")
+    plt.ylabel("Loss Level")
+    plt.tight_layout()
+    return fig
+
+
+def render(name, data, formats, results_dir):
+    """Worker: draws one figure with the Agg backend and saves it in each format."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig = plot_matrix(data) if name == MATRIX_NAME else plot_histogram(data, FIGURES[name])
+    for fmt in formats:
+        fig.savefig(os.path.join(results_dir, f"{name}.{fmt}"))
+    plt.close(fig)
+    return name
+
 
 # --------------------------------------
-# Print Loss vs Resilience Matrix
+# Headless Report
 # --------------------------------------
-matrix = pd.crosstab(loss_levels, resilience_levels)
-print("\nJoint Matrix: Loss Level vs Resilience Level")
-print(matrix)
+def _digest(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def report(input_path=INPUT_JSON, results_dir=RESULTS_DIR, formats=("pdf", "png", "csv"), workers=None,
+           force=False):
+    """
+    Writes the histograms and the loss-vs-resilience matrix into `results_dir`.
+    Figures whose input data (and plot settings) hash the same as in the last
+    report, and whose files exist, are not re-rendered. pyplot and seaborn are
+    only imported, in the worker processes, when a PDF/PNG has to be drawn.
+    """
+    os.makedirs(results_dir, exist_ok=True)
+    state_path = os.path.join(results_dir, REPORT_STATE)
+    state = {}
+    if os.path.exists(state_path) and not force:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+
+    with span("stats.load"):
+        columns = load_columns(input_path)
+        matrix = loss_resilience_matrix(columns)
+    image_formats = [fmt for fmt in formats if fmt != "csv"]
+
+    def up_to_date(key, digest, paths):
+        return state.get(key) == digest and all(os.path.exists(p) for p in paths)
+
+    if "csv" in formats:
+        csv_path = os.path.join(results_dir, f"{MATRIX_NAME}.csv")
+        digest = _digest(matrix.to_dict())
+        if up_to_date(f"{MATRIX_NAME}.csv", digest, [csv_path]):
+            print(f"✅ {csv_path} up to date")
+            count("stats.up_to_date")
+        else:
+            matrix.to_csv(csv_path)
+            state[f"{MATRIX_NAME}.csv"] = digest
+            print(f"📁 Wrote {csv_path}")
+
+    jobs = {}
+    if image_formats:
+        # name -> (what the worker draws, what its hash covers)
+        inputs = {name: (columns[spec["column"]].tolist(), spec) for name, spec in FIGURES.items()}
+        inputs[MATRIX_NAME] = (matrix, None)
+        for name, (data, spec) in inputs.items():
+            paths = [os.path.join(results_dir, f"{name}.{fmt}") for fmt in image_formats]
+            digest = _digest(matrix.to_dict() if name == MATRIX_NAME else data, spec)
+            if up_to_date(name, digest, paths):
+                print(f"✅ {name} up to date")
+                count("stats.up_to_date")
+            else:
+                jobs[name] = (data, digest)
+
+    if jobs:
+        with span("stats.render", figures=len(jobs)), \
+                ProcessPoolExecutor(max_workers=workers or min(len(jobs), os.cpu_count() or 1)) as pool:
+            futures = [pool.submit(render, name, data, image_formats, results_dir)
+                       for name, (data, _) in jobs.items()]
+            for future in futures:
+                name = future.result()
+                state[name] = jobs[name][1]
+                print(f"📊 Rendered {name} ({', '.join(image_formats)})")
+                count("stats.rendered")
+
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1)
+    return matrix
+
+
+def show(input_path=INPUT_JSON):
+    """Interactive mode: one window per figure, and the matrix printed."""
+    import matplotlib.pyplot as plt
+
+    columns = load_columns(input_path)
+    for spec in FIGURES.values():
+        plot_histogram(columns[spec["column"]], spec)
+        plt.show()
+
+    # --------------------------------------
+    # Print Loss vs Resilience Matrix
+    # --------------------------------------
+    matrix = loss_resilience_matrix(columns)
+    print("\nJoint Matrix: Loss Level vs Resilience Level")
+    print(matrix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sentiment/loss/resilience histograms and the loss-vs-resilience matrix")
+    parser.add_argument("--input", default=INPUT_JSON,
+                        help="gallery JSON, or a .parquet/.arrow file from gallery_columnar.py")
+    parser.add_argument("--report", action="store_true",
+                        help="headless: save figures and the matrix into --results-dir instead of showing them")
+    parser.add_argument("--results-dir", default=RESULTS_DIR)
+    parser.add_argument("--formats", nargs="+", choices=("pdf", "png", "csv"), default=["pdf", "png", "csv"],
+                        help="report outputs; csv alone never imports pyplot/seaborn")
+    parser.add_argument("--workers", type=int, default=None, help="figure-rendering processes")
+    parser.add_argument("--force", action="store_true", help="re-render even when the input is unchanged")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    metrics = metrics_from_args(args, "Generate_disaster_scene_stats")
+
+    if args.report:
+        report(args.input, args.results_dir, args.formats, args.workers, args.force)
+    else:
+        show(args.input)
+    metrics.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,183 +2,258 @@
 
 import os
 import json
-import base64
-import pandas as pd
 import time
-import ast
+import argparse
+import pandas as pd
 from openai import OpenAI
 from dotenv import load_dotenv
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+
+from gallery_annotation import (
+    ENTRY_CSV, task_summary_request, sentiment_request, caption_request, upload_data_url,
+    parse_tags, load_tasks, read_text, build_entry, tally_stats,
+    task_structured_request, structured_text, entry_from_structured, failed_entry,
+    FAILED_SUMMARY, FAILED_SENTIMENT, FAILED_CAPTION,
+)
+from llm_cache import cached_create, response_text, chat_text, add_cache_arguments, cache_from_args
+from batch_api import add_batch_arguments
+from image_preprocess import add_preprocess_arguments
+from image_dedup import add_dedup_arguments
+from discrepancy import add_discrepancy_arguments, score_entries
+from gallery_journal import GalleryJournal, input_hash, pending_tasks, DEFAULT_JOURNAL
+from record_store import RecordStore, add_store_arguments
+from thumbnails import apply_thumbnails, load_manifest
+from gallery_shards import export_shards, load_levels, add_shard_arguments
+from instrumentation import span, record_span, add_metrics_arguments, metrics_from_args
 
 # Load environment variables
 dotenv_path = '/Users/chenzhiq/.mytoken_env'
 load_dotenv(dotenv_path=dotenv_path)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=OPENAI_API_KEY)
 
 # Paths
-ENTRY_CSV = "entry_record.csv"
-TEXTS_DIR = "texts"
-IMAGES_DIR = "images"
 OUTPUT_JSON = "gallery_data.json"
+STATS_JSON = "gallery_stats.json"
+AUGMENTED_JSON = "gallery_data_augmented.json"
 
-# Load entry records
-df = pd.read_csv(ENTRY_CSV)
-entries = []
-
-def compute_discrepancy(text1, text2):
-    vectorizer = TfidfVectorizer().fit_transform([text1, text2])
-    vectors = vectorizer.toarray()
-    sim = cosine_similarity([vectors[0]], [vectors[1]])[0][0]
-    return round(1 - sim, 3)  # Discrepancy: 1 - similarity
-
-# For statistics
-summary_tags = {"Damaged Building": 0, "Injury/Death": 0, "Recovery": 0}
-image_tags = {"Damaged Building": 0, "Injury/Death": 0, "Recovery": 0}
 
-for idx, row in df.iterrows():
-    start_time = time.time()
-    print(f"Processing entry {idx + 1}/{len(df)}...")
+def annotate_task(client, task, cache=None):
+    with span("gallery.read_text"):
+        text = read_text(task)
+    image_path = task["image_path"]
 
-    image_files = row.get("image_files", "")
-    if not isinstance(image_files, str) or not image_files.strip():
-        continue
-
-    text_path = os.path.join(TEXTS_DIR, row["text_file"])
-    image_path = image_files.split(",")[0].strip()
-    if not os.path.exists(text_path) or not os.path.exists(image_path):
-        print(f"Skipping missing file: {text_path} or {image_path}")
-        continue
-
-    with open(text_path, "r", encoding="utf-8") as f:
-        text = f.read()
-
-    title = row.get("title", "")
-    url = row.get("url", "")
-    date = row.get("date", "")
-    lat = row.get("latitude", None)
-    lon = row.get("longitude", None)
-
-    # --- GPT: Generate News Summary ---
+    # --- GPT: Generate News Summary & Sentiment ---
     try:
-        summary_prompt = (
-            "Using the title and article text below, write a 1–2 sentence summary focused on "
-            "building damage, collapse, rescue efforts, or people impacted by the 2025 Mandalay earthquake. "
-            "Label the result as 'News Summary:'.\n\n"
-            f"Title: {title}\n\nText: {text}"
-        )
-
-        summary_response = client.responses.create(
-            model="gpt-4o-mini",
-            instructions="You are an assistant generating disaster news summaries.",
-            input=summary_prompt
-        )
-        summary_text = summary_response.output_text.strip()
-
-        # --- GPT: Sentiment Analysis ---
-        sentiment_prompt = (
-            "Given the following summary, classify its sentiment as one of: Neutral, Concerned, Hopeful, Distressing, Tragic.\n"
-            f"Summary: {summary_text}"
-        )
-
-        sentiment_response = client.responses.create(
-            model="gpt-4o-mini",
-            instructions="You are a sentiment analysis assistant.",
-            input=sentiment_prompt
-        )
-        sentiment = sentiment_response.output_text.strip()
+        with span("gallery.summary"):
+            summary_text = cached_create(cache, "responses", client.responses.create,
+                                         task_summary_request(task, text), response_text)
+
+        with span("gallery.sentiment"):
+            sentiment = cached_create(cache, "responses", client.responses.create,
+                                      sentiment_request(summary_text), response_text)
 
     except Exception as e:
         print(f"Error generating summary/sentiment for {image_path}: {e}")
-        summary_text = "News Summary: [Failed to generate]"
-        sentiment = "Unknown"
+        summary_text = FAILED_SUMMARY
+        sentiment = FAILED_SENTIMENT
 
     # --- GPT: Generate Caption & Tags ---
     try:
-        caption_prompt = (
-            "Describe this image in one caption-style sentence focused on earthquake effects such as damage, "
-            "collapse, rescue, or people affected.\n"
-            "Add a short tag in parentheses at the beginning.\n\n"
-            "Also, list relevant tags (e.g., Damaged Building, People, Rescue, Debris, Injured People) "
-            "in the format: Relevant Tags: [tag1, tag2, ...]"
-        )
-
-        with open(image_path, "rb") as img_file:
-            img_bytes = img_file.read()
-            img_base64 = base64.b64encode(img_bytes).decode("utf-8")
-            data_url = f"data:image/jpeg;base64,{img_base64}"
-
-            caption_response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are an assistant generating disaster image captions and tags."},
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": caption_prompt},
-                            {"type": "image_url", "image_url": {"url": data_url}}
-                        ]
-                    }
-                ]
-            )
-
-        caption_text = caption_response.choices[0].message.content.strip()
-        tag_line = next((line for line in caption_text.splitlines() if line.startswith("Tags:")), "")
-        tags = []
-        if tag_line:
-            raw_tags = tag_line.replace("Tags:", "").strip()
-            try:
-                tags = ast.literal_eval(raw_tags)
-                if not isinstance(tags, list):
-                    tags = []
-            except Exception:
-                print(f"⚠️ Warning: Couldn't parse tags for {image_path}. Got: {raw_tags}")
+        with span("gallery.base64"):
+            data_url = upload_data_url(task)
+        with span("gallery.caption"):
+            caption_text = cached_create(cache, "chat.completions", client.chat.completions.create,
+                                         caption_request(data_url), chat_text)
+        tags = parse_tags(caption_text, image_path)
 
     except Exception as e:
         print(f"Error generating caption/tags for {image_path}: {e}")
-        caption_text = "AI Image Caption: [Failed to generate]"
+        caption_text = FAILED_CAPTION
         tags = []
 
-    # --- Discrepancy Score ---
-    discrepancy_score = compute_discrepancy(summary_text, caption_text)
-
-    # --- Stats Tracking ---
-    for tag in tags:
-        if "damage" in tag.lower(): image_tags["Damaged Building"] += 1
-        if "injur" in tag.lower() or "death" in tag.lower(): image_tags["Injury/Death"] += 1
-        if "rescue" in tag.lower() or "recovery" in tag.lower(): image_tags["Recovery"] += 1
-    if "damage" in summary_text.lower(): summary_tags["Damaged Building"] += 1
-    if "injur" in summary_text.lower() or "death" in summary_text.lower(): summary_tags["Injury/Death"] += 1
-    if "rescue" in summary_text.lower() or "recovery" in summary_text.lower(): summary_tags["Recovery"] += 1
-
-    entries.append({
-        "image_file": image_path,
-        "title": title,
-        "url": url,
-        "date": date,
-        "latitude": lat,
-        "longitude": lon,
-        "summary": summary_text,
-        "sentiment": sentiment,
-        "caption": caption_text,
-        "tags": tags,
-        "discrepancy_score": discrepancy_score
-    })
-
-    duration = round(time.time() - start_time, 2)
-    print(f"Finished entry {idx + 1} in {duration} seconds\n")
-
-# Save JSON
-with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
-    json.dump(entries, f, ensure_ascii=False, indent=2)
-
-# Save statistics
-stats = {
-    "summary_tags": summary_tags,
-    "image_tags": image_tags
-}
-with open("gallery_stats.json", "w", encoding="utf-8") as f:
-    json.dump(stats, f, ensure_ascii=False, indent=2)
-
-print(f"✅ Finished generating {len(entries)} gallery entries with tagging, sentiment, and discrepancy.")
+    return build_entry(task, summary_text, sentiment, caption_text, tags)
+
+
+def annotate_task_structured(client, task, cache=None):
+    # --- GPT: Summary, Sentiment, Caption, Tags and Levels in one JSON-schema call ---
+    try:
+        with span("gallery.read_text"):
+            text = read_text(task)
+        with span("gallery.base64"):
+            request = task_structured_request(task, text)
+        with span("gallery.structured"):
+            content = cached_create(cache, "chat.completions", client.chat.completions.create, request,
+                                    lambda response: structured_text(chat_text(response)))
+    except Exception as e:
+        print(f"Error generating structured annotation for {task['image_path']}: {e}")
+        return failed_entry(task)
+    return entry_from_structured(task, content)
+
+
+def run_sequential(tasks, base_url=None, cache=None, on_entry=None, structured=False):
+    client = OpenAI(api_key=OPENAI_API_KEY, base_url=base_url)
+    annotate = annotate_task_structured if structured else annotate_task
+    entries = []
+    for i, task in enumerate(tasks):
+        start_time = time.time()
+        print(f"Processing entry {i + 1}/{len(tasks)}...")
+        entry = annotate(client, task, cache)
+        if on_entry is not None:
+            on_entry(task, entry)
+        entries.append(entry)
+        record_span("gallery.entry", time.time() - start_time)
+        duration = round(time.time() - start_time, 2)
+        print(f"Finished entry {i + 1} in {duration} seconds\n")
+    return entries
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate gallery_data.json from entry_record.csv")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="annotate entries concurrently with the OpenAI async client")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="maximum number of entries in flight (async mode)")
+    parser.add_argument("--rpm", type=int, default=500,
+                        help="requests-per-minute ceiling (async mode)")
+    parser.add_argument("--tpm", type=int, default=200_000,
+                        help="tokens-per-minute ceiling (async mode)")
+    parser.add_argument("--structured", action="store_true",
+                        help="one JSON-schema call per entry returning summary, sentiment, caption, tags "
+                             "and loss/resilience levels")
+    parser.add_argument("--base-url", default=os.getenv("OPENAI_BASE_URL"),
+                        help="alternative OpenAI endpoint, e.g. a local stub server")
+    add_cache_arguments(parser)
+    add_batch_arguments(parser)
+    add_preprocess_arguments(parser)
+    add_dedup_arguments(parser)
+    add_discrepancy_arguments(parser)
+    add_store_arguments(parser)
+    add_shard_arguments(parser)
+    add_metrics_arguments(parser)
+    parser.add_argument("--no-article-dedup", action="store_true",
+                        help="summarize every article even when its cluster_id is shared with others")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip entries already journaled with the same input hash")
+    parser.add_argument("--journal", default=DEFAULT_JOURNAL,
+                        help="append-only checkpoint file written after every entry")
+    return parser.parse_args(argv)
+
+
+def prepare_tasks(args):
+    """Tasks for every entry record, with caption sources and the input hashes the journal compares against."""
+    tasks = load_tasks(pd.read_csv(ENTRY_CSV))
+
+    # Syndicated copies (same cluster_id, see article_dedup.py) share one summary and sentiment
+    if not args.no_article_dedup:
+        from article_dedup import share_cluster_summaries
+        n_clusters = share_cluster_summaries(tasks)
+        if n_clusters:
+            print(f"📰 {len(tasks)} entries share {n_clusters} article clusters")
+
+    # Near-duplicate images are captioned once, via their group's representative;
+    # the identical caption requests are then answered from the cache
+    for task in tasks:
+        task["caption_source"] = task["image_path"]
+    if tasks and not args.no_image_dedup:
+        from image_dedup import representatives
+        start_time = time.time()
+        with span("gallery.image_dedup"):
+            groups = representatives([task["image_path"] for task in tasks], threshold=args.dedup_threshold,
+                                     index_path=args.hash_index, workers=args.preprocess_workers)
+        for task in tasks:
+            task["caption_source"] = groups.get(task["image_path"], task["image_path"])
+        sources = {task["caption_source"] for task in tasks}
+        print(f"🔎 {len(tasks)} images need {len(sources)} captions "
+              f"(threshold {args.dedup_threshold}, {time.time() - start_time:.2f}s)")
+
+    # The representative and the downscale settings decide what the caption model sees
+    upload = None if args.no_preprocess else {"max_edge": args.max_edge, "quality": args.jpeg_quality}
+    for task in tasks:
+        task["input_hash"] = input_hash(task, args.structured, upload)
+    return tasks
+
+
+def main():
+    args = parse_args()
+    metrics = metrics_from_args(args, "Generate_gallerydata_enhanced")
+
+    # Load entry records
+    with span("gallery.prepare_tasks"):
+        tasks = prepare_tasks(args)
+    cache = cache_from_args(args)
+
+    # Checkpoint journal: only entries whose inputs changed (or never finished) are redone
+    journal = GalleryJournal(args.journal)
+    todo = pending_tasks(tasks, journal.load()) if args.resume else tasks
+    print(f"📒 {len(tasks) - len(todo)} entries already journaled, {len(todo)} to process")
+
+    # Downscaled copies are what gets uploaded to the caption model
+    if todo and not args.no_preprocess:
+        from image_preprocess import prepare_images
+        start_time = time.time()
+        with span("gallery.preprocess"):
+            upload_paths = prepare_images(sorted({task["caption_source"] for task in todo}),
+                                          max_edge=args.max_edge, quality=args.jpeg_quality,
+                                          workers=args.preprocess_workers)
+        for task in todo:
+            task["upload_path"] = upload_paths[task["caption_source"]]
+        print(f"🖼️ Prepared {len(upload_paths)} images in {time.time() - start_time:.2f}s")
+
+    journal.open(resume=args.resume)
+    try:
+        if args.batch:
+            from batch_api import OpenAIBatchBackend
+            from gallery_batch import run_batch, run_structured_batch
+            backend = OpenAIBatchBackend(OpenAI(api_key=OPENAI_API_KEY, base_url=args.base_url))
+            batch = run_structured_batch if args.structured else run_batch
+            for task, entry in zip(todo, batch(todo, backend, cache=cache, workdir=args.batch_dir,
+                                               poll_interval=args.poll_interval)):
+                journal.append(task, entry)
+        elif args.use_async:
+            from gallery_async import run_async
+            run_async(todo, concurrency=args.concurrency, rpm=args.rpm, tpm=args.tpm,
+                      api_key=OPENAI_API_KEY, base_url=args.base_url, cache=cache, on_entry=journal.append,
+                      structured=args.structured)
+        else:
+            run_sequential(todo, base_url=args.base_url, cache=cache, on_entry=journal.append,
+                           structured=args.structured)
+    finally:
+        journal.close()
+        cache.report()
+        cache.close()
+
+    # The final JSON is compacted from the journal, in entry_record.csv order
+    entries = journal.compact(tasks)
+
+    # --- Discrepancy Score: one vocabulary/IDF over every summary and caption ---
+    with span("gallery.discrepancy", backend=args.discrepancy_backend):
+        score_entries(entries, args.discrepancy_backend, args.embedding_model)
+
+    # Thumbnail srcset fields (thumbnails.py) survive regeneration; images without them keep the original
+    apply_thumbnails(entries, load_manifest())
+
+    # Save JSON and statistics
+    with span("gallery.save"):
+        with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False, indent=2)
+        with open(STATS_JSON, "w", encoding="utf-8") as f:
+            json.dump(tally_stats(entries), f, ensure_ascii=False, indent=2)
+
+    # Shards and search index for index.html; levels come from the last classifier run until it reruns
+    with span("gallery.shards"):
+        manifest = export_shards(entries, args.shard_dir, args.shard_size, load_levels(AUGMENTED_JSON))
+    print(f"📁 {len(manifest['shards'])} gallery shards and search index -> {args.shard_dir}/")
+
+    # Only entries that differ from their current stored annotation become new versions
+    if args.store:
+        store = RecordStore(args.store)
+        hashes = {task["image_path"]: task["input_hash"] for task in tasks}
+        added = store.add_annotations([(entry, hashes.get(entry["image_file"])) for entry in entries])
+        store.close()
+        print(f"🗄️ {added} new annotation versions in {args.store}")
+
+    print(f"✅ Finished generating {len(entries)} gallery entries with tagging, sentiment, and discrepancy.")
+    metrics.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 import os
 import json
 import base64
+import argparse
 import pandas as pd
 from openai import OpenAI
 from dotenv import load_dotenv
+from llm_cache import cached_create, response_text, chat_text, add_cache_arguments, cache_from_args
 
 # Load environment variables
 # Specify the path to your .env file
@@ -16,6 +18,12 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 # Initialize OpenAI client
 client = OpenAI(api_key=OPENAI_API_KEY)
 
+# Response cache shared with the other generator scripts
+parser = argparse.ArgumentParser(description="Generate gallery_data.json (summary + caption only)")
+add_cache_arguments(parser)
+args = parser.parse_args()
+cache = cache_from_args(args)
+
 # Paths
 ENTRY_CSV = "entry_record.csv"
 TEXTS_DIR = "texts"
@@ -54,12 +62,11 @@ for idx, row in df.iterrows():
             f"Title: {title}\n\nText: {text}"
         )
 
-        summary_response = client.responses.create(
-            model="gpt-4o-mini",
-            instructions="You are an assistant generating disaster news summaries.",
-            input=summary_prompt
-        )
-        summary_text = summary_response.output_text.strip()
+        summary_text = cached_create(cache, "responses", client.responses.create, {
+            "model": "gpt-4o-mini",
+            "instructions": "You are an assistant generating disaster news summaries.",
+            "input": summary_prompt
+        }, response_text)
 
     except Exception as e:
         print(f"Error generating summary for {image_path}: {e}")
@@ -79,21 +86,19 @@ for idx, row in df.iterrows():
             img_base64 = base64.b64encode(img_bytes).decode("utf-8")
             data_url = f"data:image/jpeg;base64,{img_base64}"
 
-            caption_response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are an assistant generating disaster image captions."},
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": caption_prompt},
-                            {"type": "image_url", "image_url": {"url": data_url}}
-                        ]
-                    }
-                ]
-            )
-
-        caption_text = caption_response.choices[0].message.content.strip()
+        caption_text = cached_create(cache, "chat.completions", client.chat.completions.create, {
+            "model": "gpt-4o",
+            "messages": [
+                {"role": "system", "content": "You are an assistant generating disaster image captions."},
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": caption_prompt},
+                        {"type": "image_url", "image_url": {"url": data_url}}
+                    ]
+                }
+            ]
+        }, chat_text)
 
     except Exception as e:
         print(f"Error generating caption for {image_path}: {e}")
@@ -108,6 +113,10 @@ for idx, row in df.iterrows():
         "caption": caption_text
     })
 
+if cache is not None:
+    cache.report()
+    cache.close()
+
 # Save JSON
 with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
     json.dump(entries, f, ensure_ascii=False, indent=2)
@@ -1,78 +1,216 @@
-import json
 import os
-import re
+import argparse
 from dotenv import load_dotenv
 from openai import OpenAI
+from loss_resilience import CLASSIFIER_MODEL, classification_request, parse_levels
+from local_classifier import DEFAULT_MIN_CONFIDENCE
+from record_store import RecordStore, add_store_arguments
+from gallery_stream import iter_records, iter_chunks, RecordWriter
+from llm_cache import cached_create, chat_text, add_cache_arguments, cache_from_args
+from instrumentation import span, count, add_metrics_arguments, metrics_from_args
+from batch_api import (
+    OpenAIBatchBackend, run_batches, batch_line, body_chat_text, add_batch_arguments, CHAT_URL, BATCH_DIR,
+)
 
 # Load environment variables from custom path
 dotenv_path = '/Users/chenzhiq/.mytoken_env'
 load_dotenv(dotenv_path=dotenv_path)
-
-# Initialize OpenAI client
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-def classify_entry(summary, caption):
-    prompt = f"""
-Given the following information from an earthquake-related image, classify the degree of LOSS and RESILIENCE.
-
---- INFORMATION ---
-News Summary: "{summary}"
-Image Caption: "{caption}"
-
---- LOSS CLASSIFICATION RULES ---
-Loss Level 3 (High): Mentions of injured/dead people or fully collapsed buildings with visible debris.
-Loss Level 2 (Moderate): Partially collapsed buildings and other descriptions of damage.
-Loss Level 1 (None): No visible or described damage.
-
---- RESILIENCE CLASSIFICATION RULES ---
-Resilience Level 3 (High): Many rescue or medical personnel are involved.
-Resilience Level 2 (Moderate): One or a few people doing search or rescue.
-Resilience Level 1 (None): No visible recovery effort or rescue work.
-
-Return your answer in the format:
-Loss Level: [1-3]
-Resilience Level: [1-3]
-"""
 
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo-1106",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0
-    )
-
-    content = response.choices[0].message.content.strip()
-
-    # Use regex to extract the levels
-    loss_match = re.search(r"Loss Level:\s*(\d)", content)
-    resilience_match = re.search(r"Resilience Level:\s*(\d)", content)
-
-    if loss_match and resilience_match:
-        return int(loss_match.group(1)), int(resilience_match.group(1))
+INPUT_JSON = "gallery_data.json"
+OUTPUT_JSON = "gallery_data_augmented.json"
+
+
+def classify_entry(client, summary, caption, cache=None):
+    content = cached_create(cache, "chat.completions", client.chat.completions.create,
+                            classification_request(summary, caption), chat_text)
+    return parse_levels(content)
+
+
+def classify_sequential(client, data, cache=None, start=0):
+    for i, item in enumerate(data, start=start):
+        summary = item.get("summary", "")
+        caption = item.get("caption", "")
+        print(f"[record #{i+1}] {item.get('image_file', '')} ...")
+
+        try:
+            with span("levels.classify"):
+                loss, resilience = classify_entry(client, summary, caption, cache)
+        except Exception as e:
+            print(f"Error: {e}")
+            count("levels.failed")
+            loss, resilience = None, None
+        item["lossLevel"] = loss
+        item["resilienceLevel"] = resilience
+
+
+def classify_batch(backend, data, cache=None, workdir=BATCH_DIR, poll_interval=30,
+                   numbers=None, name="loss_resilience"):
+    """
+    Classifies `data` through one batch named `name`. `numbers` are the
+    records' 1-based positions in the whole input (default 1..len(data)),
+    so custom_ids stay stable whichever records of a chunk are sent.
+    """
+    numbers = list(numbers) if numbers is not None else list(range(1, len(data) + 1))
+    contents, lines, pending = {}, [], {}
+    for number, item in zip(numbers, data):
+        custom_id = f"record-{number}-levels"
+        request = classification_request(item.get("summary", ""), item.get("caption", ""))
+        cached = cache.get("chat.completions", request) if cache is not None else None
+        if cached is not None:
+            contents[custom_id] = cached
+        else:
+            lines.append(batch_line(custom_id, CHAT_URL, request))
+            pending[custom_id] = request
+
+    results = run_batches(backend, {name: (CHAT_URL, lines)},
+                          workdir=workdir, poll_interval=poll_interval)
+    for custom_id, request in pending.items():
+        body = results.get(custom_id)
+        if body is not None:
+            contents[custom_id] = body_chat_text(body)
+            if cache is not None:
+                cache.put("chat.completions", request, contents[custom_id])
+
+    for number, item in zip(numbers, data):
+        content = contents.get(f"record-{number}-levels")
+        if content is None:
+            print(f"Error: no batch result for record #{number}")
+            loss, resilience = None, None
+        else:
+            loss, resilience = parse_levels(content)
+        item["lossLevel"] = loss
+        item["resilienceLevel"] = resilience
+
+
+def classify_multi_entry(data, args, cache=None):
+    from loss_resilience import run_classify_multi
+
+    items = [(i + 1, item.get("summary", ""), item.get("caption", "")) for i, item in enumerate(data)]
+    levels = run_classify_multi(items, items_per_request=args.items_per_request, concurrency=args.concurrency,
+                                rpm=args.rpm, tpm=args.tpm, api_key=OPENAI_API_KEY, base_url=args.base_url,
+                                cache=cache)
+    for i, item in enumerate(data):
+        loss, resilience = levels.get(i + 1, (None, None))
+        if loss is None:
+            print(f"Error: record #{i + 1} could not be classified")
+            count("levels.failed")
+        item["lossLevel"] = loss
+        item["resilienceLevel"] = resilience
+
+
+def classify_local(data, model, min_confidence):
+    """
+    Labels the records the local model is confident about and returns the
+    rest, which still need the LLM.
+    """
+    remaining = []
+    for item, (loss, resilience, confidence) in zip(data, model.predict(data)):
+        if confidence >= min_confidence:
+            item["lossLevel"] = loss
+            item["resilienceLevel"] = resilience
+        else:
+            remaining.append(item)
+    print(f"⚡ Local model labeled {len(data) - len(remaining)}/{len(data)} records; "
+          f"{len(remaining)} below confidence {min_confidence} go to {CLASSIFIER_MODEL}")
+    return remaining
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Classify loss/resilience levels for gallery_data.json")
+    parser.add_argument("--input", default=INPUT_JSON, help="gallery .json or .jsonl")
+    parser.add_argument("--output", default=OUTPUT_JSON, help="gallery .json or .jsonl")
+    parser.add_argument("--chunk-size", type=int, default=1000,
+                        help="records read, classified and written at a time (bounds memory; one batch per chunk)")
+    parser.add_argument("--base-url", default=os.getenv("OPENAI_BASE_URL"),
+                        help="alternative OpenAI endpoint, e.g. a local stub server")
+    parser.add_argument("--items-per-request", type=int, default=1,
+                        help="summary/caption pairs packed into one JSON-mode request (1 = one request per record)")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="multi-entry requests in flight")
+    parser.add_argument("--rpm", type=int, default=500,
+                        help="requests-per-minute ceiling (multi-entry mode)")
+    parser.add_argument("--tpm", type=int, default=200_000,
+                        help="tokens-per-minute ceiling (multi-entry mode)")
+    parser.add_argument("--reclassify", action="store_true",
+                        help="classify records that already have levels (e.g. from --structured annotation)")
+    parser.add_argument("--local-model", default=None,
+                        help="trained local_classifier.py model; confident predictions skip the LLM")
+    parser.add_argument("--min-confidence", type=float, default=DEFAULT_MIN_CONFIDENCE,
+                        help="local-model probability needed to keep its label")
+    add_cache_arguments(parser)
+    add_batch_arguments(parser)
+    add_store_arguments(parser)
+    add_metrics_arguments(parser)
+    return parser.parse_args()
+
+
+def classify_records(data, args, client, cache=None, model=None, store=None, start=0):
+    """Classifies one chunk of records in place."""
+    # Entries annotated with --structured already carry both levels
+    todo = [item for item in data if args.reclassify
+            or item.get("lossLevel") is None or item.get("resilienceLevel") is None]
+    if len(todo) < len(data):
+        print(f"📒 {len(data) - len(todo)} records already have levels from structured annotation")
+
+    # Fast path: only records the local model is unsure about reach the LLM
+    classified = todo
+    if model is not None and todo:
+        with span("levels.local_model", records=len(todo)):
+            todo = classify_local(todo, model, args.min_confidence)
+
+    # Process and classify
+    if args.batch:
+        # One batch per chunk, named after its first record so chunks keep their own files
+        numbers = {id(item): start + i + 1 for i, item in enumerate(data)}
+        with span("levels.batch", records=len(todo)):
+            classify_batch(OpenAIBatchBackend(client), todo, cache, workdir=args.batch_dir,
+                           poll_interval=args.poll_interval, numbers=[numbers[id(item)] for item in todo],
+                           name=f"loss_resilience_{start + 1}")
+    elif args.items_per_request > 1:
+        with span("levels.multi", records=len(todo)):
+            classify_multi_entry(todo, args, cache)
     else:
-        print(f"[WARNING] Could not parse response:\n{content}\n")
-        return None, None
-
-# Load your gallery data
-with open("gallery_data.json", "r") as f:
-    data = json.load(f)
-
-# Process and classify
-for i, item in enumerate(data):
-    summary = item.get("summary", "")
-    caption = item.get("caption", "")
-    print(f"[record #{i+1}] {item.get('image_file', '')} ...")
-
+        classify_sequential(client, todo, cache, start=start)
+
+    # Only the records classified in this run are written to the store
+    if store is not None:
+        sent_to_llm = {id(item) for item in todo}
+        by_source = {"local": [item for item in classified if id(item) not in sent_to_llm], "llm": todo}
+        for source, items in by_source.items():
+            store.set_levels([(item["image_file"], item["lossLevel"], item["resilienceLevel"])
+                              for item in items if item.get("lossLevel") is not None], source=source)
+
+
+def main():
+    args = parse_args()
+    metrics = metrics_from_args(args, "Generate_loss_resilience_stats_enhanced")
+    client = OpenAI(api_key=OPENAI_API_KEY, base_url=args.base_url)
+    cache = cache_from_args(args)
+    store = RecordStore(args.store) if args.store else None
+    model = None
+    if args.local_model:
+        from local_classifier import LocalLevelClassifier
+        model = LocalLevelClassifier.load(args.local_model)
+
+    # Records stream from the input to the output a chunk at a time, so memory
+    # does not grow with the gallery file
     try:
-        loss, resilience = classify_entry(summary, caption)
-    except Exception as e:
-        print(f"Error: {e}")
-        loss, resilience = None, None
-    item["lossLevel"] = loss
-    item["resilienceLevel"] = resilience
-
-# Save result
-with open("gallery_data_augmented.json", "w") as f:
-    json.dump(data, f, indent=2)
-
-print("Classification complete. Saved to gallery_data_augmented.json")
+        with RecordWriter(args.output, indent=2, ensure_ascii=True) as writer:
+            for chunk in iter_chunks(iter_records(args.input), args.chunk_size):
+                classify_records(chunk, args, client, cache, model, store, start=writer.count)
+                with span("levels.write", records=len(chunk)):
+                    writer.write_many(chunk)
+    finally:
+        if cache is not None:
+            cache.report()
+            cache.close()
+        if store is not None:
+            store.close()
+
+    print(f"Classification complete. Saved {writer.count} records to {args.output}")
+    metrics.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,19 @@
 import os
 import time
+import argparse
 import requests
 import pandas as pd
-from datetime import datetime, timedelta
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
-import spacy
 from geopy.geocoders import Nominatim
 from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from scraper_pipeline import run_pipeline, RateLimiter
+from geocode_cache import GeocodeCache, CachedGeocoder, DEFAULT_GEOCODE_CACHE
+from ner_batch import load_ner, locations_from_doc
+from image_downloader import ImageDownloader, DownloadManifest, DEFAULT_MANIFEST
+from article_dedup import ArticleIndex, cluster_records, DEFAULT_THRESHOLD
+from record_store import RecordStore, add_store_arguments
+from instrumentation import span, record_span, count, add_metrics_arguments, metrics_from_args
 
 # ---------------------------
 # Load Environment Variables
@@ -18,18 +24,23 @@ load_dotenv(dotenv_path=dotenv_path)
 
 # load_dotenv()
 NEWS_API_KEY = os.getenv("NEWS_API_KEY")
+# Overridable so the scraper can run against local stand-ins
+NEWS_API_URL = os.getenv("NEWS_API_URL", "https://newsapi.org/v2/everything")
+NOMINATIM_DOMAIN = os.getenv("NOMINATIM_DOMAIN", "nominatim.openstreetmap.org")
+NOMINATIM_SCHEME = os.getenv("NOMINATIM_SCHEME", "https")
 
 # ---------------------------
 # Initialize Tools
 # ---------------------------
-nlp = spacy.load("en_core_web_sm")
-geolocator = Nominatim(user_agent="mandalay_earthquake_locator")
+nlp = load_ner()
+geolocator = Nominatim(user_agent="mandalay_earthquake_locator",
+                       domain=NOMINATIM_DOMAIN, scheme=NOMINATIM_SCHEME)
 
 # ---------------------------
 # Helper Functions
 # ---------------------------
 def search_news(query, from_date, to_date, page=1):
-    url = "https://newsapi.org/v2/everything"
+    url = NEWS_API_URL
     params = {
         "q": query,
         "from": from_date,
@@ -39,11 +50,13 @@ def search_news(query, from_date, to_date, page=1):
         "apiKey": NEWS_API_KEY,
         "language": "en"
     }
-    response = requests.get(url, params=params)
+    with span("scrape.newsapi_page", date=from_date, page=page):
+        response = requests.get(url, params=params)
     if response.status_code == 200:
         return response.json()
     else:
         print("NewsAPI error:", response.text)
+        count("scrape.newsapi_error", status=response.status_code)
         return None
 
 def extract_clean_text(article):
@@ -74,45 +87,151 @@ def extract_clean_text_with_timeout(article, timeout=5):
             return ""
 
 def extract_locations_spacy(text):
-    doc = nlp(text)
-    locations = set()
-    for ent in doc.ents:
-        if ent.label_ in ["GPE", "LOC"]:
-            locations.add(ent.text)
-    return list(locations)
+    return locations_from_doc(nlp(text))
+
+def nominatim_lookup(location_name):
+    """Raw Nominatim query; raises on network/service errors."""
+    location = geolocator.geocode(location_name)
+    if location:
+        return (location.latitude, location.longitude)
+    else:
+        return (None, None)
 
 def geocode_location(location_name):
     try:
-        location = geolocator.geocode(location_name)
-        if location:
-            return (location.latitude, location.longitude)
-        else:
-            return (None, None)
+        return nominatim_lookup(location_name)
     except Exception as e:
         print("Geocoding error:", e)
         return (None, None)
 
-def download_image(url, save_folder, filename, timeout=5):
-    """
-    Downloads an image from a URL with a timeout.
-    """
-    try:
-        response = requests.get(url, stream=True, timeout=timeout)
-        if response.status_code == 200:
-            file_path = os.path.join(save_folder, filename)
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(1024):
-                    f.write(chunk)
-            return file_path
-        else:
-            print(f"⚠️ Failed to download image {url} — Status code: {response.status_code}")
+def article_image_urls(article):
+    if article.get("images") and isinstance(article.get("images"), list) and article.get("images"):
+        return article.get("images")
+    elif article.get("urlToImage"):
+        return [article.get("urlToImage")]
+    else:
+        return [None]
+
+
+def next_article_idx(record_file):
+    """First idx after those already in entry_record.csv, so reruns don't overwrite texts."""
+    if os.path.exists(record_file):
+        existing_df = pd.read_csv(record_file)
+        if not existing_df.empty:
+            return int(existing_df["idx"].max()) + 1
+    return 1
+
+
+# ---------------------------
+# Pipeline Stages
+# ---------------------------
+def make_stages(texts_folder, images_folder, geocoder, downloader, article_index, skip_duplicate_texts=False):
+
+    def clean_stage(record):
+        # Extract and clean full text (with timeout)
+        with span("scrape.clean_text"):
+            cleaned_text = extract_clean_text_with_timeout(record["article"], timeout=5)
+        if not cleaned_text.strip():
+            print(f"❗ Skipped article {record['idx']} on {record['date']} — text extraction failed or timed out.")
+            count("scrape.skipped")
             return None
-    except Exception as e:
-        print(f"❗ Image download failed: {e} — Skipping {url}")
-        return None
+
+        # Syndicated copies join the cluster of the first article with the same story
+        with span("scrape.dedup"):
+            record["cluster_id"] = article_index.add(record["idx"], cleaned_text)
+        if skip_duplicate_texts and record["cluster_id"] != record["idx"]:
+            record["text_file"] = article_index.text_files[record["cluster_id"]]
+            print(f"📰 Article {record['idx']} duplicates article {record['cluster_id']} — reusing its text")
+        else:
+            # Save text
+            record["text_file"] = f"text_{record['idx']}.txt"
+            with open(os.path.join(texts_folder, record["text_file"]), "w", encoding="utf-8") as f:
+                f.write(cleaned_text)
+
+        # Extract location info
+        with span("scrape.ner"):
+            record["locations"] = extract_locations_spacy(cleaned_text)
+        return record
+
+    def geocode_stage(record):
+        locations = record["locations"]
+        if locations:
+            with span("scrape.geocode"):
+                record["latitude"], record["longitude"] = geocoder(locations[0])
+        else:
+            record["latitude"], record["longitude"] = (None, None)
+        return record
+
+    def download_stage(record):
+        image_files = []
+        for img_idx, image_url in enumerate(article_image_urls(record["article"]), start=1):
+            if image_url:
+                image_filename = f"image_{record['idx']}_{img_idx}.jpg"
+                with span("scrape.download"):
+                    local_image_path = downloader.fetch(image_url, os.path.join(images_folder, image_filename))
+                if local_image_path:
+                    image_files.append(local_image_path)
+            else:
+                image_files.append("")
+
+        article = record["article"]
+        elapsed = time.time() - record["start_time"]
+        record_span("scrape.article", elapsed)
+        print(f"✅ Processed article {record['idx']} in {elapsed:.2f}s for date {record['date']}")
+        return {
+            "idx": record["idx"],
+            "url": article.get("url"),
+            "title": article.get("title"),
+            "date": record["date"],
+            "text_file": record["text_file"],
+            "cluster_id": record["cluster_id"],
+            "image_files": ", ".join(image_files),
+            "extracted_locations": ", ".join(record["locations"]) if record["locations"] else "",
+            "latitude": record["latitude"],
+            "longitude": record["longitude"]
+        }
+
+    return clean_stage, geocode_stage, download_stage
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Scrape Mandalay earthquake news into entry_record.csv")
+    parser.add_argument("--clean-workers", type=int, default=2,
+                        help="threads running text cleaning and spaCy NER")
+    parser.add_argument("--geocode-workers", type=int, default=1,
+                        help="threads issuing geocoding requests")
+    parser.add_argument("--geocode-rate", type=float, default=1.0,
+                        help="geocoding requests per second across all workers")
+    parser.add_argument("--geocode-cache", default=DEFAULT_GEOCODE_CACHE,
+                        help="SQLite file caching geocoding answers across runs")
+    parser.add_argument("--geocode-ttl-days", type=float, default=180,
+                        help="expiry of cached coordinates")
+    parser.add_argument("--geocode-negative-ttl-days", type=float, default=14,
+                        help="expiry of cached 'place not found' answers")
+    parser.add_argument("--no-gazetteer", action="store_true",
+                        help="skip the offline Myanmar/Thailand gazetteer")
+    parser.add_argument("--download-workers", type=int, default=8,
+                        help="threads downloading article images")
+    parser.add_argument("--download-manifest", default=DEFAULT_MANIFEST,
+                        help="SQLite record of fetched image URLs, their files and failures")
+    parser.add_argument("--revalidate-images", action="store_true",
+                        help="re-check already fetched URLs with conditional GETs")
+    parser.add_argument("--skip-duplicate-texts", action="store_true",
+                        help="do not save texts of articles that copy an already recorded story")
+    parser.add_argument("--dedup-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="MinHash similarity at which two articles count as copies")
+    parser.add_argument("--newsapi-rate", type=float, default=1.0,
+                        help="NewsAPI page requests per second")
+    parser.add_argument("--queue-size", type=int, default=64,
+                        help="bound on each inter-stage queue")
+    add_store_arguments(parser)
+    add_metrics_arguments(parser)
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
+    metrics = metrics_from_args(args, "MandalayEarthquake_data_scraper")
     texts_folder = "texts"
     images_folder = "images"
     os.makedirs(texts_folder, exist_ok=True)
@@ -120,100 +239,68 @@ def main():
 
     query_keywords = "Mandalay earthquake OR Myanmar earthquake"
     date_list = ["2025-03-28", "2025-03-29", "2025-03-30", "2025-03-31", "2025-04-01"]
+    record_file = "entry_record.csv"
 
-    all_records = []
-    global_idx = 1
+    # Nominatim usage policy: 1 request/second; gazetteer and cache hits skip the limiter
+    geocode_cache = GeocodeCache(args.geocode_cache, ttl_days=args.geocode_ttl_days,
+                                 negative_ttl_days=args.geocode_negative_ttl_days)
+    geocoder = CachedGeocoder(nominatim_lookup, cache=geocode_cache, use_gazetteer=not args.no_gazetteer,
+                              limiter=RateLimiter(args.geocode_rate))
 
-    for date_str in date_list:
-        from_date = date_str
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        to_date_obj = date_obj + timedelta(days=1)
-        to_date = to_date_obj.strftime("%Y-%m-%d")
-        print(f"\n🔍 Searching articles for date: {from_date}")
-        
-        day_article_count = 0
-        page = 1
-        while True:
-            news_data = search_news(query_keywords, from_date, to_date, page)
-            if news_data and news_data.get("articles"):
-                articles = news_data.get("articles")
-                if not articles:
-                    break
-                for article in articles:
-                    start_time = time.time()
-
-                    # Extract and clean full text (with timeout)
-                    cleaned_text = extract_clean_text_with_timeout(article, timeout=5)
-                    if not cleaned_text.strip():
-                        print(f"❗ Skipped article {global_idx} on {from_date} — text extraction failed or timed out.")
-                        global_idx += 1
-                        continue
-
-                    # Save text
-                    text_filename = f"text_{global_idx}.txt"
-                    text_filepath = os.path.join(texts_folder, text_filename)
-                    with open(text_filepath, "w", encoding="utf-8") as f:
-                        f.write(cleaned_text)
-
-                    # Extract location info
-                    locations = extract_locations_spacy(cleaned_text)
-                    lat, lon = geocode_location(locations[0]) if locations else (None, None)
-
-                    # Handle image URLs
-                    if article.get("images") and isinstance(article.get("images"), list) and article.get("images"):
-                        image_urls = article.get("images")
-                    elif article.get("urlToImage"):
-                        image_urls = [article.get("urlToImage")]
-                    else:
-                        image_urls = [None]
-
-                    image_files = []
-                    for img_idx, image_url in enumerate(image_urls, start=1):
-                        if image_url:
-                            image_filename = f"image_{global_idx}_{img_idx}.jpg"
-                            local_image_path = download_image(image_url, images_folder, image_filename)
-                            if local_image_path:
-                                image_files.append(local_image_path)
-                        else:
-                            image_files.append("")
-
-                    # Record entry
-                    record = {
-                        "idx": global_idx,
-                        "url": article.get("url"),
-                        "title": article.get("title"),
-                        "date": from_date,
-                        "text_file": text_filename,
-                        "image_files": ", ".join(image_files),
-                        "extracted_locations": ", ".join(locations) if locations else "",
-                        "latitude": lat,
-                        "longitude": lon
-                    }
-
-                    all_records.append(record)
-                    day_article_count += 1
-                    elapsed = time.time() - start_time
-                    print(f"✅ Processed article {global_idx} in {elapsed:.2f}s for date {from_date}")
-                    global_idx += 1
-                    time.sleep(1)
-
-                if len(articles) < 100:
-                    break
-                page += 1
-                time.sleep(1)
-            else:
-                break
+    downloader = ImageDownloader(DownloadManifest(args.download_manifest), workers=args.download_workers,
+                                 revalidate=args.revalidate_images)
 
-        print(f"📅 Finished {from_date}: {day_article_count} articles successfully processed.")
+    # Articles already on record seed the duplicate index
+    # round_trip parsing keeps the coordinates of existing rows identical when the CSV is rewritten
+    existing_df = pd.read_csv(record_file, float_precision="round_trip") if os.path.exists(record_file) else None
+    previous_clusters = None
+    if existing_df is not None and not existing_df.empty:
+        article_index = cluster_records(existing_df, texts_folder, args.dedup_threshold)
+        if "cluster_id" in existing_df.columns:
+            previous_clusters = existing_df["cluster_id"].copy()
+        existing_df["cluster_id"] = [article_index.clusters[int(idx)] for idx in existing_df["idx"]]
+    else:
+        article_index = ArticleIndex(args.dedup_threshold)
 
-    # Append to existing CSV if it exists
-    df = pd.DataFrame(all_records)
-    record_file = "entry_record.csv"
-    if os.path.exists(record_file):
-        existing_df = pd.read_csv(record_file)
-        df = pd.concat([existing_df, df], ignore_index=True)
-    df.to_csv(record_file, index=False)
+    clean_stage, geocode_stage, download_stage = make_stages(texts_folder, images_folder, geocoder, downloader,
+                                                             article_index, args.skip_duplicate_texts)
+    all_records = run_pipeline(
+        search_news, clean_stage, geocode_stage, download_stage, query_keywords, date_list,
+        start_idx=next_article_idx(record_file),
+        clean_workers=args.clean_workers, geocode_workers=args.geocode_workers,
+        download_workers=args.download_workers, newsapi_rate=args.newsapi_rate,
+        queue_size=args.queue_size)
+    geocoder.report()
+    geocode_cache.close()
+    downloader.report()
+    downloader.manifest.close()
+    article_index.report()
+
+    for date_str in date_list:
+        day_article_count = sum(1 for record in all_records if record["date"] == date_str)
+        print(f"📅 Finished {date_str}: {day_article_count} articles successfully processed.")
+
+    if args.store:
+        # Only new articles and re-clustered ones are written; the CSV is exported from the store
+        store = RecordStore(args.store)
+        if existing_df is None:
+            changed = pd.DataFrame()
+        elif previous_clusters is None or not store.counts()["articles"]:
+            changed = existing_df
+        else:
+            changed = existing_df[existing_df["cluster_id"].ne(previous_clusters)]
+        store.upsert_articles(changed.to_dict("records") + all_records)
+        store.export(entry_csv=record_file)
+        print(f"\n🗄️ {len(changed) + len(all_records)} article rows written to {args.store}")
+        store.close()
+    else:
+        # Append to existing CSV if it exists
+        df = pd.DataFrame(all_records)
+        if existing_df is not None:
+            df = pd.concat([existing_df, df], ignore_index=True)
+        df.to_csv(record_file, index=False)
     print(f"\n📁 Entry record saved to {record_file}")
+    metrics.report()
 
 
 if __name__ == "__main__":
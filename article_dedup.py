@@ -0,0 +1,155 @@
+# MinHash/LSH clustering of near-identical (syndicated) articles in texts/
+
+import re
+import zlib
+import argparse
+import threading
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+
+from ner_batch import read_texts
+
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+BANDS = 16
+DEFAULT_THRESHOLD = 0.8
+
+# Mersenne prime 2^31 - 1: (a * x + b) stays below 2^63 for 31-bit a and x
+_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(20250328)
+_A = _rng.randint(1, _PRIME, size=NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, _PRIME, size=NUM_PERM).astype(np.uint64)
+
+
+def shingles(text, k=SHINGLE_WORDS):
+    """Set of hashed k-word shingles of the lower-cased, punctuation-free text."""
+    words = re.findall(r"\w+", text.casefold())
+    if len(words) < k:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))} if words else set()
+    return {zlib.crc32(" ".join(words[i:i + k]).encode("utf-8")) for i in range(len(words) - k + 1)}
+
+
+def minhash(text):
+    """NUM_PERM-value MinHash signature, or None for an empty text."""
+    hashed = shingles(text)
+    if not hashed:
+        return None
+    x = np.fromiter(hashed, dtype=np.uint64, count=len(hashed)) % _PRIME
+    return ((np.outer(_A, x) + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def similarity(sig_a, sig_b):
+    """Jaccard similarity estimated from two signatures."""
+    return float(np.mean(sig_a == sig_b))
+
+
+class ArticleIndex:
+    """
+    LSH index over article signatures. Each signature is cut into BANDS
+    bands; only articles sharing a band bucket are compared, and a candidate
+    counts as a copy when its estimated Jaccard similarity reaches
+    `threshold`. Every article belongs to a cluster named after the idx of
+    the first article added to it, whose text file the cluster shares.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.signatures = {}
+        self.clusters = {}
+        self.text_files = {}
+        self._buckets = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _band_keys(sig):
+        rows = NUM_PERM // BANDS
+        return [(band, sig[band * rows:(band + 1) * rows].tobytes()) for band in range(BANDS)]
+
+    def _match(self, sig):
+        best, best_sim = None, self.threshold
+        seen = set()
+        for key in self._band_keys(sig):
+            for other in self._buckets.get(key, ()):
+                if other in seen:
+                    continue
+                seen.add(other)
+                sim = similarity(sig, self.signatures[other])
+                if sim >= best_sim:
+                    best, best_sim = other, sim
+        return best
+
+    def add(self, idx, text, text_file=None):
+        """Indexes an article and returns its cluster_id (its own idx when it is new)."""
+        sig = minhash(text)
+        with self._lock:
+            other = self._match(sig) if sig is not None else None
+            self.clusters[idx] = self.clusters[other] if other is not None else idx
+            self.text_files.setdefault(self.clusters[idx], text_file or f"text_{idx}.txt")
+            if sig is None:
+                return idx
+            self.signatures[idx] = sig
+            for key in self._band_keys(sig):
+                self._buckets[key].append(idx)
+            return self.clusters[idx]
+
+    def report(self):
+        n_clusters = len(set(self.clusters.values()))
+        print(f"📰 Articles: {len(self.clusters)} indexed in {n_clusters} clusters "
+              f"({len(self.clusters) - n_clusters} near-duplicates)")
+
+
+def cluster_records(df, texts_dir="texts", threshold=DEFAULT_THRESHOLD):
+    """Builds an ArticleIndex from the rows of entry_record.csv, in idx order."""
+    index = ArticleIndex(threshold)
+    ordered = df.sort_values("idx")
+    for idx, text_file, text in zip(ordered["idx"], ordered["text_file"],
+                                    read_texts(ordered["text_file"], texts_dir)):
+        index.add(int(idx), text, text_file)
+    return index
+
+
+def refresh_clusters(record_file="entry_record.csv", texts_dir="texts", threshold=DEFAULT_THRESHOLD):
+    """Rewrites the cluster_id column of entry_record.csv. Returns the ArticleIndex."""
+    # Read as text so every other column is written back byte-for-byte
+    df = pd.read_csv(record_file, dtype=str, keep_default_na=False)
+    index = cluster_records(df.astype({"idx": int}), texts_dir, threshold)
+    df["cluster_id"] = [index.clusters[int(idx)] for idx in df["idx"]]
+    df.to_csv(record_file, index=False)
+    return index
+
+
+def share_cluster_summaries(tasks):
+    """
+    Points every task at the text and title of the first task in its
+    cluster, so copies of one story produce identical summary requests
+    that are sent once. Tasks without a cluster_id are left alone.
+    """
+    first = {}
+    for task in tasks:
+        cluster_id = task.get("cluster_id")
+        if cluster_id is None:
+            continue
+        lead = first.setdefault(cluster_id, task)
+        if lead is not task:
+            task["summary_title"] = lead["title"]
+            task["summary_text_path"] = lead["text_path"]
+    return len(first)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster near-identical articles and record cluster_id "
+                                                 "in entry_record.csv")
+    parser.add_argument("--record-file", default="entry_record.csv")
+    parser.add_argument("--texts-dir", default="texts")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="estimated Jaccard similarity of 5-word shingles for two articles to be copies")
+    args = parser.parse_args()
+
+    index = refresh_clusters(args.record_file, args.texts_dir, args.threshold)
+    index.report()
+    print(f"✅ Wrote cluster_id to {args.record_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# OpenAI Batch API support: JSONL request files, submit/poll backends and result merging
+
+import os
+import json
+import time
+import uuid
+
+from instrumentation import record_usage
+
+BATCH_DIR = "batch"
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# Batch endpoints for the two client calls the generators make
+RESPONSES_URL = "/v1/responses"
+CHAT_URL = "/v1/chat/completions"
+
+
+def batch_line(custom_id, url, body):
+    return {"custom_id": custom_id, "method": "POST", "url": url, "body": body}
+
+
+def write_requests(path, lines):
+    """Writes batch request lines as JSONL. Returns the number of requests written."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    return len(lines)
+
+
+def read_results(path):
+    """
+    Reads a batch output file into {custom_id: response body}. Lines that
+    errored or returned a non-200 status map to None.
+    """
+    results = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for raw in f:
+            if not raw.strip():
+                continue
+            line = json.loads(raw)
+            response = line.get("response") or {}
+            if line.get("error") or response.get("status_code") != 200:
+                print(f"⚠️ Batch request {line['custom_id']} failed: {line.get('error') or response}")
+                results[line["custom_id"]] = None
+            else:
+                results[line["custom_id"]] = response["body"]
+                record_usage(response["body"], batch=True)
+    return results
+
+
+def body_response_text(body):
+    """Equivalent of Response.output_text for a raw /v1/responses body."""
+    parts = []
+    for item in body.get("output", []):
+        for content in item.get("content", []) or []:
+            if content.get("type") == "output_text":
+                parts.append(content["text"])
+    return "".join(parts).strip()
+
+
+def body_chat_text(body):
+    return body["choices"][0]["message"]["content"].strip()
+
+
+# ---------------------------
+# Submit / Poll Backends
+# ---------------------------
+class BatchBackend:
+    """Interface used by run_batches(); see OpenAIBatchBackend and LocalBatchBackend."""
+
+    def submit(self, input_path, endpoint):
+        """Uploads `input_path` and starts a batch. Returns the batch id."""
+        raise NotImplementedError
+
+    def poll(self, batch_id):
+        """Returns the batch status string (e.g. 'in_progress', 'completed')."""
+        raise NotImplementedError
+
+    def download(self, batch_id, output_path):
+        """Writes the output and error lines of a finished batch to `output_path`."""
+        raise NotImplementedError
+
+
+class OpenAIBatchBackend(BatchBackend):
+    def __init__(self, client, completion_window="24h"):
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, input_path, endpoint):
+        with open(input_path, "rb") as f:
+            batch_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=endpoint,
+            completion_window=self.completion_window
+        )
+        return batch.id
+
+    def poll(self, batch_id):
+        return self.client.batches.retrieve(batch_id).status
+
+    def download(self, batch_id, output_path):
+        batch = self.client.batches.retrieve(batch_id)
+        with open(output_path, "w", encoding="utf-8") as f:
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    f.write(self.client.files.content(file_id).text)
+
+
+class LocalBatchBackend(BatchBackend):
+    """
+    File-based stand-in for the Batch API. Each request body is answered by
+    `responder(url, body)`, which returns the response body dict (or raises to
+    record a failed line). Batches complete on the first poll.
+    """
+
+    def __init__(self, responder, workdir=BATCH_DIR):
+        self.responder = responder
+        self.workdir = workdir
+        self._inputs = {}
+
+    def submit(self, input_path, endpoint):
+        batch_id = f"batch_local_{uuid.uuid4().hex[:12]}"
+        self._inputs[batch_id] = (input_path, endpoint)
+        return batch_id
+
+    def poll(self, batch_id):
+        return "completed"
+
+    def download(self, batch_id, output_path):
+        input_path, endpoint = self._inputs[batch_id]
+        with open(input_path, "r", encoding="utf-8") as src, open(output_path, "w", encoding="utf-8") as dst:
+            for raw in src:
+                line = json.loads(raw)
+                try:
+                    result = {"status_code": 200, "body": self.responder(line["url"], line["body"])}
+                    error = None
+                except Exception as e:
+                    result = None
+                    error = {"message": str(e)}
+                dst.write(json.dumps({"custom_id": line["custom_id"], "response": result, "error": error}) + "\n")
+
+
+def run_batches(backend, batches, workdir=BATCH_DIR, poll_interval=30):
+    """
+    Submits several batches at once and waits for all of them.
+
+    `batches` maps a name to (endpoint, request lines). Returns
+    {custom_id: response body or None} merged across every batch.
+    """
+    os.makedirs(workdir, exist_ok=True)
+    submitted = {}
+    for name, (endpoint, lines) in batches.items():
+        if not lines:
+            continue
+        input_path = os.path.join(workdir, f"{name}_requests.jsonl")
+        count = write_requests(input_path, lines)
+        batch_id = backend.submit(input_path, endpoint)
+        print(f"📤 Submitted batch {name} ({count} requests) as {batch_id}")
+        submitted[name] = batch_id
+
+    results = {}
+    pending = dict(submitted)
+    while pending:
+        for name, batch_id in list(pending.items()):
+            status = backend.poll(batch_id)
+            if status not in FINAL_STATUSES:
+                continue
+            del pending[name]
+            print(f"📥 Batch {name} finished with status '{status}'")
+            output_path = os.path.join(workdir, f"{name}_results.jsonl")
+            backend.download(batch_id, output_path)
+            results.update(read_results(output_path))
+        if pending:
+            time.sleep(poll_interval)
+    return results
+
+
+def add_batch_arguments(parser):
+    parser.add_argument("--batch", action="store_true",
+                        help="send all requests through the OpenAI Batch API")
+    parser.add_argument("--batch-dir", default=BATCH_DIR,
+                        help="where batch request/result JSONL files are written")
+    parser.add_argument("--poll-interval", type=float, default=30,
+                        help="seconds between batch status checks")
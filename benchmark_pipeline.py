@@ -0,0 +1,515 @@
+# Offline end-to-end benchmark: local stand-ins for NewsAPI, Nominatim, the image hosts and OpenAI
+
+import io
+import os
+import sys
+import csv
+import json
+import time
+import shlex
+import shutil
+import random
+import hashlib
+import argparse
+import tempfile
+import importlib
+import threading
+import urllib.parse
+import multiprocessing
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ProcessPoolExecutor
+
+from gallery_columnar import peak_rss_mb
+from gallery_stream import iter_records
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICES = ("newsapi", "nominatim", "images", "openai")
+# date_list of MandalayEarthquake_data_scraper.main(); the synthetic corpus is spread over these days
+DATES = ("2025-03-28", "2025-03-29", "2025-03-30", "2025-03-31", "2025-04-01")
+PAGE_SIZE = 100
+
+PLACES = ["Mandalay", "Naypyidaw", "Yangon", "Sagaing", "Bago", "Taunggyi", "Magway", "Pyinmana", "Meiktila",
+          "Monywa", "Shwebo", "Kyaukse", "Myingyan", "Pyin Oo Lwin", "Bangkok", "Chiang Mai", "Myanmar", "Thailand"]
+WORDS = ("building collapsed rescue teams searched rubble survivors hospital damaged bridge monastery pagoda "
+         "tremor aftershock injured killed missing volunteers relief aid supplies shelter tents residents "
+         "apartment tower cracked roads highway airport power outage water medical workers firefighters "
+         "excavators debris mosque school market families evacuated displaced government military donations "
+         "engineers inspected foundations magnitude epicenter fault international search dogs").split()
+SENTIMENT_WORDS = ("Concerned", "Distressing", "Hopeful", "Tragic")
+TAGS = ("Damaged Building", "Debris", "Rescue", "People", "Injured People", "Collapsed Bridge")
+
+# Scripts run per benchmark stage, in order, with arguments suited to the stand-ins (no pacing needed)
+STAGES = [
+    ("scrape", "MandalayEarthquake_data_scraper",
+     "--geocode-rate 1000 --download-workers 16"),
+    ("gallery", "Generate_gallerydata_enhanced",
+     "--async --concurrency 32 --rpm 1000000 --tpm 1000000000"),
+    ("levels", "Generate_loss_resilience_stats_enhanced",
+     "--items-per-request 10 --concurrency 16 --rpm 1000000 --tpm 1000000000"),
+]
+# Metrics JSONL each stage's script writes (--metrics) in its working directory, and the span it
+# records once per article / entry / classifier request (instrumentation.py)
+METRICS_FILE = "metrics.jsonl"
+RECORD_SPANS = {"scrape": "scrape.article", "gallery": "gallery.entry", "levels": "levels.classify"}
+
+
+def _rng(*parts):
+    """Random generator seeded by `parts`, so every run serves the same corpus."""
+    return random.Random(hashlib.sha256(repr(parts).encode("utf-8")).hexdigest())
+
+
+def _sentence(rng, n_words):
+    words = [rng.choice(WORDS) for _ in range(n_words)]
+    return " ".join(words).capitalize() + "."
+
+
+# ---------------------------
+# Stand-in Services
+# ---------------------------
+class _Server(ThreadingHTTPServer):
+    # The default backlog of 5 refuses connections under concurrent clients
+    request_queue_size = 1024
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections are not worth a traceback
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class MockServices:
+    """
+    One local HTTP server answering as NewsAPI (/v2/everything), Nominatim
+    (/search), the image hosts (/img/...) and the OpenAI API (/v1/...). Each
+    service gets a mean latency (jittered +-50%) and rates of HTTP 500 and
+    429 responses; every request's service time is recorded.
+    """
+
+    def __init__(self, corpus_size, latency=None, error_rate=None, rate_limit=None, seed=0):
+        self.corpus_size = corpus_size
+        self.latency = {service: 0.0 for service in SERVICES}
+        self.latency.update(latency or {})
+        self.error_rate = {service: 0.0 for service in SERVICES}
+        self.error_rate.update(error_rate or {})
+        self.rate_limit = {service: 0.0 for service in SERVICES}
+        self.rate_limit.update(rate_limit or {})
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._timings = []
+        self._server = None
+
+    # --- lifecycle ---
+    def start(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                services._handle(self, None)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                services._handle(self, json.loads(body or b"{}"))
+
+        self._server = _Server(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    @property
+    def address(self):
+        return f"127.0.0.1:{self._server.server_address[1]}"
+
+    def env(self):
+        """Environment that points the scripts at the stand-ins."""
+        return {
+            "NEWS_API_URL": f"http://{self.address}/v2/everything",
+            "NEWS_API_KEY": "benchmark",
+            "NOMINATIM_DOMAIN": self.address,
+            "NOMINATIM_SCHEME": "http",
+            "OPENAI_BASE_URL": f"http://{self.address}/v1",
+            "OPENAI_API_KEY": "benchmark",
+        }
+
+    def take_timings(self):
+        """[(service, status, seconds), ...] recorded since the last call."""
+        with self._lock:
+            timings, self._timings = self._timings, []
+        return timings
+
+    # --- dispatch ---
+    def _handle(self, handler, body):
+        start = time.perf_counter()
+        url = urllib.parse.urlparse(handler.path)
+        query = {key: values[0] for key, values in urllib.parse.parse_qs(url.query).items()}
+        if url.path.startswith("/v2/"):
+            service = "newsapi"
+        elif url.path.startswith("/search"):
+            service = "nominatim"
+        elif url.path.startswith("/img/"):
+            service = "images"
+        elif url.path.startswith("/v1/"):
+            service = "openai"
+        else:
+            return self._send(handler, 404, b"", "text/plain", None, start)
+
+        latency = self.latency[service]
+        if latency:
+            time.sleep(latency * self._random.uniform(0.5, 1.5))
+        roll = self._random.random()
+        if roll < self.rate_limit[service]:
+            error = {"status": "error", "code": "rateLimited", "message": "Too many requests",
+                     "error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}}
+            return self._send(handler, 429, json.dumps(error).encode("utf-8"), "application/json", service, start,
+                              headers={"Retry-After": "0", "retry-after-ms": "20"})
+        if roll < self.rate_limit[service] + self.error_rate[service]:
+            error = {"status": "error", "code": "unexpectedError", "message": "Internal error",
+                     "error": {"message": "Internal error", "type": "server_error"}}
+            return self._send(handler, 500, json.dumps(error).encode("utf-8"), "application/json", service, start)
+
+        if service == "images":
+            return self._send(handler, 200, self._image(url.path), "image/jpeg", service, start)
+        if service == "newsapi":
+            answer = self._news_page(query)
+        elif service == "nominatim":
+            answer = self._geocode(query.get("q", ""))
+        else:
+            answer = self._openai(url.path, body)
+        if answer is None:
+            return self._send(handler, 404, b"{}", "application/json", service, start)
+        self._send(handler, 200, json.dumps(answer).encode("utf-8"), "application/json", service, start)
+
+    def _send(self, handler, status, data, content_type, service, start, headers=None):
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+        if service is not None:
+            with self._lock:
+                self._timings.append((service, status, time.perf_counter() - start))
+
+    # --- NewsAPI ---
+    def _article(self, article_id):
+        rng = _rng(self.seed, "article", article_id)
+        places = rng.sample(PLACES, 2)
+        return {
+            "source": {"id": None, "name": f"Wire {article_id % 17}"},
+            "title": f"{places[0]} earthquake: {_sentence(rng, 6)[:-1]}",
+            "description": f"<p>{_sentence(rng, 18)} In {places[0]}, {_sentence(rng, 12).lower()}</p>",
+            "content": f"{_sentence(rng, 25)} Officials in {places[1]} said {_sentence(rng, 20).lower()}",
+            "url": f"https://news.example/{article_id}",
+            "urlToImage": f"http://{self.address}/img/{article_id}.jpg",
+        }
+
+    def _news_page(self, query):
+        if query.get("from") not in DATES:
+            return {"status": "ok", "totalResults": 0, "articles": []}
+        day = DATES.index(query["from"])
+        per_day = -(-self.corpus_size // len(DATES))
+        first, last = day * per_day, min((day + 1) * per_day, self.corpus_size)
+        page, page_size = int(query.get("page", 1)), int(query.get("pageSize", PAGE_SIZE))
+        start = first + (page - 1) * page_size
+        ids = range(start, min(start + page_size, last))
+        return {"status": "ok", "totalResults": max(last - first, 0), "articles": [self._article(i) for i in ids]}
+
+    # --- Nominatim ---
+    def _geocode(self, place):
+        rng = _rng(self.seed, "place", place)
+        lat, lon = 16 + rng.random() * 8, 94 + rng.random() * 5
+        return [{"place_id": abs(hash(place)) % 10 ** 8, "lat": f"{lat:.6f}", "lon": f"{lon:.6f}",
+                 "display_name": f"{place}, Myanmar", "class": "place", "type": "city", "importance": 0.6,
+                 "boundingbox": [f"{lat - 0.1:.6f}", f"{lat + 0.1:.6f}", f"{lon - 0.1:.6f}", f"{lon + 0.1:.6f}"]}]
+
+    # --- image hosts ---
+    def _image(self, path):
+        """A distinct 320x240 JPEG per URL (smoothed noise, so perceptual hashes differ)."""
+        from PIL import Image
+
+        rng = _rng(self.seed, "image", path)
+        small = Image.frombytes("RGB", (40, 30), rng.randbytes(40 * 30 * 3))
+        buffer = io.BytesIO()
+        small.resize((320, 240), Image.BILINEAR).save(buffer, format="JPEG", quality=80)
+        return buffer.getvalue()
+
+    # --- OpenAI ---
+    def _openai(self, path, body):
+        rng = _rng(self.seed, "openai", json.dumps(body, sort_keys=True)[:2000])
+        prompt_tokens = len(json.dumps(body)) // 4
+        if path.endswith("/responses"):
+            if "sentiment" in body.get("instructions", ""):
+                text = f"**{rng.choice(SENTIMENT_WORDS)}** - {_sentence(rng, 10)}"
+            else:
+                text = f"**News Summary:** {_sentence(rng, 30)}"
+            completion_tokens = len(text) // 4
+            return {"id": "resp_benchmark", "object": "response", "created_at": int(time.time()),
+                    "model": body["model"], "status": "completed", "parallel_tool_calls": False,
+                    "tool_choice": "auto", "tools": [],
+                    "output": [{"type": "message", "id": "msg_benchmark", "role": "assistant", "status": "completed",
+                                "content": [{"type": "output_text", "text": text, "annotations": []}]}],
+                    "usage": {"input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens,
+                              "input_tokens_details": {"cached_tokens": 0},
+                              "output_tokens_details": {"reasoning_tokens": 0}}}
+
+        if path.endswith("/embeddings"):
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            data = []
+            for i, text in enumerate(inputs):
+                vector_rng = _rng(self.seed, "embedding", text)
+                data.append({"object": "embedding", "index": i,
+                             "embedding": [vector_rng.uniform(-1, 1) for _ in range(64)]})
+            return {"object": "list", "model": body["model"], "data": data,
+                    "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens}}
+
+        if not path.endswith("/chat/completions"):
+            return None
+        response_format = (body.get("response_format") or {}).get("type")
+        prompt = json.dumps(body["messages"])
+        if response_format == "json_schema":
+            text = json.dumps({"summary": _sentence(rng, 25), "sentiment": rng.choice(SENTIMENT_WORDS),
+                               "caption": f"(Damage) {_sentence(rng, 12)}", "tags": rng.sample(TAGS, 2),
+                               "loss_level": rng.randint(1, 3), "resilience_level": rng.randint(1, 3)})
+        elif response_format == "json_object":
+            content = body["messages"][-1]["content"]
+            items = json.loads(content.split("--- ITEMS ---\n", 1)[1].split("\n\n", 1)[0])
+            text = json.dumps({"items": [{"id": item["id"], "loss": rng.randint(1, 3),
+                                          "resilience": rng.randint(1, 3)} for item in items]})
+        elif "image_url" in prompt:
+            text = f"(Damage) {_sentence(rng, 12)}\n\nRelevant Tags: [{', '.join(rng.sample(TAGS, 3))}]"
+        else:
+            text = f"Loss Level: {rng.randint(1, 3)}\nResilience Level: {rng.randint(1, 3)}"
+        completion_tokens = len(text) // 4
+        return {"id": "chatcmpl-benchmark", "object": "chat.completion", "created": int(time.time()),
+                "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": "stop", "logprobs": None,
+                             "message": {"role": "assistant", "content": text}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens}}
+
+
+# ---------------------------
+# Stage Runs
+# ---------------------------
+def _run_stage(module_name, argv, workdir, env, log_path):
+    """
+    Benchmark worker (a fresh spawned interpreter): runs `module_name`.main()
+    in `workdir` with `argv`, its output going to `log_path`. Returns
+    (seconds, peak RSS in MB).
+    """
+    os.chdir(workdir)
+    os.environ.update(env)
+    sys.path.insert(0, REPO_DIR)
+    log = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(log, 1)
+    os.dup2(log, 2)
+
+    module = importlib.import_module(module_name)
+    sys.argv = [f"{module_name}.py", *argv]
+    start = time.perf_counter()
+    try:
+        module.main()
+    except SystemExit as e:
+        if e.code:
+            raise RuntimeError(f"{module_name} exited with {e.code}") from None
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    return time.perf_counter() - start, peak_rss_mb()
+
+
+def _count_records(stage, workdir):
+    if stage == "scrape":
+        path = os.path.join(workdir, "entry_record.csv")
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            return sum(1 for _ in csv.DictReader(f))
+    path = os.path.join(workdir, "gallery_data.json" if stage == "gallery" else "gallery_data_augmented.json")
+    return sum(1 for _ in iter_records(path))
+
+
+def _record_latencies(stage, workdir):
+    """Per-record seconds the stage's script wrote to the metrics JSONL in `workdir`."""
+    path = os.path.join(workdir, METRICS_FILE)
+    if not os.path.exists(path):
+        return []
+    return [event["seconds"] for event in iter_records(path)
+            if event["type"] == "span" and event["stage"] == RECORD_SPANS[stage]]
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, round(q * (len(values) - 1)))]
+
+
+def run_corpus(size, services_config, stage_args, workdir, keep=False):
+    """Runs every stage against a fresh stand-in corpus of `size` articles. Returns one result per stage."""
+    results = []
+    if keep:
+        run_dir = os.path.join(workdir, f"bench_{size}")
+        shutil.rmtree(run_dir, ignore_errors=True)
+        os.makedirs(run_dir)
+    else:
+        run_dir = tempfile.mkdtemp(prefix=f"bench_{size}_", dir=workdir)
+    services = MockServices(size, **services_config).start()
+    try:
+        for stage, module_name, _ in STAGES:
+            log_path = os.path.join(run_dir, f"{stage}.log")
+            services.take_timings()
+            # A fresh interpreter per stage, so peak RSS is the stage's own
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                try:
+                    argv = [*stage_args[stage], "--metrics", METRICS_FILE]
+                    seconds, rss = pool.submit(_run_stage, module_name, argv, run_dir,
+                                               services.env(), log_path).result()
+                except Exception as e:
+                    where = f"log: {log_path}" if keep else "rerun with --keep to inspect its log"
+                    print(f"❗ {stage} failed on {size:,} articles: {e} ({where})")
+                    break
+            timings = services.take_timings()
+            latencies = [elapsed for _, _, elapsed in timings]
+            records = _count_records(stage, run_dir)
+            per_record = _record_latencies(stage, run_dir)
+            results.append({
+                "corpus": size, "stage": stage, "records": records, "seconds": round(seconds, 3),
+                "records_per_sec": round(records / seconds, 2) if seconds else None,
+                "requests": {service: sum(1 for s, _, _ in timings if s == service) for service in SERVICES},
+                "rate_limited": sum(1 for _, status, _ in timings if status == 429),
+                "errors": sum(1 for _, status, _ in timings if status >= 500),
+                "p50_ms": round(_percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+                "p95_ms": round(_percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+                "record_p50_ms": round(_percentile(per_record, 0.50) * 1000, 1) if per_record else None,
+                "record_p95_ms": round(_percentile(per_record, 0.95) * 1000, 1) if per_record else None,
+                "peak_rss_mb": round(rss, 1),
+            })
+            print_result(results[-1])
+    finally:
+        services.stop()
+        if not keep:
+            shutil.rmtree(run_dir, ignore_errors=True)
+    return results
+
+
+def print_header():
+    print(f"   {'corpus':>8} {'stage':<8} {'records':>8} {'seconds':>9} {'rec/s':>9} {'requests':>9} "
+          f"{'429':>6} {'5xx':>6} {'p50 ms':>8} {'p95 ms':>8} {'rec p50':>8} {'rec p95':>8} {'peak RSS MB':>12}")
+
+
+def print_result(r):
+    def ms(value):
+        return f"{value:>8.1f}" if value is not None else f"{'-':>8}"
+
+    print(f"   {r['corpus']:>8,} {r['stage']:<8} {r['records']:>8,} {r['seconds']:>9.2f} "
+          f"{r['records_per_sec'] or 0:>9.1f} {sum(r['requests'].values()):>9,} {r['rate_limited']:>6,} "
+          f"{r['errors']:>6,} {ms(r['p50_ms'])} {ms(r['p95_ms'])} {ms(r['record_p50_ms'])} "
+          f"{ms(r['record_p95_ms'])} {r['peak_rss_mb']:>12.0f}")
+
+
+def compare(results, baseline, tolerance):
+    """Regressions against a saved run: throughput below, or peak RSS above, `tolerance` of the baseline."""
+    previous = {(r["corpus"], r["stage"]): r for r in baseline}
+    regressions = []
+    for r in results:
+        old = previous.get((r["corpus"], r["stage"]))
+        if old is None:
+            continue
+        if old["records_per_sec"] and (r["records_per_sec"] or 0) < old["records_per_sec"] * (1 - tolerance):
+            regressions.append(f"{r['stage']} @ {r['corpus']:,}: {r['records_per_sec']} rec/s "
+                               f"(baseline {old['records_per_sec']})")
+        if r["peak_rss_mb"] > old["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{r['stage']} @ {r['corpus']:,}: peak RSS {r['peak_rss_mb']} MB "
+                               f"(baseline {old['peak_rss_mb']})")
+    return regressions
+
+
+# ---------------------------
+# Main
+# ---------------------------
+def _service_values(pairs, flag):
+    """{"openai": 0.3, ...} from ["openai=0.3", ...]."""
+    values = {}
+    for pair in pairs or []:
+        service, _, value = pair.partition("=")
+        if service not in SERVICES or not value:
+            raise SystemExit(f"{flag} expects SERVICE=VALUE with SERVICE one of {', '.join(SERVICES)}: {pair!r}")
+        values[service] = float(value)
+    return values
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the scraper and generator scripts end-to-end against local stand-in services")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000],
+                        help="synthetic corpus sizes (articles)")
+    parser.add_argument("--latency", nargs="*", metavar="SERVICE=SECONDS",
+                        help=f"mean response latency per service ({', '.join(SERVICES)})")
+    parser.add_argument("--error-rate", nargs="*", metavar="SERVICE=RATE", help="fraction of HTTP 500 responses")
+    parser.add_argument("--rate-limit", nargs="*", metavar="SERVICE=RATE", help="fraction of HTTP 429 responses")
+    parser.add_argument("--seed", type=int, default=0)
+    for stage, _, default in STAGES:
+        parser.add_argument(f"--{stage}-args", default=default,
+                            help=f"arguments for the {stage} stage (default: {default!r})")
+    parser.add_argument("--workdir", default=None, help="where the per-corpus working directories go")
+    parser.add_argument("--keep", action="store_true", help="keep each corpus' outputs and logs in --workdir")
+    parser.add_argument("--output", default=None, help="save the results as JSON")
+    parser.add_argument("--baseline", default=None, help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed fraction of throughput loss / peak RSS growth against --baseline")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    services_config = {"latency": _service_values(args.latency, "--latency"),
+                       "error_rate": _service_values(args.error_rate, "--error-rate"),
+                       "rate_limit": _service_values(args.rate_limit, "--rate-limit"),
+                       "seed": args.seed}
+    stage_args = {stage: shlex.split(getattr(args, f"{stage}_args")) for stage, _, _ in STAGES}
+    workdir = os.path.abspath(args.workdir or tempfile.gettempdir())
+    os.makedirs(workdir, exist_ok=True)
+
+    print(f"📊 Stand-in latency {services_config['latency'] or 'none'}, "
+          f"5xx {services_config['error_rate'] or 'none'}, 429 {services_config['rate_limit'] or 'none'}")
+    print("   p50/p95: the stage's requests to the stand-ins; rec p50/p95: per article, entry or "
+          "classifier request, from the scripts' metrics")
+    print_header()
+    results = []
+    for size in args.sizes:
+        results.extend(run_corpus(size, services_config, stage_args, workdir, args.keep))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": {**services_config, "stage_args": stage_args}, "results": results}, f, indent=2)
+        print(f"📁 Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"❗ Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ No regressions beyond {args.tolerance:.0%} of {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# Corpus-level summary/caption discrepancy scoring, and offline rescoring of gallery_data.json
+
+import json
+import argparse
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+
+def tfidf_similarities(summaries, captions):
+    """
+    Cosine similarity of each summary/caption pair, with one vocabulary and
+    IDF fitted over every summary and caption so scores are comparable
+    across entries. Rows are L2-normalized, so the cosine of pair i is the
+    dot product of row i of both matrices.
+    """
+    vectorizer = TfidfVectorizer()
+    try:
+        vectorizer.fit(list(summaries) + list(captions))
+    except ValueError:
+        # Empty vocabulary: nothing to compare
+        return np.zeros(len(summaries))
+    s = vectorizer.transform(summaries)
+    c = vectorizer.transform(captions)
+    return np.asarray(s.multiply(c).sum(axis=1)).ravel()
+
+
+def embedding_similarities(summaries, captions, model_name=DEFAULT_EMBEDDING_MODEL, batch_size=64):
+    """Cosine similarity of each pair under a local sentence-transformers model."""
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name)
+    s = model.encode(list(summaries), batch_size=batch_size, normalize_embeddings=True)
+    c = model.encode(list(captions), batch_size=batch_size, normalize_embeddings=True)
+    return np.einsum("ij,ij->i", s, c)
+
+
+def discrepancy_scores(summaries, captions, backend="tfidf", model_name=DEFAULT_EMBEDDING_MODEL):
+    """Discrepancy (1 - similarity, rounded to 3 places) for every summary/caption pair."""
+    if backend == "tfidf":
+        sims = tfidf_similarities(summaries, captions)
+    elif backend == "embedding":
+        sims = embedding_similarities(summaries, captions, model_name)
+    else:
+        raise ValueError(f"Unknown discrepancy backend: {backend}")
+    return [round(1 - float(sim), 3) for sim in sims]
+
+
+def score_entries(entries, backend="tfidf", model_name=DEFAULT_EMBEDDING_MODEL):
+    """Sets discrepancy_score on every gallery entry in place. Returns the entries."""
+    scores = discrepancy_scores([e["summary"] for e in entries], [e["caption"] for e in entries],
+                                backend, model_name)
+    for entry, score in zip(entries, scores):
+        entry["discrepancy_score"] = score
+    return entries
+
+
+def add_discrepancy_arguments(parser):
+    parser.add_argument("--discrepancy-backend", choices=("tfidf", "embedding"), default="tfidf",
+                        help="corpus TF-IDF, or a local sentence-transformers model")
+    parser.add_argument("--embedding-model", default=DEFAULT_EMBEDDING_MODEL,
+                        help="sentence-transformers model for --discrepancy-backend embedding")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute discrepancy_score in gallery_data.json without API calls")
+    parser.add_argument("--input", default="gallery_data.json")
+    parser.add_argument("--output", default=None, help="defaults to rewriting --input")
+    add_discrepancy_arguments(parser)
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    before = [e.get("discrepancy_score") for e in entries]
+    score_entries(entries, args.discrepancy_backend, args.embedding_model)
+    changed = sum(1 for old, e in zip(before, entries) if old != e["discrepancy_score"])
+
+    output = args.output or args.input
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False, indent=2)
+    print(f"✅ Rescored {len(entries)} entries with {args.discrepancy_backend} ({changed} changed) -> {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+# Prompts, request payloads and response parsing shared by the gallery generators
+
+import os
+import re
+import ast
+import json
+import base64
+import hashlib
+import pandas as pd
+
+from loss_resilience import RULES as LEVEL_RULES
+
+# Paths
+ENTRY_CSV = "entry_record.csv"
+TEXTS_DIR = "texts"
+IMAGES_DIR = "images"
+
+# Models
+SUMMARY_MODEL = "gpt-4o-mini"
+SENTIMENT_MODEL = "gpt-4o-mini"
+CAPTION_MODEL = "gpt-4o"
+# Structured mode: one vision call returns every field
+STRUCTURED_MODEL = "gpt-4o"
+
+SENTIMENTS = ["Neutral", "Concerned", "Hopeful", "Distressing", "Tragic"]
+
+SUMMARY_INSTRUCTIONS = "You are an assistant generating disaster news summaries."
+SENTIMENT_INSTRUCTIONS = "You are a sentiment analysis assistant."
+CAPTION_SYSTEM_PROMPT = "You are an assistant generating disaster image captions and tags."
+
+CAPTION_PROMPT = (
+    "Describe this image in one caption-style sentence focused on earthquake effects such as damage, "
+    "collapse, rescue, or people affected.\n"
+    "Add a short tag in parentheses at the beginning.\n\n"
+    "Also, list relevant tags (e.g., Damaged Building, People, Rescue, Debris, Injured People) "
+    "in the format: Relevant Tags: [tag1, tag2, ...]"
+)
+
+# Fallback values written when a model call fails
+FAILED_SUMMARY = "News Summary: [Failed to generate]"
+FAILED_SENTIMENT = "Unknown"
+FAILED_CAPTION = "AI Image Caption: [Failed to generate]"
+
+
+# ---------------------------
+# Request Payloads
+# ---------------------------
+def build_summary_prompt(title, text):
+    return (
+        "Using the title and article text below, write a 1–2 sentence summary focused on "
+        "building damage, collapse, rescue efforts, or people impacted by the 2025 Mandalay earthquake. "
+        "Label the result as 'News Summary:'.\n\n"
+        f"Title: {title}\n\nText: {text}"
+    )
+
+
+def build_sentiment_prompt(summary_text):
+    return (
+        f"Given the following summary, classify its sentiment as one of: {', '.join(SENTIMENTS)}.\n"
+        f"Summary: {summary_text}"
+    )
+
+
+def summary_request(title, text):
+    """Keyword arguments for client.responses.create() producing the news summary."""
+    return {
+        "model": SUMMARY_MODEL,
+        "instructions": SUMMARY_INSTRUCTIONS,
+        "input": build_summary_prompt(title, text),
+    }
+
+
+def sentiment_request(summary_text):
+    """Keyword arguments for client.responses.create() classifying the summary sentiment."""
+    return {
+        "model": SENTIMENT_MODEL,
+        "instructions": SENTIMENT_INSTRUCTIONS,
+        "input": build_sentiment_prompt(summary_text),
+    }
+
+
+def image_data_url(image_path):
+    with open(image_path, "rb") as img_file:
+        img_base64 = base64.b64encode(img_file.read()).decode("utf-8")
+    return f"data:image/jpeg;base64,{img_base64}"
+
+
+def upload_data_url(task):
+    """Data URL for the caption call, using the preprocessed copy when one exists."""
+    return image_data_url(task.get("upload_path") or task.get("caption_source") or task["image_path"])
+
+
+def caption_request(data_url):
+    """Keyword arguments for client.chat.completions.create() captioning one image."""
+    return {
+        "model": CAPTION_MODEL,
+        "messages": [
+            {"role": "system", "content": CAPTION_SYSTEM_PROMPT},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": CAPTION_PROMPT},
+                    {"type": "image_url", "image_url": {"url": data_url}}
+                ]
+            }
+        ]
+    }
+
+
+# ---------------------------
+# Structured Annotation
+# ---------------------------
+STRUCTURED_INSTRUCTIONS = "You are an assistant annotating disaster news images and articles."
+
+ANNOTATION_SCHEMA = {
+    "name": "gallery_annotation",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "summary": {"type": "string", "description": "1–2 sentence summary of the article focused on building "
+                        "damage, collapse, rescue efforts, or people impacted by the 2025 Mandalay earthquake"},
+            "sentiment": {"type": "string", "enum": SENTIMENTS, "description": "sentiment of the summary"},
+            "caption": {"type": "string", "description": "one caption-style sentence describing the image's "
+                        "earthquake effects, starting with a short tag in parentheses"},
+            "tags": {"type": "array", "items": {"type": "string"}, "description": "relevant image tags, e.g. "
+                     "Damaged Building, People, Rescue, Debris, Injured People"},
+            "loss_level": {"type": "integer", "enum": [1, 2, 3]},
+            "resilience_level": {"type": "integer", "enum": [1, 2, 3]},
+        },
+        "required": ["summary", "sentiment", "caption", "tags", "loss_level", "resilience_level"],
+        "additionalProperties": False,
+    },
+}
+
+
+def structured_request(title, text, data_url):
+    """
+    Keyword arguments for client.chat.completions.create() returning the
+    summary, sentiment, caption, tags and loss/resilience levels of one
+    entry as JSON that follows ANNOTATION_SCHEMA.
+    """
+    prompt = (
+        "Annotate this earthquake news entry. Summarize the article, classify the sentiment of your summary, "
+        "caption and tag the image, and classify the degree of LOSS and RESILIENCE using both the summary "
+        f"and the image.\n\n{LEVEL_RULES}\n\nTitle: {title}\n\nText: {text}"
+    )
+    return {
+        "model": STRUCTURED_MODEL,
+        "messages": [
+            {"role": "system", "content": STRUCTURED_INSTRUCTIONS},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": data_url}}
+                ]
+            }
+        ],
+        "response_format": {"type": "json_schema", "json_schema": ANNOTATION_SCHEMA},
+        "temperature": 0
+    }
+
+
+def task_structured_request(task, text):
+    return structured_request(task.get("summary_title") or task["title"], text, upload_data_url(task))
+
+
+def parse_structured(content):
+    """Fields of a structured answer; raises ValueError when it does not follow ANNOTATION_SCHEMA."""
+    fields = json.loads(content)
+    schema = ANNOTATION_SCHEMA["schema"]
+    if not isinstance(fields, dict) or set(fields) != set(schema["required"]):
+        raise ValueError(f"unexpected fields: {content[:200]}")
+    for key in ("loss_level", "resilience_level"):
+        if fields[key] not in schema["properties"][key]["enum"]:
+            raise ValueError(f"{key} out of range: {fields[key]!r}")
+    if not isinstance(fields["tags"], list):
+        raise ValueError(f"tags is not a list: {fields['tags']!r}")
+    return fields
+
+
+def structured_text(text):
+    """Validates a structured answer before it is returned (and cached) as text."""
+    parse_structured(text)
+    return text
+
+
+def entry_from_structured(task, content):
+    fields = parse_structured(content)
+    entry = build_entry(task, fields["summary"], fields["sentiment"], fields["caption"],
+                        [str(tag) for tag in fields["tags"]])
+    entry["lossLevel"], entry["resilienceLevel"] = fields["loss_level"], fields["resilience_level"]
+    return entry
+
+
+def failed_entry(task):
+    """Entry made of the failure placeholders, so it is redone on --resume."""
+    return build_entry(task, FAILED_SUMMARY, FAILED_SENTIMENT, FAILED_CAPTION, [])
+
+
+def prompt_fingerprint(structured=False):
+    """Short hash of the models and prompt templates; changes whenever a prompt is edited."""
+    templates = [summary_request("", ""), sentiment_request(""), caption_request("")]
+    if structured:
+        templates = [structured_request("", "", "")]
+    return hashlib.sha256(json.dumps(templates, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+# ---------------------------
+# Response Parsing
+# ---------------------------
+# The model writes "Relevant Tags: [Damaged Building, Debris]", sometimes in bold or without brackets
+TAG_LINE = re.compile(r"^[*_\s]*(?:relevant\s+)?tags[*_]*\s*:[*_]*\s*(.*)$", re.IGNORECASE)
+
+
+def parse_tags(caption_text, image_path=""):
+    raw_tags = next((m.group(1).strip() for m in map(TAG_LINE.match, caption_text.splitlines()) if m), None)
+    if raw_tags is None:
+        return []
+    try:
+        # Quoted Python/JSON lists
+        tags = ast.literal_eval(raw_tags)
+    except (ValueError, SyntaxError):
+        # Bare lists: [Damaged Building, Debris]
+        tags = raw_tags.strip("[]").split(",")
+    if not isinstance(tags, (list, tuple)):
+        print(f"⚠️ Warning: Couldn't parse tags for {image_path}. Got: {raw_tags}")
+        return []
+    return [t for t in (str(tag).strip().strip("'\"*").strip() for tag in tags) if t]
+
+
+# ---------------------------
+# Entry Records
+# ---------------------------
+def load_tasks(df):
+    """
+    Turns the rows of entry_record.csv into annotation tasks, in row order.
+    Rows without an image or with missing text/image files are skipped.
+    """
+    tasks = []
+    for idx, row in df.iterrows():
+        image_files = row.get("image_files", "")
+        if not isinstance(image_files, str) or not image_files.strip():
+            continue
+
+        text_path = os.path.join(TEXTS_DIR, row["text_file"])
+        image_path = image_files.split(",")[0].strip()
+        if not os.path.exists(text_path) or not os.path.exists(image_path):
+            print(f"Skipping missing file: {text_path} or {image_path}")
+            continue
+
+        tasks.append({
+            "row": idx,
+            "idx": int(row.get("idx", idx + 1)),
+            "text_path": text_path,
+            "image_path": image_path,
+            "title": row.get("title", ""),
+            "url": row.get("url", ""),
+            "date": row.get("date", ""),
+            "latitude": row.get("latitude", None),
+            "longitude": row.get("longitude", None),
+            "cluster_id": int(row["cluster_id"]) if pd.notna(row.get("cluster_id")) else None,
+        })
+    return tasks
+
+
+def read_text(task):
+    """Article text the summary is written from (the cluster lead's, when shared)."""
+    with open(task.get("summary_text_path") or task["text_path"], "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def task_summary_request(task, text):
+    return summary_request(task.get("summary_title") or task["title"], text)
+
+
+def build_entry(task, summary_text, sentiment, caption_text, tags):
+    return {
+        "image_file": task["image_path"],
+        "title": task["title"],
+        "url": task["url"],
+        "date": task["date"],
+        "latitude": task["latitude"],
+        "longitude": task["longitude"],
+        "summary": summary_text,
+        "sentiment": sentiment,
+        "caption": caption_text,
+        "tags": tags,
+        # Scored over the whole corpus once every entry exists (discrepancy.score_entries)
+        "discrepancy_score": None
+    }
+
+
+def is_complete(entry):
+    """False when any model call for the entry fell back to a failure placeholder."""
+    return entry["summary"] != FAILED_SUMMARY and entry["caption"] != FAILED_CAPTION
+
+
+def tally_stats(entries):
+    """Counts damage / injury / recovery mentions in summaries and image tags."""
+    summary_tags = {"Damaged Building": 0, "Injury/Death": 0, "Recovery": 0}
+    image_tags = {"Damaged Building": 0, "Injury/Death": 0, "Recovery": 0}
+    for entry in entries:
+        for tag in entry["tags"]:
+            if "damage" in tag.lower(): image_tags["Damaged Building"] += 1
+            if "injur" in tag.lower() or "death" in tag.lower(): image_tags["Injury/Death"] += 1
+            if "rescue" in tag.lower() or "recovery" in tag.lower(): image_tags["Recovery"] += 1
+        summary_text = entry["summary"].lower()
+        if "damage" in summary_text: summary_tags["Damaged Building"] += 1
+        if "injur" in summary_text or "death" in summary_text: summary_tags["Injury/Death"] += 1
+        if "rescue" in summary_text or "recovery" in summary_text: summary_tags["Recovery"] += 1
+    return {
+        "summary_tags": summary_tags,
+        "image_tags": image_tags
+    }
@@ -0,0 +1,268 @@
+# Concurrent annotation engine for the gallery generator (OpenAI async client)
+
+import time
+import random
+import asyncio
+import openai
+from openai import AsyncOpenAI
+
+from gallery_annotation import (
+    task_summary_request, sentiment_request, caption_request, upload_data_url,
+    parse_tags, read_text, build_entry, failed_entry,
+    task_structured_request, structured_text, entry_from_structured,
+    FAILED_SUMMARY, FAILED_SENTIMENT, FAILED_CAPTION,
+)
+from llm_cache import make_key, response_text, chat_text
+from instrumentation import span, count, record_span, record_usage
+
+# Rough vision-token cost of one image at default detail
+IMAGE_TOKEN_ESTIMATE = 1000
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+def estimate_tokens(request):
+    """Cheap prompt-size estimate (~4 characters per token) used for TPM budgeting."""
+    chars = len(request.get("instructions", "")) + len(request.get("input", ""))
+    images = 0
+    for message in request.get("messages", []):
+        content = message["content"]
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for part in content:
+            if part["type"] == "text":
+                chars += len(part["text"])
+            else:
+                images += 1
+    return chars // 4 + images * IMAGE_TOKEN_ESTIMATE
+
+
+# ---------------------------
+# Rate Limiting
+# ---------------------------
+class AdaptiveRateLimiter:
+    """
+    Token-bucket limiter over requests-per-minute and tokens-per-minute.
+
+    On a 429 both budgets are halved (down to `min_fraction` of the configured
+    limits); every successful call then grows them back by `recovery` of the
+    configured limit until the ceiling is reached again.
+    """
+
+    def __init__(self, rpm, tpm, min_fraction=0.1, recovery=0.02):
+        self.max_rpm = float(rpm)
+        self.max_tpm = float(tpm)
+        self.rpm = self.max_rpm
+        self.tpm = self.max_tpm
+        self.min_fraction = min_fraction
+        self.recovery = recovery
+        self._requests = self.rpm
+        self._tokens = self.tpm
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    async def acquire(self, tokens):
+        async with self._lock:
+            while True:
+                self._refill()
+                # A single request larger than the whole bucket would never fit; the
+                # bucket may also have shrunk (on_rate_limited) while we waited
+                needed = min(tokens, self.tpm)
+                if self._requests >= 1 and self._tokens >= needed:
+                    self._requests -= 1
+                    self._tokens -= needed
+                    return
+                wait_requests = (1 - self._requests) * 60.0 / self.rpm
+                wait_tokens = (needed - self._tokens) * 60.0 / self.tpm
+                await asyncio.sleep(max(wait_requests, wait_tokens, 0.01))
+
+    def on_success(self):
+        self.rpm = min(self.max_rpm, self.rpm + self.max_rpm * self.recovery)
+        self.tpm = min(self.max_tpm, self.tpm + self.max_tpm * self.recovery)
+
+    def on_rate_limited(self):
+        self.rpm = max(self.max_rpm * self.min_fraction, self.rpm / 2)
+        self.tpm = max(self.max_tpm * self.min_fraction, self.tpm / 2)
+        self._requests = min(self._requests, self.rpm)
+        self._tokens = min(self._tokens, self.tpm)
+
+
+def _retry_after(error):
+    """Seconds requested by the server's Retry-After header, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+async def call_with_backoff(create, request, limiter, max_retries=6, base_delay=1.0, max_delay=60.0):
+    """
+    Issues `create(**request)` through the limiter, retrying 429s, timeouts,
+    connection errors and 5xx with exponential backoff and full jitter.
+    """
+    tokens = estimate_tokens(request)
+    for attempt in range(max_retries + 1):
+        await limiter.acquire(tokens)
+        try:
+            response = await create(**request)
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            if isinstance(e, openai.RateLimitError):
+                limiter.on_rate_limited()
+            count("llm.retry", model=request["model"], error=type(e).__name__)
+            delay = _retry_after(e)
+            if delay is None:
+                delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            print(f"⚠️ {type(e).__name__} on {request['model']}, retrying in {delay:.1f}s "
+                  f"(attempt {attempt + 1}/{max_retries})")
+            await asyncio.sleep(delay)
+            continue
+        limiter.on_success()
+        return response
+
+
+class CachedCaller:
+    """
+    Async counterpart of llm_cache.cached_create(). Cache hits skip the
+    limiter, and identical requests issued while one is in flight (e.g.
+    near-duplicate images sharing a caption) wait for that single call.
+    """
+
+    def __init__(self, cache, limiter):
+        self.cache = cache
+        self.limiter = limiter
+        self._inflight = {}
+
+    async def call(self, endpoint, create, request, extract):
+        key = make_key(endpoint, request)
+        pending = self._inflight.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._fetch(endpoint, create, request, extract))
+            self._inflight[key] = pending
+            pending.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(pending)
+
+    async def _fetch(self, endpoint, create, request, extract):
+        if self.cache is not None:
+            text = self.cache.get(endpoint, request)
+            if text is not None:
+                return text
+        response = await call_with_backoff(create, request, self.limiter)
+        record_usage(response, request.get("model"), endpoint=endpoint)
+        text = extract(response)
+        if self.cache is not None:
+            self.cache.put(endpoint, request, text)
+        return text
+
+
+# ---------------------------
+# Per-entry Annotation
+# ---------------------------
+async def _summarize(client, task, text, caller):
+    try:
+        with span("gallery.summary"):
+            summary_text = await caller.call("responses", client.responses.create,
+                                             task_summary_request(task, text), response_text)
+
+        with span("gallery.sentiment"):
+            sentiment = await caller.call("responses", client.responses.create,
+                                          sentiment_request(summary_text), response_text)
+    except Exception as e:
+        print(f"Error generating summary/sentiment for {task['image_path']}: {e}")
+        summary_text = FAILED_SUMMARY
+        sentiment = FAILED_SENTIMENT
+    return summary_text, sentiment
+
+
+async def _caption(client, task, caller):
+    try:
+        with span("gallery.base64"):
+            data_url = await asyncio.to_thread(upload_data_url, task)
+        with span("gallery.caption"):
+            caption_text = await caller.call("chat.completions", client.chat.completions.create,
+                                             caption_request(data_url), chat_text)
+        tags = parse_tags(caption_text, task["image_path"])
+    except Exception as e:
+        print(f"Error generating caption/tags for {task['image_path']}: {e}")
+        caption_text = FAILED_CAPTION
+        tags = []
+    return caption_text, tags
+
+
+async def _annotate_structured(client, task, text, caller):
+    try:
+        with span("gallery.base64"):
+            request = await asyncio.to_thread(task_structured_request, task, text)
+        with span("gallery.structured"):
+            content = await caller.call("chat.completions", client.chat.completions.create, request,
+                                        lambda response: structured_text(chat_text(response)))
+    except Exception as e:
+        print(f"Error generating structured annotation for {task['image_path']}: {e}")
+        return failed_entry(task)
+    return entry_from_structured(task, content)
+
+
+async def annotate_task(client, task, caller, semaphore, position, total, on_entry=None, structured=False):
+    async with semaphore:
+        start_time = time.time()
+        with span("gallery.read_text"):
+            text = await asyncio.to_thread(read_text, task)
+        if structured:
+            entry = await _annotate_structured(client, task, text, caller)
+        else:
+            # Summary -> sentiment is a chain; the caption call is independent of it
+            (summary_text, sentiment), (caption_text, tags) = await asyncio.gather(
+                _summarize(client, task, text, caller),
+                _caption(client, task, caller),
+            )
+            entry = build_entry(task, summary_text, sentiment, caption_text, tags)
+        if on_entry is not None:
+            on_entry(task, entry)
+        record_span("gallery.entry", time.time() - start_time)
+        duration = round(time.time() - start_time, 2)
+        print(f"Finished entry {position}/{total} (idx {task['idx']}) in {duration} seconds")
+        return entry
+
+
+async def annotate_all(tasks, concurrency=8, rpm=500, tpm=200_000, api_key=None, base_url=None, cache=None,
+                       on_entry=None, structured=False):
+    """
+    Annotates every task concurrently and returns the entries in task order.
+    `on_entry(task, entry)` is called as each entry finishes, in completion order.
+    `structured` gets each entry from a single JSON-schema call.
+    `base_url` may point at a local stub server exposing /responses and
+    /chat/completions.
+    """
+    # Retries are handled by call_with_backoff so they pass through the limiter
+    client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+    caller = CachedCaller(cache, AdaptiveRateLimiter(rpm, tpm))
+    semaphore = asyncio.Semaphore(concurrency)
+    try:
+        return await asyncio.gather(*(
+            annotate_task(client, task, caller, semaphore, i + 1, len(tasks), on_entry, structured)
+            for i, task in enumerate(tasks)
+        ))
+    finally:
+        await client.close()
+
+
+def run_async(tasks, **kwargs):
+    return asyncio.run(annotate_all(tasks, **kwargs))
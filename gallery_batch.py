@@ -0,0 +1,134 @@
+# Batch API mode for the gallery generator
+
+from gallery_annotation import (
+    task_summary_request, sentiment_request, caption_request, upload_data_url,
+    parse_tags, build_entry, failed_entry,
+    task_structured_request, structured_text, entry_from_structured,
+    read_text, FAILED_SUMMARY, FAILED_SENTIMENT, FAILED_CAPTION,
+)
+from llm_cache import make_key
+from batch_api import (
+    run_batches, batch_line, body_response_text, body_chat_text,
+    RESPONSES_URL, CHAT_URL, BATCH_DIR,
+)
+
+
+def _custom_id(task, stage):
+    return f"idx-{task['idx']}-{stage}"
+
+
+def _collect(tasks, stage, endpoint, url, make_request, cache):
+    """
+    Resolves one stage for every task: cache hits are filled in directly,
+    the rest become batch request lines. Identical requests (e.g. captions
+    of near-duplicate images) are sent once. Returns (texts, lines, pending),
+    where pending maps each sent custom_id to (request, custom_ids sharing it).
+    """
+    texts, lines, pending, by_key = {}, [], {}, {}
+    for task in tasks:
+        request = make_request(task)
+        if request is None:
+            continue
+        custom_id = _custom_id(task, stage)
+        cached = cache.get(endpoint, request) if cache is not None else None
+        if cached is not None:
+            texts[custom_id] = cached
+            continue
+        key = make_key(endpoint, request)
+        if key in by_key:
+            pending[by_key[key]][1].append(custom_id)
+            continue
+        by_key[key] = custom_id
+        lines.append(batch_line(custom_id, url, request))
+        pending[custom_id] = (request, [custom_id])
+    return texts, lines, pending
+
+
+def _merge(texts, pending, results, cache, endpoint, extract):
+    for custom_id, (request, sharing) in pending.items():
+        body = results.get(custom_id)
+        if body is None:
+            continue
+        try:
+            text = extract(body)
+        except (KeyError, IndexError, TypeError, AttributeError, ValueError) as e:
+            print(f"⚠️ Unexpected batch body for {custom_id}: {e}")
+            continue
+        for shared_id in sharing:
+            texts[shared_id] = text
+        if cache is not None:
+            cache.put(endpoint, request, text)
+
+
+def run_structured_batch(tasks, backend, cache=None, workdir=BATCH_DIR, poll_interval=30):
+    """Structured mode: one JSON-schema request per task, in a single batch."""
+    answers, lines, pending = _collect(
+        tasks, "annotation", "chat.completions", CHAT_URL,
+        lambda task: task_structured_request(task, read_text(task)), cache)
+    results = run_batches(backend, {"gallery_annotation": (CHAT_URL, lines)},
+                          workdir=workdir, poll_interval=poll_interval)
+    _merge(answers, pending, results, cache, "chat.completions",
+           lambda body: structured_text(body_chat_text(body)))
+
+    entries = []
+    for task in tasks:
+        content = answers.get(_custom_id(task, "annotation"))
+        if content is None:
+            print(f"Error generating structured annotation for {task['image_path']}: missing batch result")
+            entries.append(failed_entry(task))
+        else:
+            entries.append(entry_from_structured(task, content))
+    return entries
+
+
+def run_batch(tasks, backend, cache=None, workdir=BATCH_DIR, poll_interval=30):
+    """
+    Annotates every task through the Batch API in two rounds: summaries and
+    captions first, then sentiment over the finished summaries. Returns the
+    entries in task order.
+    """
+    # --- Round 1: summaries and captions ---
+    summaries, summary_lines, summary_pending = _collect(
+        tasks, "summary", "responses", RESPONSES_URL,
+        lambda task: task_summary_request(task, read_text(task)), cache)
+    captions, caption_lines, caption_pending = _collect(
+        tasks, "caption", "chat.completions", CHAT_URL,
+        lambda task: caption_request(upload_data_url(task)), cache)
+
+    results = run_batches(backend, {
+        "gallery_summary": (RESPONSES_URL, summary_lines),
+        "gallery_caption": (CHAT_URL, caption_lines),
+    }, workdir=workdir, poll_interval=poll_interval)
+    _merge(summaries, summary_pending, results, cache, "responses", body_response_text)
+    _merge(captions, caption_pending, results, cache, "chat.completions", body_chat_text)
+
+    # --- Round 2: sentiment of each generated summary ---
+    def make_sentiment(task):
+        summary_text = summaries.get(_custom_id(task, "summary"))
+        return sentiment_request(summary_text) if summary_text is not None else None
+
+    sentiments, sentiment_lines, sentiment_pending = _collect(
+        tasks, "sentiment", "responses", RESPONSES_URL, make_sentiment, cache)
+    results = run_batches(backend, {
+        "gallery_sentiment": (RESPONSES_URL, sentiment_lines),
+    }, workdir=workdir, poll_interval=poll_interval)
+    _merge(sentiments, sentiment_pending, results, cache, "responses", body_response_text)
+
+    # --- Merge into gallery entries ---
+    entries = []
+    for task in tasks:
+        summary_text = summaries.get(_custom_id(task, "summary"))
+        sentiment = sentiments.get(_custom_id(task, "sentiment"))
+        if summary_text is None or sentiment is None:
+            print(f"Error generating summary/sentiment for {task['image_path']}: missing batch result")
+            summary_text, sentiment = FAILED_SUMMARY, FAILED_SENTIMENT
+
+        caption_text = captions.get(_custom_id(task, "caption"))
+        if caption_text is None:
+            print(f"Error generating caption/tags for {task['image_path']}: missing batch result")
+            caption_text, tags = FAILED_CAPTION, []
+        else:
+            tags = parse_tags(caption_text, task["image_path"])
+
+        entries.append(build_entry(task, summary_text, sentiment, caption_text, tags))
+    return entries
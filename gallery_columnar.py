@@ -0,0 +1,193 @@
+# Columnar (Parquet / Arrow IPC) export of the gallery data, and a load benchmark against the JSON path
+
+import os
+import json
+import time
+import string
+import resource
+import argparse
+import tempfile
+import multiprocessing
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from gallery_annotation import SENTIMENTS
+
+INPUT_JSON = "gallery_data_augmented.json"
+PARQUET_PATH = "gallery_data.parquet"
+ARROW_PATH = "gallery_data.arrow"
+STATS_COLUMNS = ["sentiment", "lossLevel", "resilienceLevel"]
+SENTIMENT_DTYPE = pd.CategoricalDtype(SENTIMENTS)
+
+
+def sentiment_labels(texts):
+    """Label inside **...** of each free-text sentiment, punctuation stripped and capitalized."""
+    return (
+        pd.Series(texts, dtype="object")
+        .str.extract(r"\*\*(.*?)\*\*")[0]
+        .str.strip()
+        .str.strip(string.punctuation)
+        .str.capitalize()
+    )
+
+
+def to_frame(entries):
+    """Typed gallery columns: categorical sentiment, int8 levels, list-of-string tags."""
+    df = pd.DataFrame(entries)
+    for column in ("lossLevel", "resilienceLevel", "tags", "discrepancy_score"):
+        if column not in df.columns:
+            df[column] = None
+    df["sentiment_text"] = df["sentiment"]
+    df["sentiment"] = sentiment_labels(df["sentiment"]).astype(SENTIMENT_DTYPE)
+    df["date"] = pd.to_datetime(df["date"], errors="coerce").dt.date
+    for column in ("lossLevel", "resilienceLevel"):
+        df[column] = pd.to_numeric(df[column], errors="coerce").astype("Int8")
+    df["tags"] = [list(tags) if isinstance(tags, list) else [] for tags in df["tags"]]
+    return df
+
+
+def arrow_table(df):
+    import pyarrow as pa
+
+    schema = pa.schema([
+        ("image_file", pa.string()), ("title", pa.string()), ("url", pa.string()), ("date", pa.date32()),
+        ("latitude", pa.float64()), ("longitude", pa.float64()), ("summary", pa.string()),
+        ("sentiment", pa.dictionary(pa.int8(), pa.string())), ("sentiment_text", pa.string()),
+        ("caption", pa.string()), ("tags", pa.list_(pa.string())), ("discrepancy_score", pa.float32()),
+        ("lossLevel", pa.int8()), ("resilienceLevel", pa.int8()),
+    ])
+    return pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+
+
+def write_columnar(entries, parquet_path=PARQUET_PATH, arrow_path=ARROW_PATH):
+    """
+    Writes the entries as Parquet (compressed, for storage and column
+    pruning) and/or an uncompressed Arrow IPC file (memory-mappable).
+    Returns the paths written.
+    """
+    import pyarrow.parquet as pq
+    import pyarrow.ipc as ipc
+
+    table = arrow_table(to_frame(entries))
+    written = []
+    if parquet_path:
+        pq.write_table(table, f"{parquet_path}.tmp")
+        os.replace(f"{parquet_path}.tmp", parquet_path)
+        written.append(parquet_path)
+    if arrow_path:
+        with ipc.new_file(f"{arrow_path}.tmp", table.schema) as writer:
+            writer.write_table(table)
+        os.replace(f"{arrow_path}.tmp", arrow_path)
+        written.append(arrow_path)
+    return written
+
+
+def read_columns(path, columns=None):
+    """
+    DataFrame of just `columns` from a .parquet or .arrow file. Both are
+    memory-mapped, so columns that are not asked for are never read.
+    """
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+
+    if path.endswith(".parquet"):
+        table = pq.read_table(path, columns=columns, memory_map=True)
+    else:
+        table = ipc.open_file(pa.memory_map(path, "r")).read_all()
+        if columns is not None:
+            table = table.select(columns)
+    df = table.to_pandas()
+    if "sentiment" in df.columns:
+        df["sentiment"] = df["sentiment"].astype(SENTIMENT_DTYPE)
+    return df
+
+
+# ---------------------------
+# Benchmark
+# ---------------------------
+def _synthetic(entries, n):
+    """`n` records cycled from the real entries, with unique image_file values."""
+    return [dict(entries[i % len(entries)], image_file=f"images/bench_{i}.jpg") for i in range(n)]
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process. VmHWM is read where available:
+    on Linux ru_maxrss survives exec(), so a spawned worker would report its
+    parent's peak.
+    """
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _load_stats_columns(kind, path):
+    """Benchmark worker: loads the stats columns the given way. Returns (seconds, peak RSS in MB)."""
+    start = time.perf_counter()
+    if kind == "json":
+        # The stats script's JSON path: full parse, normalize, regex the sentiment
+        with open(path, "r") as f:
+            df = pd.json_normalize(json.load(f))
+        columns = (sentiment_labels(df["sentiment"]), df["lossLevel"].dropna().astype(int),
+                   df["resilienceLevel"].dropna().astype(int))
+    elif kind != "baseline":
+        columns = read_columns(path, STATS_COLUMNS)
+    elapsed = time.perf_counter() - start
+    return elapsed, peak_rss_mb()
+
+
+def _measure(kind, path):
+    # A fresh interpreter per measurement, so peak RSS is not inherited from earlier loads
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_load_stats_columns, kind, path).result()
+
+
+def benchmark(entries, sizes=(1_000, 10_000, 100_000), workdir=None):
+    """Load time and peak RSS of the stats columns from JSON, Parquet and Arrow as the corpus grows."""
+    _, baseline_rss = _measure("baseline", None)
+    print(f"📊 Loading {', '.join(STATS_COLUMNS)} (interpreter + pandas baseline {baseline_rss:.0f} MB RSS)")
+    print(f"   {'records':>8} {'format':<8} {'file MB':>8} {'load s':>8} {'peak RSS MB':>12}")
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for n in sizes:
+            records = _synthetic(entries, n)
+            paths = {"json": os.path.join(tmp, f"gallery_{n}.json"),
+                     "parquet": os.path.join(tmp, f"gallery_{n}.parquet"),
+                     "arrow": os.path.join(tmp, f"gallery_{n}.arrow")}
+            with open(paths["json"], "w", encoding="utf-8") as f:
+                json.dump(records, f, ensure_ascii=False, indent=2)
+            write_columnar(records, paths["parquet"], paths["arrow"])
+            del records
+            for kind, path in paths.items():
+                elapsed, rss = _measure(kind, path)
+                size_mb = os.path.getsize(path) / 1e6
+                print(f"   {n:>8,} {kind:<8} {size_mb:>8.1f} {elapsed:>8.3f} {rss:>12.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export gallery data to Parquet/Arrow, or benchmark loading it")
+    parser.add_argument("command", choices=("export", "benchmark"))
+    parser.add_argument("--input", default=INPUT_JSON)
+    parser.add_argument("--parquet", default=PARQUET_PATH)
+    parser.add_argument("--arrow", default=ARROW_PATH)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000],
+                        help="corpus sizes for the benchmark")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+
+    if args.command == "export":
+        for path in write_columnar(entries, args.parquet, args.arrow):
+            print(f"📁 Wrote {path} ({len(entries)} records)")
+    else:
+        benchmark(entries, args.sizes)
+
+
+if __name__ == "__main__":
+    main()
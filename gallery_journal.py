@@ -0,0 +1,107 @@
+# Append-only JSONL checkpoint journal for resumable gallery generation
+
+import os
+import json
+import hashlib
+
+from gallery_annotation import prompt_fingerprint, is_complete
+
+DEFAULT_JOURNAL = "gallery_data.journal.jsonl"
+
+
+def input_hash(task, structured=False, upload=None):
+    """
+    Fingerprint of everything an entry is generated from: record metadata,
+    article text, image bytes, the image actually captioned (its near-duplicate
+    group's representative) with the `upload` preprocess settings, and the
+    prompts/models in use.
+    """
+    digest = hashlib.sha256()
+    meta = {k: task[k] for k in ("idx", "title", "url", "date", "latitude", "longitude")}
+    digest.update(json.dumps(meta, sort_keys=True, default=str).encode("utf-8"))
+    digest.update(prompt_fingerprint(structured).encode("utf-8"))
+    for path in (task["text_path"], task["image_path"]):
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    caption_source = task.get("caption_source", task["image_path"])
+    digest.update(json.dumps([caption_source, upload], sort_keys=True).encode("utf-8"))
+    if caption_source != task["image_path"]:
+        with open(caption_source, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    # Copies summarized from their cluster lead's article
+    if task.get("summary_text_path"):
+        digest.update(task["summary_title"].encode("utf-8"))
+        with open(task["summary_text_path"], "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+class GalleryJournal:
+    """
+    One JSON line per finished entry, flushed and fsynced as it is written,
+    so a crash loses at most the entries still in flight. Later lines for
+    the same idx supersede earlier ones.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL):
+        self.path = path
+        self._file = None
+
+    def load(self):
+        """Returns {idx: latest journal record}. A torn final line is ignored."""
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, "r", encoding="utf-8") as f:
+            for raw in f:
+                try:
+                    record = json.loads(raw)
+                except json.JSONDecodeError:
+                    print(f"⚠️ Ignoring incomplete journal line in {self.path}")
+                    continue
+                records[record["idx"]] = record
+        return records
+
+    def open(self, resume):
+        self._file = open(self.path, "a" if resume else "w", encoding="utf-8")
+
+    def append(self, task, entry):
+        record = {
+            "idx": task["idx"],
+            "input_hash": task["input_hash"],
+            "complete": is_complete(entry),
+            "entry": entry,
+        }
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def compact(self, tasks):
+        """
+        Returns the journaled entries for `tasks` in task order and rewrites
+        the journal with only those latest records.
+        """
+        records = self.load()
+        kept = [records[task["idx"]] for task in tasks if task["idx"] in records]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in kept:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+        return [record["entry"] for record in kept]
+
+
+def pending_tasks(tasks, records):
+    """Tasks without a complete journal record for their current input hash."""
+    todo = []
+    for task in tasks:
+        record = records.get(task["idx"])
+        if record and record["complete"] and record["input_hash"] == task["input_hash"]:
+            continue
+        todo.append(task)
+    return todo
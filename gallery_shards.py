@@ -0,0 +1,148 @@
+# Date-sorted, fixed-size gallery shards with a manifest and a prebuilt search index for index.html
+
+import os
+import re
+import json
+import shutil
+import string
+import argparse
+from collections import Counter, defaultdict
+
+from gallery_stream import iter_records
+
+SHARD_DIR = "gallery_shards"
+DEFAULT_SHARD_SIZE = 100
+INDEXED_FIELDS = ("title", "summary", "caption", "tags")
+FACETS = ("sentiment", "lossLevel", "resilienceLevel")
+
+TOKEN = re.compile(r"[a-z0-9]+")
+SENTIMENT_LABEL = re.compile(r"\*\*(.*?)\*\*")
+STOPWORDS = frozenset("""
+a an and are as at be been by for from has have in is it its of on or that the their this to was were which
+with image images news summary caption relevant tags
+""".split())
+
+
+def tokens(text):
+    """Lowercase alphanumeric terms of at least two characters, stopwords removed."""
+    return [t for t in TOKEN.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def entry_terms(entry):
+    parts = [entry.get(field) or "" for field in INDEXED_FIELDS[:-1]]
+    parts.extend(entry.get("tags") or [])
+    return set(tokens(" ".join(parts)))
+
+
+def sentiment_label(text):
+    """Label inside **...** of a free-text sentiment, cleaned like the stats script."""
+    match = SENTIMENT_LABEL.search(text or "")
+    return match.group(1).strip().strip(string.punctuation).capitalize() if match else None
+
+
+def facet_values(entry):
+    loss, resilience = entry.get("lossLevel"), entry.get("resilienceLevel")
+    return (sentiment_label(entry.get("sentiment")),
+            loss if loss in (1, 2, 3) else None,
+            resilience if resilience in (1, 2, 3) else None)
+
+
+def _write_json(path, data, indent=None):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent, separators=None if indent else (",", ":"))
+
+
+def export_shards(entries, out_dir=SHARD_DIR, shard_size=DEFAULT_SHARD_SIZE, levels=None):
+    """
+    Writes `entries`, sorted by date (stable, so same-day entries keep their
+    order), into `out_dir`:
+      shard_NNNN.json    `shard_size` full entries each
+      manifest.json      totals and the count and date range of each shard
+      search_index.json  term -> ids postings over title, summary, caption and
+                         tags, the tokenizer's stopwords, per-entry facet values
+                         and overall facet counts
+    An entry's id is its position in date order: shard id // shard_size,
+    offset id % shard_size. `levels` ({image_file: (loss, resilience)})
+    fills in levels missing from the entries. The directory is built beside
+    the old one and swapped in. Returns the manifest.
+    """
+    entries = sorted(entries, key=lambda e: e.get("date") or "")
+    if levels:
+        entries = [dict(entry, **dict(zip(("lossLevel", "resilienceLevel"), levels[entry["image_file"]])))
+                   if entry.get("lossLevel") is None and entry["image_file"] in levels else entry
+                   for entry in entries]
+
+    tmp_dir = f"{out_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    shards = []
+    for start in range(0, len(entries), shard_size):
+        shard = entries[start:start + shard_size]
+        name = f"shard_{len(shards):04d}.json"
+        _write_json(os.path.join(tmp_dir, name), shard)
+        shards.append({"file": name, "count": len(shard),
+                       "first_date": shard[0].get("date"), "last_date": shard[-1].get("date")})
+
+    postings = defaultdict(list)
+    docs, counts = [], {facet: Counter() for facet in FACETS}
+    for doc_id, entry in enumerate(entries):
+        for term in entry_terms(entry):
+            postings[term].append(doc_id)
+        values = facet_values(entry)
+        docs.append(values)
+        for facet, value in zip(FACETS, values):
+            if value is not None:
+                counts[facet][str(value)] += 1
+
+    search_index = {
+        "fields": list(INDEXED_FIELDS),
+        "facets": list(FACETS),
+        "stopwords": sorted(STOPWORDS),
+        "terms": dict(sorted(postings.items())),
+        "docs": docs,
+        "counts": {facet: dict(sorted(counter.items())) for facet, counter in counts.items()},
+    }
+    _write_json(os.path.join(tmp_dir, "search_index.json"), search_index)
+
+    manifest = {"total": len(entries), "shard_size": shard_size, "shards": shards,
+                "search_index": "search_index.json", "counts": search_index["counts"]}
+    _write_json(os.path.join(tmp_dir, "manifest.json"), manifest, indent=1)
+
+    old_dir = f"{out_dir}.old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.rename(out_dir, old_dir)
+    os.rename(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return manifest
+
+
+def load_levels(path):
+    """{image_file: (loss, resilience)} from a classified gallery file, or {} if there is none."""
+    if not os.path.exists(path):
+        return {}
+    return {e["image_file"]: (e.get("lossLevel"), e.get("resilienceLevel")) for e in iter_records(path)
+            if e.get("lossLevel") is not None}
+
+
+def add_shard_arguments(parser):
+    parser.add_argument("--shard-dir", default=SHARD_DIR, help="where the gallery shards and search index go")
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE, help="entries per gallery shard")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export date-sorted gallery shards and their search index")
+    parser.add_argument("--input", default="gallery_data_augmented.json",
+                        help="gallery .json/.jsonl (the classified file adds level facets)")
+    add_shard_arguments(parser)
+    args = parser.parse_args()
+
+    manifest = export_shards(iter_records(args.input), args.shard_dir, args.shard_size)
+    size = os.path.getsize(os.path.join(args.shard_dir, "search_index.json")) / 1024
+    print(f"📁 {manifest['total']} entries in {len(manifest['shards'])} shards of {args.shard_size}; "
+          f"search index {size:.0f} KB -> {args.shard_dir}/")
+
+
+if __name__ == "__main__":
+    main()
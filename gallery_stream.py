@@ -0,0 +1,202 @@
+# Streaming reader/writer for gallery record files (JSON arrays or JSONL), with optional orjson
+
+import os
+import json
+import math
+import argparse
+from itertools import islice
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CHUNK_CHARS = 1 << 16
+_WHITESPACE = " \t\r\n"
+
+
+def _loads(line):
+    if orjson is not None:
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            # NaN/Infinity, which json writes and orjson does not read
+            pass
+    return json.loads(line)
+
+
+def _is_jsonl(path):
+    return path.endswith((".jsonl", ".ndjson"))
+
+
+def _iter_array(f, path):
+    """Decodes the elements of a top-level JSON array one at a time from a text stream."""
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = f.read(CHUNK_CHARS)
+        eof = not chunk
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def skip(chars):
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in chars:
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill()
+
+    skip(_WHITESPACE)
+    if buf[pos:pos + 1] != "[":
+        raise ValueError(f"{path}: expected a JSON array")
+    pos += 1
+    skip(_WHITESPACE)
+    if buf[pos:pos + 1] == "]":
+        return
+    while True:
+        try:
+            record, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # The element runs past the buffered text
+            if eof:
+                raise
+            fill()
+            continue
+        pos = end
+        yield record
+        skip(_WHITESPACE)
+        if buf[pos:pos + 1] == "]":
+            return
+        if buf[pos:pos + 1] != ",":
+            raise ValueError(f"{path}: expected ',' or ']' at offset {pos}")
+        pos += 1
+        skip(_WHITESPACE)
+
+
+def iter_records(path):
+    """
+    Yields the records of a gallery file lazily: one line at a time for
+    .jsonl, one array element at a time for .json. Memory stays at about
+    one record plus a read buffer, whatever the file size.
+    """
+    if _is_jsonl(path):
+        with open(path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield _loads(line)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            yield from _iter_array(f, path)
+
+
+def iter_chunks(records, size):
+    """Lists of up to `size` consecutive records."""
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _all_finite(value):
+    """False when a float anywhere in `value` is NaN or infinite."""
+    if isinstance(value, float):
+        return math.isfinite(value)
+    if isinstance(value, dict):
+        return all(_all_finite(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return all(_all_finite(v) for v in value)
+    return True
+
+
+class RecordWriter:
+    """
+    Writes records incrementally. For .json the output is a JSON array laid
+    out exactly like json.dump(records, f, indent=indent); for .jsonl one
+    compact record per line. The file is written to a temporary path and
+    moved into place on close, so readers never see a partial array.
+    `append=True` (JSONL only) adds to an existing file in place.
+    orjson serializes when it is installed, except for records holding NaN
+    or infinite floats (pandas leaves NaN latitude/longitude): orjson writes
+    those as null where json writes NaN, so they go through json.
+    """
+
+    def __init__(self, path, indent=2, ensure_ascii=False, append=False):
+        self.path = path
+        self.jsonl = _is_jsonl(path)
+        if append and not self.jsonl:
+            raise ValueError("append is only supported for .jsonl files")
+        self.indent = None if self.jsonl else indent
+        self.ensure_ascii = ensure_ascii
+        self.count = 0
+        self._target = path if append else f"{path}.tmp"
+        self._f = open(self._target, "ab" if append else "wb")
+        self._fast = orjson is not None and not ensure_ascii and (self.jsonl or self.indent == 2)
+        self.backend = "orjson" if self._fast else "json"
+
+    def _dumps(self, record):
+        if self._fast and _all_finite(record):
+            return orjson.dumps(record, option=orjson.OPT_INDENT_2 if self.indent is not None else 0)
+        if self.jsonl:
+            return json.dumps(record, ensure_ascii=self.ensure_ascii, separators=(",", ":")).encode("utf-8")
+        return json.dumps(record, indent=self.indent, ensure_ascii=self.ensure_ascii).encode("utf-8")
+
+    def write(self, record):
+        data = self._dumps(record)
+        if self.jsonl:
+            self._f.write(data + b"\n")
+        else:
+            pad = b" " * (self.indent or 0)
+            nl = b"\n" if self.indent is not None else b""
+            sep = b"[" if self.count == 0 else (b"," if self.indent is not None else b", ")
+            self._f.write(sep + nl + pad + data.replace(b"\n", b"\n" + pad))
+        self.count += 1
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def close(self):
+        if self._f.closed:
+            return
+        if not self.jsonl:
+            self._f.write(b"[]" if self.count == 0 else (b"\n]" if self.indent is not None else b"]"))
+        self._f.close()
+        if self._target != self.path:
+            os.replace(self._target, self.path)
+
+    def abort(self):
+        """Closes without replacing the destination."""
+        self._f.close()
+        if self._target != self.path:
+            os.remove(self._target)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert gallery files between JSON and JSONL, record by record")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--indent", type=int, default=2, help="indent of .json output")
+    args = parser.parse_args()
+
+    with RecordWriter(args.output, indent=args.indent) as writer:
+        writer.write_many(iter_records(args.input))
+    print(f"✅ Wrote {writer.count} records to {args.output} ({writer.backend})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# Persistent geocoding cache with an offline gazetteer for Myanmar/Thailand place names
+
+import re
+import time
+import sqlite3
+import threading
+
+from instrumentation import count
+
+DEFAULT_GEOCODE_CACHE = "geocode_cache.sqlite"
+
+# Coordinates for names that dominate entry_record.csv. Countries and the
+# cities already in the corpus use the points Nominatim returned for them,
+# so map markers do not move when the lookup goes offline.
+GAZETTEER = {
+    # Countries / regions
+    "myanmar": (17.1750495, 95.9999652),
+    "thailand": (14.8971921, 100.83273),
+    # Myanmar
+    "mandalay": (21.9596834, 96.0948743),
+    "yangon": (16.7967129, 96.1609916),
+    "naypyidaw": (19.7753291, 96.1032549),
+    "sagaing": (21.8787, 95.9797),
+    "amarapura": (21.9000, 96.0500),
+    "pyin oo lwin": (22.0339, 96.4569),
+    "kyaukse": (21.6056, 96.1351),
+    "meiktila": (20.8778, 95.8584),
+    "pyinmana": (19.7381, 96.2074),
+    "taunggyi": (20.7892, 97.0378),
+    "bago": (17.3352, 96.4814),
+    "mawlamyine": (16.4905, 97.6283),
+    "monywa": (22.1086, 95.1358),
+    "myitkyina": (25.3832, 97.3964),
+    "lashio": (22.9333, 97.7500),
+    "bagan": (21.1717, 94.8585),
+    "sittwe": (20.1462, 92.8983),
+    "tachileik": (20.4475, 99.8808),
+    # Thailand
+    "bangkok": (13.7524938, 100.4935089),
+    "chatuchak": (13.8286, 100.5597),
+    "nonthaburi": (13.8621, 100.5144),
+    "pathum thani": (14.0208, 100.5250),
+    "ayutthaya": (14.3532, 100.5689),
+    "chiang mai": (18.7883, 98.9853),
+    "chiang rai": (19.9105, 99.8406),
+    "mae sot": (16.7131, 98.5747),
+    "pattaya": (12.9236, 100.8825),
+    "phuket": (7.8804, 98.3923),
+}
+
+ALIASES = {
+    "burma": "myanmar",
+    "republic of the union of myanmar": "myanmar",
+    "rangoon": "yangon",
+    "nay pyi taw": "naypyidaw",
+    "naypyitaw": "naypyidaw",
+    "nay pyi daw": "naypyidaw",
+    "maymyo": "pyin oo lwin",
+    "moulmein": "mawlamyine",
+    "pegu": "bago",
+    "krung thep": "bangkok",
+    "chiangmai": "chiang mai",
+}
+
+
+def normalize_place(name):
+    name = re.sub(r"[^\w\s-]", " ", name.casefold())
+    name = re.sub(r"^the\s+", "", name.strip())
+    return re.sub(r"\s+", " ", name).strip()
+
+
+def lookup_gazetteer(name):
+    key = normalize_place(name)
+    return GAZETTEER.get(ALIASES.get(key, key))
+
+
+class GeocodeCache:
+    """
+    SQLite cache of geocoding answers keyed by normalized place name.
+    Misses from the geocoder ("no such place") are cached too, with their
+    own, shorter expiry.
+    """
+
+    def __init__(self, path=DEFAULT_GEOCODE_CACHE, ttl_days=180, negative_ttl_days=14):
+        self.path = path
+        self.ttl = ttl_days * 86400
+        self.negative_ttl = negative_ttl_days * 86400
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS geocodes (
+                name TEXT PRIMARY KEY,
+                latitude REAL,
+                longitude REAL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, name):
+        """Returns (lat, lon), (None, None) for a cached miss, or None when unknown/expired."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT latitude, longitude, created_at FROM geocodes WHERE name = ?",
+                (normalize_place(name),)).fetchone()
+        if row is None:
+            return None
+        lat, lon, created_at = row
+        ttl = self.ttl if lat is not None else self.negative_ttl
+        if time.time() - created_at > ttl:
+            return None
+        return (lat, lon)
+
+    def put(self, name, coords):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocodes (name, latitude, longitude, created_at) VALUES (?, ?, ?, ?)",
+                (normalize_place(name), coords[0], coords[1], time.time()))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedGeocoder:
+    """
+    Resolves a place name via the gazetteer, then the cache, then
+    `lookup(name)`, which may raise on network errors (those are not cached).
+    `limiter` is only waited on before a real network lookup.
+    """
+
+    def __init__(self, lookup, cache=None, use_gazetteer=True, limiter=None):
+        self.lookup = lookup
+        self.cache = cache
+        self.use_gazetteer = use_gazetteer
+        self.limiter = limiter
+        self.gazetteer_hits = 0
+        self.cache_hits = 0
+        self.network_calls = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def _count(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+        count(f"geocode.{field}")
+
+    def __call__(self, name):
+        if self.use_gazetteer:
+            coords = lookup_gazetteer(name)
+            if coords is not None:
+                self._count("gazetteer_hits")
+                return coords
+        if self.cache is not None:
+            coords = self.cache.get(name)
+            if coords is not None:
+                self._count("cache_hits")
+                return coords
+
+        if self.limiter is not None:
+            self.limiter.wait()
+        self._count("network_calls")
+        try:
+            coords = self.lookup(name)
+        except Exception as e:
+            print("Geocoding error:", e)
+            self._count("failures")
+            return (None, None)
+        if self.cache is not None:
+            self.cache.put(name, coords)
+        return coords
+
+    def report(self):
+        print(f"🗺️ Geocoding: {self.gazetteer_hits} gazetteer hits, {self.cache_hits} cache hits, "
+              f"{self.network_calls} network lookups ({self.failures} failed)")
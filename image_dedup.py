@@ -0,0 +1,195 @@
+# Perceptual-hash index of images/ and near-duplicate grouping by Hamming distance
+
+import os
+import sqlite3
+import argparse
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+
+DEFAULT_INDEX = "image_hashes.sqlite"
+DEFAULT_THRESHOLD = 8
+HASH_BITS = 64
+
+
+def _dct_matrix(n):
+    k = np.arange(n)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT_32 = _dct_matrix(32)
+
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits.flatten():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def phash(img):
+    """64-bit DCT perceptual hash: low-frequency 8x8 block against its median."""
+    pixels = np.asarray(img.convert("L").resize((32, 32), Image.LANCZOS), dtype=np.float64)
+    low = (_DCT_32 @ pixels @ _DCT_32.T)[:8, :8]
+    return _bits_to_int(low > np.median(low.flatten()[1:]))
+
+
+def dhash(img):
+    """64-bit difference hash: sign of horizontal gradients on a 9x8 thumbnail."""
+    pixels = np.asarray(img.convert("L").resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def _hash_file(path):
+    try:
+        with Image.open(path) as img:
+            return path, phash(img), dhash(img)
+    except Exception as e:
+        print(f"⚠️ Could not hash {path}: {e}")
+        return path, None, None
+
+
+class ImageHashIndex:
+    """SQLite store of image hashes, refreshed only for files whose size or mtime changed."""
+
+    def __init__(self, path=DEFAULT_INDEX):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS image_hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                phash TEXT,
+                dhash TEXT
+            )
+        """)
+        self._conn.commit()
+
+    def update(self, paths, workers=None):
+        """Hashes new or changed files in a process pool. Returns {path: (phash, dhash)}."""
+        known = {row[0]: row[1:] for row in self._conn.execute(
+            "SELECT path, size, mtime_ns, phash, dhash FROM image_hashes")}
+        stale = []
+        for path in paths:
+            st = os.stat(path)
+            row = known.get(path)
+            if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+                stale.append(path)
+
+        if stale:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for path, p, d in pool.map(_hash_file, stale, chunksize=16):
+                    st = os.stat(path)
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO image_hashes (path, size, mtime_ns, phash, dhash) VALUES (?, ?, ?, ?, ?)",
+                        (path, st.st_size, st.st_mtime_ns,
+                         f"{p:016x}" if p is not None else None, f"{d:016x}" if d is not None else None))
+            self._conn.commit()
+            print(f"🔎 Hashed {len(stale)} new or changed images ({len(paths) - len(stale)} unchanged)")
+
+        hashes = {}
+        for path, p, d in self._conn.execute("SELECT path, phash, dhash FROM image_hashes"):
+            if p is not None:
+                hashes[path] = (int(p, 16), int(d, 16))
+        return {path: hashes[path] for path in paths if path in hashes}
+
+    def close(self):
+        self._conn.close()
+
+
+def _bands(value, n_bands):
+    """Splits a 64-bit hash into n_bands contiguous bit ranges."""
+    bounds = [i * HASH_BITS // n_bands for i in range(n_bands + 1)]
+    return [(i, (value >> lo) & ((1 << (hi - lo)) - 1)) for i, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:]))]
+
+
+def group_near_duplicates(hashes, threshold=DEFAULT_THRESHOLD):
+    """
+    Groups paths whose pHashes and dHashes are both within `threshold` bits
+    of their group's representative, the first path of the group in input
+    order. Each path joins the earliest representative it is near, so a
+    chain A~B~C does not pull C into A's group unless C is near A itself.
+    Hashes are split into threshold + 1 bands; two pHashes that close must
+    agree exactly on at least one band, so only paths sharing a band bucket
+    are compared. Returns {path: representative}.
+    """
+    paths = list(hashes)
+    order = {path: i for i, path in enumerate(paths)}
+
+    buckets = defaultdict(list)
+    for path in paths:
+        for band in _bands(hashes[path][0], min(threshold + 1, HASH_BITS)):
+            buckets[band].append(path)
+
+    # Earlier paths each path is a near-duplicate of, on both hashes
+    near = defaultdict(set)
+    checked = set()
+    for members in buckets.values():
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                if (a, b) in checked:
+                    continue
+                checked.add((a, b))
+                if hamming(hashes[a][0], hashes[b][0]) <= threshold \
+                        and hamming(hashes[a][1], hashes[b][1]) <= threshold:
+                    near[b].add(a)
+
+    group = {}
+    for path in paths:
+        earlier = sorted(near[path], key=order.get)
+        group[path] = next((other for other in earlier if group[other] == other), path)
+    return group
+
+
+def representatives(image_paths, threshold=DEFAULT_THRESHOLD, index_path=DEFAULT_INDEX, workers=None):
+    """Maps each image path to the representative of its near-duplicate group."""
+    unique = list(dict.fromkeys(image_paths))
+    index = ImageHashIndex(index_path)
+    try:
+        hashes = index.update(unique, workers=workers)
+    finally:
+        index.close()
+    groups = group_near_duplicates(hashes, threshold)
+    # Images that could not be hashed stand alone
+    return {path: groups.get(path, path) for path in unique}
+
+
+def add_dedup_arguments(parser):
+    parser.add_argument("--no-image-dedup", action="store_true",
+                        help="caption every image even when it is a near-duplicate of another")
+    parser.add_argument("--dedup-threshold", type=int, default=DEFAULT_THRESHOLD,
+                        help="maximum pHash and dHash Hamming distance for two images to share a caption")
+    parser.add_argument("--hash-index", default=DEFAULT_INDEX,
+                        help="SQLite file storing perceptual hashes of images/")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Group near-duplicate images in images/ by perceptual hash")
+    parser.add_argument("--images-dir", default="images")
+    parser.add_argument("--threshold", type=int, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--index", default=DEFAULT_INDEX)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    paths = sorted(os.path.join(args.images_dir, name) for name in os.listdir(args.images_dir)
+                   if name.lower().endswith((".jpg", ".jpeg", ".png", ".webp")))
+    mapping = representatives(paths, args.threshold, args.index, args.workers)
+    groups = defaultdict(list)
+    for path, rep in mapping.items():
+        groups[rep].append(path)
+    duplicates = {rep: members for rep, members in groups.items() if len(members) > 1}
+    for rep, members in sorted(duplicates.items()):
+        print(f"{rep}: {', '.join(m for m in members if m != rep)}")
+    print(f"✅ {len(paths)} images in {len(groups)} groups "
+          f"({len(paths) - len(groups)} near-duplicates share a caption)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+# Connection-pooled, concurrent image downloader with conditional GETs and a per-URL manifest
+
+import os
+import re
+import time
+import shutil
+import sqlite3
+import hashlib
+import argparse
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import count
+
+DEFAULT_MANIFEST = "download_manifest.sqlite"
+CHUNK_SIZE = 64 * 1024
+
+
+class DownloadManifest:
+    """SQLite record of every URL fetched: outcome, local file, content hash and validators."""
+
+    def __init__(self, path=DEFAULT_MANIFEST):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS downloads (
+                url TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                file_path TEXT,
+                sha256 TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_downloads_sha256 ON downloads (sha256)")
+        self._conn.commit()
+
+    def get(self, url):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, file_path, sha256, etag, last_modified, attempts FROM downloads WHERE url = ?",
+                (url,)).fetchone()
+        if row is None:
+            return None
+        keys = ("status", "file_path", "sha256", "etag", "last_modified", "attempts")
+        return dict(zip(keys, row))
+
+    def file_with_hash(self, sha256):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT file_path FROM downloads WHERE sha256 = ? AND status = 'ok'", (sha256,)).fetchall()
+        return next((path for (path,) in rows if path and os.path.exists(path)), None)
+
+    def record_success(self, url, file_path, sha256, etag, last_modified):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO downloads (url, status, file_path, sha256, etag, last_modified, attempts, error, updated_at) "
+                "VALUES (?, 'ok', ?, ?, ?, ?, 1, NULL, ?) "
+                "ON CONFLICT(url) DO UPDATE SET status = 'ok', file_path = excluded.file_path, "
+                "sha256 = excluded.sha256, etag = excluded.etag, last_modified = excluded.last_modified, "
+                "attempts = attempts + 1, error = NULL, updated_at = excluded.updated_at",
+                (url, file_path, sha256, etag, last_modified, time.time()))
+            self._conn.commit()
+
+    def record_failure(self, url, file_path, error):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO downloads (url, status, file_path, attempts, error, updated_at) "
+                "VALUES (?, 'failed', ?, 1, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET status = 'failed', file_path = excluded.file_path, "
+                "attempts = attempts + 1, error = excluded.error, updated_at = excluded.updated_at",
+                (url, file_path, error, time.time()))
+            self._conn.commit()
+
+    def failed(self, max_attempts=None):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url, file_path, attempts FROM downloads WHERE status = 'failed'").fetchall()
+        return [(url, path) for url, path, attempts in rows if max_attempts is None or attempts < max_attempts]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ImageDownloader:
+    """
+    Streams images to disk through pooled HTTP connections (one session per
+    worker thread). URLs already fetched are reused from disk, revalidated
+    with If-None-Match / If-Modified-Since when `revalidate` is set, and
+    identical content from different URLs is hard-linked instead of stored twice.
+    """
+
+    def __init__(self, manifest=None, workers=8, timeout=5, chunk_size=CHUNK_SIZE,
+                 revalidate=False, max_attempts=3):
+        self.manifest = manifest if manifest is not None else DownloadManifest()
+        self.workers = workers
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.revalidate = revalidate
+        self.max_attempts = max_attempts
+        self.stats = {"downloaded": 0, "reused": 0, "not_modified": 0, "deduplicated": 0,
+                      "failed": 0, "skipped": 0}
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+        return session
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+        count(f"download.{key}")
+
+    def _reuse(self, source, file_path):
+        if os.path.abspath(source) != os.path.abspath(file_path):
+            shutil.copyfile(source, file_path)
+        return file_path
+
+    def fetch(self, url, file_path):
+        """Downloads `url` to `file_path`. Returns the path, or None on failure."""
+        known = self.manifest.get(url)
+        cached_file = known["file_path"] if known and known["status"] == "ok" else None
+        has_copy = cached_file is not None and os.path.exists(cached_file)
+
+        if has_copy and not self.revalidate:
+            self._count("reused")
+            return self._reuse(cached_file, file_path)
+        if known and known["status"] == "failed" and known["attempts"] >= self.max_attempts:
+            self._count("skipped")
+            return None
+
+        headers = {}
+        if has_copy:
+            if known["etag"]:
+                headers["If-None-Match"] = known["etag"]
+            if known["last_modified"]:
+                headers["If-Modified-Since"] = known["last_modified"]
+
+        tmp_path = f"{file_path}.part"
+        try:
+            with self._session().get(url, stream=True, timeout=self.timeout, headers=headers) as response:
+                if response.status_code == 304 and has_copy:
+                    self._count("not_modified")
+                    return self._reuse(cached_file, file_path)
+                if response.status_code != 200:
+                    raise IOError(f"status code {response.status_code}")
+                digest = hashlib.sha256()
+                with open(tmp_path, "wb") as f:
+                    for chunk in response.iter_content(self.chunk_size):
+                        digest.update(chunk)
+                        f.write(chunk)
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+        except Exception as e:
+            print(f"❗ Image download failed: {e} — Skipping {url}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self.manifest.record_failure(url, file_path, str(e))
+            self._count("failed")
+            return None
+
+        sha256 = digest.hexdigest()
+        duplicate = self.manifest.file_with_hash(sha256)
+        if duplicate and os.path.abspath(duplicate) != os.path.abspath(file_path):
+            os.remove(tmp_path)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            try:
+                os.link(duplicate, file_path)
+            except OSError:
+                shutil.copyfile(duplicate, file_path)
+            self._count("deduplicated")
+        else:
+            os.replace(tmp_path, file_path)
+            self._count("downloaded")
+        self.manifest.record_success(url, file_path, sha256, etag, last_modified)
+        return file_path
+
+    def fetch_many(self, jobs):
+        """Fetches (url, file_path) pairs in parallel. Returns the results in job order."""
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(lambda job: self.fetch(*job), jobs))
+
+    def report(self):
+        s = self.stats
+        print(f"🖼️ Images: {s['downloaded']} downloaded, {s['reused']} reused, {s['not_modified']} not modified, "
+              f"{s['deduplicated']} duplicate content, {s['failed']} failed, {s['skipped']} skipped after "
+              f"{self.max_attempts} attempts")
+
+
+def attach_to_records(paths, record_file="entry_record.csv"):
+    """Adds recovered images/image_<idx>_<n>.jpg files to the image_files of their rows."""
+    import pandas as pd
+
+    df = pd.read_csv(record_file)
+    attached = 0
+    for path in paths:
+        match = re.search(r"image_(\d+)_\d+\.jpg$", path)
+        if not match:
+            continue
+        rows = df.index[df["idx"] == int(match.group(1))]
+        for row in rows:
+            current = df.at[row, "image_files"]
+            files = [f.strip() for f in current.split(",") if f.strip()] if isinstance(current, str) else []
+            if path not in files:
+                df.at[row, "image_files"] = ", ".join(sorted(files + [path]))
+                attached += 1
+    df.to_csv(record_file, index=False)
+    return attached
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retry image downloads that failed in earlier scraper runs")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    parser.add_argument("--record-file", default="entry_record.csv")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--max-attempts", type=int, default=3)
+    args = parser.parse_args()
+
+    downloader = ImageDownloader(DownloadManifest(args.manifest), workers=args.workers,
+                                 max_attempts=args.max_attempts)
+    jobs = downloader.manifest.failed(max_attempts=args.max_attempts)
+    print(f"🔁 Retrying {len(jobs)} failed downloads")
+    recovered = [path for path in downloader.fetch_many(jobs) if path]
+    downloader.report()
+    if recovered and os.path.exists(args.record_file):
+        print(f"📁 Attached {attach_to_records(recovered, args.record_file)} recovered images to {args.record_file}")
+    downloader.manifest.close()
+
+
+if __name__ == "__main__":
+    main()
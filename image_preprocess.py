@@ -0,0 +1,79 @@
+# Downscale and re-encode images before they are base64-uploaded to the vision model
+
+import os
+import io
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
+
+DERIVED_DIR = "images_derived"
+DEFAULT_MAX_EDGE = 1024
+DEFAULT_QUALITY = 80
+
+
+def derived_path(source_hash, max_edge, quality, cache_dir=DERIVED_DIR):
+    return os.path.join(cache_dir, f"{source_hash}_{max_edge}_q{quality}.jpg")
+
+
+def prepare_image(image_path, max_edge=DEFAULT_MAX_EDGE, quality=DEFAULT_QUALITY, cache_dir=DERIVED_DIR):
+    """
+    Returns the path of a JPEG no larger than `max_edge` on its longest side,
+    re-encoded at `quality`. Results are cached under `cache_dir` by source
+    content hash and size, so unchanged images are only processed once.
+    """
+    with open(image_path, "rb") as f:
+        source = f.read()
+    out_path = derived_path(hashlib.sha256(source).hexdigest(), max_edge, quality, cache_dir)
+    if os.path.exists(out_path):
+        return out_path
+
+    with Image.open(io.BytesIO(source)) as img:
+        img = ImageOps.exif_transpose(img)
+        resized = max(img.size) > max_edge
+        if resized:
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=quality, optimize=True)
+    encoded = buffer.getvalue()
+
+    # Re-encoding a small, already well-compressed JPEG can make it bigger
+    if not resized and len(encoded) >= len(source) and source[:3] == b"\xff\xd8\xff":
+        encoded = source
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(encoded)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def _prepare_one(args):
+    image_path, max_edge, quality, cache_dir = args
+    try:
+        return image_path, prepare_image(image_path, max_edge, quality, cache_dir)
+    except Exception as e:
+        print(f"⚠️ Could not preprocess {image_path}: {e} — uploading the original")
+        return image_path, image_path
+
+
+def prepare_images(image_paths, max_edge=DEFAULT_MAX_EDGE, quality=DEFAULT_QUALITY,
+                   cache_dir=DERIVED_DIR, workers=None):
+    """Prepares every image in a process pool. Returns {source path: upload path}."""
+    unique = list(dict.fromkeys(image_paths))
+    jobs = [(path, max_edge, quality, cache_dir) for path in unique]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(pool.map(_prepare_one, jobs, chunksize=8))
+
+
+def add_preprocess_arguments(parser):
+    parser.add_argument("--no-preprocess", action="store_true",
+                        help="upload the original images instead of downscaled copies")
+    parser.add_argument("--max-edge", type=int, default=DEFAULT_MAX_EDGE,
+                        help="longest edge in pixels of the uploaded images")
+    parser.add_argument("--jpeg-quality", type=int, default=DEFAULT_QUALITY,
+                        help="JPEG quality of the uploaded images")
+    parser.add_argument("--preprocess-workers", type=int, default=None,
+                        help="processes used to prepare images (default: CPU count)")
@@ -0,0 +1,293 @@
+# Per-stage spans, model token usage, retries and cache hits for the scraper and generator scripts
+
+import json
+import time
+import uuid
+import atexit
+import threading
+from contextlib import contextmanager
+
+# List prices in USD per 1M (input, output) tokens, for the cost column of the summary;
+# dated model snapshots match by prefix
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-3.5-turbo-1106": (1.00, 2.00),
+}
+# Batch API requests are billed at half the list price
+BATCH_DISCOUNT = 0.5
+
+
+def model_price(model):
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model and model.startswith(name):
+            return MODEL_PRICES[name]
+    return None
+
+
+def _usage_tokens(usage):
+    """(input, output) tokens of a chat.completions or responses usage object/dict."""
+    if usage is None:
+        return None
+    get = usage.get if isinstance(usage, dict) else (lambda key: getattr(usage, key, None))
+    prompt = get("prompt_tokens")
+    if prompt is None:
+        prompt = get("input_tokens")
+    completion = get("completion_tokens")
+    if completion is None:
+        completion = get("output_tokens")
+    if prompt is None and completion is None:
+        return None
+    return prompt or 0, completion or 0
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(q * (len(values) - 1)))]
+
+
+class Metrics:
+    """
+    Run metrics: spans (wall time of a named stage), model token usage and
+    counters (retries, cache hits, ...). Every event is appended to `path`
+    as one JSON line tagged with the run id and script; the aggregates feed
+    the end-of-run summary table. `otel=True` also emits each span to the
+    OpenTelemetry tracer, with usage and counters as span events. With
+    neither a path nor otel, events are only aggregated in memory and
+    report() prints nothing. Safe to use from threads and asyncio tasks.
+    """
+
+    def __init__(self, path=None, script=None, otel=False):
+        self.path = path
+        self.script = script
+        self.enabled = bool(path) or otel
+        self.run = uuid.uuid4().hex[:12]
+        self.started = time.time()
+        self.spans = {}     # stage -> [seconds, ...]
+        self.tokens = {}    # model -> [calls, input tokens, output tokens, cost in USD or None]
+        self.counters = {}  # name -> count
+        self._lock = threading.Lock()
+        self._f = open(path, "a", encoding="utf-8", buffering=1) if path else None
+        self._tracer = _otel_tracer(script) if otel else None
+
+    def _emit(self, event):
+        if self._f is None:
+            return
+        event = {"ts": round(time.time(), 6), "run": self.run, "script": self.script, **event}
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        with self._lock:
+            if not self._f.closed:
+                self._f.write(line + "\n")
+
+    @contextmanager
+    def span(self, stage, **attrs):
+        """Times the enclosed block as one occurrence of `stage`."""
+        otel_span = self._tracer.start_as_current_span(stage, attributes=_otel_attrs(attrs)) \
+            if self._tracer is not None else None
+        if otel_span is not None:
+            otel_span.__enter__()
+        start = time.perf_counter()
+        error, exc_info = None, (None, None, None)
+        try:
+            yield
+        except BaseException as e:
+            error, exc_info = type(e).__name__, (type(e), e, e.__traceback__)
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            if otel_span is not None:
+                # Records the exception on the span and sets its error status
+                otel_span.__exit__(*exc_info)
+            self.record_span(stage, seconds, error=error, **attrs)
+
+    def record_span(self, stage, seconds, **attrs):
+        """Adds a duration measured elsewhere (e.g. from a record's start time)."""
+        attrs = {key: value for key, value in attrs.items() if value is not None}
+        with self._lock:
+            self.spans.setdefault(stage, []).append(seconds)
+        self._emit({"type": "span", "stage": stage, "seconds": round(seconds, 6), **attrs})
+
+    def record_usage(self, response, model=None, batch=False, **attrs):
+        """
+        Token usage reported by an API response (chat.completions, responses
+        or embeddings). `batch` prices it at the Batch API discount.
+        """
+        tokens = _usage_tokens(getattr(response, "usage", None) if not isinstance(response, dict)
+                               else response.get("usage"))
+        if tokens is None:
+            return
+        model = model or (response.get("model") if isinstance(response, dict) else getattr(response, "model", None))
+        cost = _cost(model, tokens[0], tokens[1], batch)
+        with self._lock:
+            totals = self.tokens.setdefault(model, [0, 0, 0, 0.0])
+            totals[0] += 1
+            totals[1] += tokens[0]
+            totals[2] += tokens[1]
+            totals[3] = totals[3] + cost if cost is not None and totals[3] is not None else None
+        self._emit({"type": "usage", "model": model, "input_tokens": tokens[0], "output_tokens": tokens[1],
+                    "cost_usd": cost, "batch": batch or None, **attrs})
+        self._otel_event("usage", model=model, input_tokens=tokens[0], output_tokens=tokens[1], cost_usd=cost,
+                         batch=batch or None, **attrs)
+
+    def count(self, name, n=1, **attrs):
+        """Increments counter `name` (retries, cache hits, failures, ...)."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+        self._emit({"type": "count", "name": name, "n": n, **attrs})
+        self._otel_event(name, n=n, **attrs)
+
+    def _otel_event(self, name, **attrs):
+        if self._tracer is None:
+            return
+        from opentelemetry import trace
+
+        trace.get_current_span().add_event(name, _otel_attrs(attrs))
+
+    def summary(self):
+        with self._lock:
+            spans = {stage: list(values) for stage, values in self.spans.items()}
+            tokens = {model: list(values) for model, values in self.tokens.items()}
+            counters = dict(self.counters)
+        return {
+            "run": self.run,
+            "script": self.script,
+            "seconds": round(time.time() - self.started, 3),
+            "spans": {stage: {"count": len(values), "total": round(sum(values), 3),
+                              "mean": round(sum(values) / len(values), 4),
+                              "p50": round(_percentile(values, 0.50), 4),
+                              "p95": round(_percentile(values, 0.95), 4),
+                              "max": round(max(values), 4)}
+                      for stage, values in spans.items()},
+            "tokens": {model: {"calls": calls, "input": tokens_in, "output": tokens_out,
+                               "cost_usd": round(cost, 6) if cost is not None else None}
+                       for model, (calls, tokens_in, tokens_out, cost) in tokens.items()},
+            "counters": counters,
+        }
+
+    def report(self):
+        """Prints the summary table and records it as the run's last event."""
+        s = self.summary()
+        if not self.enabled or not (s["spans"] or s["tokens"] or s["counters"]):
+            return
+        print(f"\n📊 Run metrics ({self.script}, run {self.run}, {s['seconds']:.1f}s)"
+              + (f" -> {self.path}" if self.path else ""))
+        if s["spans"]:
+            print(f"   {'stage':<28} {'count':>8} {'total s':>10} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+            for stage, v in sorted(s["spans"].items(), key=lambda item: -item[1]["total"]):
+                print(f"   {stage:<28} {v['count']:>8,} {v['total']:>10.2f} {v['mean'] * 1000:>9.1f} "
+                      f"{v['p50'] * 1000:>9.1f} {v['p95'] * 1000:>9.1f}")
+        if s["tokens"]:
+            print(f"   {'model':<28} {'calls':>8} {'input tok':>10} {'output tok':>10} {'cost USD':>9}")
+            for model, v in sorted(s["tokens"].items(), key=lambda item: str(item[0])):
+                cost = f"{v['cost_usd']:>9.4f}" if v["cost_usd"] is not None else f"{'?':>9}"
+                print(f"   {str(model):<28} {v['calls']:>8,} {v['input']:>10,} {v['output']:>10,} {cost}")
+        if s["counters"]:
+            print("   " + ", ".join(f"{name} {n:,}" for name, n in sorted(s["counters"].items())))
+        self._emit({"type": "summary", **{key: s[key] for key in ("seconds", "spans", "tokens", "counters")}})
+
+    def close(self):
+        if self._f is not None:
+            with self._lock:
+                self._f.close()
+
+
+def _cost(model, tokens_in, tokens_out, batch=False):
+    price = model_price(model)
+    if price is None:
+        return None
+    cost = (tokens_in * price[0] + tokens_out * price[1]) / 1e6
+    return round(cost * BATCH_DISCOUNT if batch else cost, 8)
+
+
+# ---------------------------
+# OpenTelemetry (optional)
+# ---------------------------
+def _otel_attrs(attrs):
+    return {key: value if isinstance(value, (str, bool, int, float)) else str(value)
+            for key, value in attrs.items() if value is not None}
+
+
+def _otel_tracer(script):
+    """
+    Tracer of the globally configured OpenTelemetry provider. When only the
+    API is set up (no provider yet) and the SDK is installed, spans are
+    exported over OTLP (OTEL_EXPORTER_OTLP_* environment variables) if the
+    exporter package is present, otherwise printed to the console.
+    """
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        print("⚠️ --otel needs the opentelemetry-api package; writing the metrics JSONL only")
+        return None
+    if type(trace.get_tracer_provider()).__name__ == "ProxyTracerProvider":
+        try:
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+        except ImportError:
+            print("⚠️ opentelemetry-sdk is not installed; spans go to the no-op tracer")
+            return trace.get_tracer(__name__)
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            exporter = OTLPSpanExporter()
+        except ImportError:
+            exporter = ConsoleSpanExporter()
+        provider = TracerProvider(resource=Resource.create({"service.name": script or "mandalay-pipeline"}))
+        provider.add_span_processor(BatchSpanProcessor(exporter))
+        trace.set_tracer_provider(provider)
+        atexit.register(provider.shutdown)
+    return trace.get_tracer(__name__)
+
+
+# ---------------------------
+# Process-wide Metrics
+# ---------------------------
+# Library modules record into the current Metrics; until a script configures
+# one, events are only aggregated in memory
+_current = Metrics()
+
+
+def configure(path=None, script=None, otel=False):
+    """Replaces the process-wide Metrics. Returns it."""
+    global _current
+    _current.close()
+    _current = Metrics(path, script, otel)
+    atexit.register(_current.close)
+    return _current
+
+
+def current():
+    return _current
+
+
+def span(stage, **attrs):
+    return _current.span(stage, **attrs)
+
+
+def record_span(stage, seconds, **attrs):
+    _current.record_span(stage, seconds, **attrs)
+
+
+def record_usage(response, model=None, batch=False, **attrs):
+    _current.record_usage(response, model, batch, **attrs)
+
+
+def count(name, n=1, **attrs):
+    _current.count(name, n, **attrs)
+
+
+# ---------------------------
+# Command-line Options
+# ---------------------------
+def add_metrics_arguments(parser):
+    parser.add_argument("--metrics", default=None, metavar="PATH",
+                        help="append the run's spans, token usage and counters to this JSONL file "
+                             "and print a summary table at the end")
+    parser.add_argument("--otel", action="store_true",
+                        help="export spans through OpenTelemetry (needs opentelemetry-api/-sdk) "
+                             "and print the summary table")
+
+
+def metrics_from_args(args, script):
+    return configure(args.metrics, script, args.otel)
@@ -0,0 +1,183 @@
+# Persistent, content-addressed cache of LLM responses shared by the generator scripts
+
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from instrumentation import count, record_usage
+
+DEFAULT_CACHE_PATH = "llm_cache.sqlite"
+
+
+def make_key(endpoint, request):
+    """
+    SHA-256 over the endpoint name and the full request payload (model,
+    instructions, prompt text and any base64 image data URL). Changing any
+    of them produces a different key, so only the affected stage re-queries.
+    """
+    payload = json.dumps({"endpoint": endpoint, "request": request},
+                         sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def response_text(response):
+    """Text of a client.responses.create() result."""
+    return response.output_text.strip()
+
+
+def chat_text(response):
+    """Text of a client.chat.completions.create() result."""
+    return response.choices[0].message.content.strip()
+
+
+class LLMCache:
+    """
+    SQLite-backed response cache.
+
+    Entries older than `ttl` seconds are treated as misses and dropped. When
+    the stored responses exceed `max_bytes`, the least recently used rows are
+    evicted until the cache fits again.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=None, max_bytes=None):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                model TEXT,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+        # Apply a lowered size limit right away rather than on the next write
+        self._evict()
+        self._conn.commit()
+
+    def get(self, endpoint, request):
+        key = make_key(endpoint, request)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                count("llm_cache.miss", endpoint=endpoint, model=request.get("model"))
+                return None
+            response, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.expired += 1
+                self.misses += 1
+                count("llm_cache.expired", endpoint=endpoint, model=request.get("model"))
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            count("llm_cache.hit", endpoint=endpoint, model=request.get("model"))
+            return response
+
+    def put(self, endpoint, request, response):
+        key = make_key(endpoint, request)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, endpoint, model, response, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, endpoint, request.get("model"), response, len(response.encode("utf-8")), now, now))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at ASC").fetchall():
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.evicted += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def report(self):
+        s = self.stats()
+        print(f"🗄️ LLM cache {self.path}: {s['hits']} hits, {s['misses']} misses "
+              f"(hit rate {s['hit_rate']:.1%}), {s['expired']} expired, {s['evicted']} evicted, "
+              f"{s['entries']} entries / {s['bytes'] / 1e6:.2f} MB")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def cached_create(cache, endpoint, create, request, extract):
+    """
+    Returns the text for `request`, from the cache when possible, otherwise by
+    calling `create(**request)` and storing `extract(response)`.
+    """
+    if cache is not None:
+        text = cache.get(endpoint, request)
+        if text is not None:
+            return text
+    response = create(**request)
+    record_usage(response, request.get("model"), endpoint=endpoint)
+    text = extract(response)
+    if cache is not None:
+        cache.put(endpoint, request, text)
+    return text
+
+
+# ---------------------------
+# Command-line Options
+# ---------------------------
+def add_cache_arguments(parser):
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH,
+                        help="SQLite file caching LLM responses across runs")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="do not reuse or persist responses across runs")
+    parser.add_argument("--cache-ttl-days", type=float, default=None,
+                        help="treat cached responses older than this as misses")
+    parser.add_argument("--cache-max-mb", type=float, default=None,
+                        help="evict least recently used responses beyond this size")
+
+
+def cache_from_args(args):
+    if args.no_cache:
+        # Still de-duplicates identical requests within this run
+        return LLMCache(":memory:")
+    ttl = args.cache_ttl_days * 86400 if args.cache_ttl_days is not None else None
+    max_bytes = int(args.cache_max_mb * 1e6) if args.cache_max_mb is not None else None
+    return LLMCache(args.cache, ttl=ttl, max_bytes=max_bytes)
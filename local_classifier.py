@@ -0,0 +1,136 @@
+# Offline loss/resilience classifier (TF-IDF + logistic regression) trained on the LLM labels
+
+import json
+import time
+import argparse
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.pipeline import make_pipeline
+from sklearn.compose import ColumnTransformer
+from sklearn.linear_model import LogisticRegression
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.model_selection import KFold, cross_val_predict
+from sklearn.metrics import accuracy_score, cohen_kappa_score
+
+LABELS_JSON = "gallery_data_augmented.json"
+DEFAULT_MODEL = "loss_resilience_model.joblib"
+DEFAULT_MIN_CONFIDENCE = 0.8
+TARGETS = ("lossLevel", "resilienceLevel")
+
+
+def _frame(items):
+    return pd.DataFrame({"summary": [item.get("summary") or "" for item in items],
+                         "caption": [item.get("caption") or "" for item in items]})
+
+
+def _pipeline():
+    # Summary and caption get separate vocabularies, then one linear model
+    features = ColumnTransformer([
+        ("summary", TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, min_df=2), "summary"),
+        ("caption", TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, min_df=2), "caption"),
+    ])
+    return make_pipeline(features, LogisticRegression(max_iter=2000, C=4.0, class_weight="balanced"))
+
+
+def labeled_items(data):
+    return [item for item in data if all(item.get(t) in (1, 2, 3) for t in TARGETS)]
+
+
+class LocalLevelClassifier:
+    """One TF-IDF + logistic-regression pipeline per target level."""
+
+    def __init__(self, models=None, meta=None):
+        self.models = models or {}
+        self.meta = meta or {}
+
+    @classmethod
+    def train(cls, data, source=LABELS_JSON):
+        items = labeled_items(data)
+        X = _frame(items)
+        models = {t: _pipeline().fit(X, [item[t] for item in items]) for t in TARGETS}
+        return cls(models, {"trained_at": time.time(), "samples": len(items), "source": source})
+
+    def save(self, path=DEFAULT_MODEL):
+        joblib.dump({"models": self.models, "meta": self.meta}, path)
+
+    @classmethod
+    def load(cls, path=DEFAULT_MODEL):
+        stored = joblib.load(path)
+        return cls(stored["models"], stored["meta"])
+
+    def predict(self, items):
+        """
+        Returns (loss, resilience, confidence) per item, where confidence is
+        the lower of the two predicted-class probabilities.
+        """
+        X = _frame(items)
+        levels, confidences = [], []
+        for t in TARGETS:
+            proba = self.models[t].predict_proba(X)
+            classes = self.models[t].classes_
+            levels.append([int(c) for c in classes[proba.argmax(axis=1)]])
+            confidences.append(proba.max(axis=1))
+        confidence = np.minimum(*confidences)
+        return [(loss, resilience, float(conf)) for loss, resilience, conf in zip(*levels, confidence)]
+
+
+def benchmark(data, folds=5, min_confidence=DEFAULT_MIN_CONFIDENCE):
+    """
+    Cross-validated agreement with the LLM labels (each record predicted by
+    a model that did not see it), overall and on the records the fast path
+    would keep at `min_confidence`, plus prediction throughput.
+    """
+    items = labeled_items(data)
+    X = _frame(items)
+    splitter = KFold(n_splits=folds, shuffle=True, random_state=0)
+    predicted, confidences = {}, []
+    for t in TARGETS:
+        y = np.array([item[t] for item in items])
+        proba = cross_val_predict(_pipeline(), X, y, cv=splitter, method="predict_proba")
+        classes = np.unique(y)
+        predicted[t] = classes[proba.argmax(axis=1)]
+        confidences.append(proba.max(axis=1))
+    confident = np.minimum(*confidences) >= min_confidence
+
+    print(f"📊 {len(items)} labeled records, {folds}-fold cross-validation")
+    for t in TARGETS:
+        y = np.array([item[t] for item in items])
+        kept = accuracy_score(y[confident], predicted[t][confident]) if confident.any() else 0
+        print(f"   {t:<16} agreement {accuracy_score(y, predicted[t]):.1%}, "
+              f"kappa {cohen_kappa_score(y, predicted[t]):.2f}; at confidence >= {min_confidence}: {kept:.1%}")
+    both = np.all([predicted[t] == np.array([item[t] for item in items]) for t in TARGETS], axis=0)
+    print(f"   both levels      agreement {both.mean():.1%}; fast path keeps {confident.mean():.1%} of records "
+          f"at {both[confident].mean() if confident.any() else 0:.1%} agreement")
+
+    model = LocalLevelClassifier.train(data)
+    start = time.perf_counter()
+    repeats = max(1, 10_000 // max(1, len(items)))
+    for _ in range(repeats):
+        model.predict(items)
+    elapsed = time.perf_counter() - start
+    print(f"   throughput       {repeats * len(items) / elapsed:,.0f} records/s (single process)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or benchmark the local loss/resilience classifier")
+    parser.add_argument("command", choices=("train", "benchmark"))
+    parser.add_argument("--labels", default=LABELS_JSON, help="JSON with LLM lossLevel/resilienceLevel labels")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--min-confidence", type=float, default=DEFAULT_MIN_CONFIDENCE)
+    args = parser.parse_args()
+
+    with open(args.labels, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    if args.command == "train":
+        model = LocalLevelClassifier.train(data, source=args.labels)
+        model.save(args.model)
+        print(f"✅ Trained on {model.meta['samples']} records, saved to {args.model}")
+    else:
+        benchmark(data, args.folds, args.min_confidence)
+
+
+if __name__ == "__main__":
+    main()
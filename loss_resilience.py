@@ -0,0 +1,221 @@
+# Loss/resilience classification prompts, including the multi-entry (batched) variant
+
+import re
+import json
+import asyncio
+import hashlib
+from openai import AsyncOpenAI
+
+from llm_cache import chat_text
+from instrumentation import span, count
+
+CLASSIFIER_MODEL = "gpt-3.5-turbo-1106"
+LEVELS = (1, 2, 3)
+
+RULES = """--- LOSS CLASSIFICATION RULES ---
+Loss Level 3 (High): Mentions of injured/dead people or fully collapsed buildings with visible debris.
+Loss Level 2 (Moderate): Partially collapsed buildings and other descriptions of damage.
+Loss Level 1 (None): No visible or described damage.
+
+--- RESILIENCE CLASSIFICATION RULES ---
+Resilience Level 3 (High): Many rescue or medical personnel are involved.
+Resilience Level 2 (Moderate): One or a few people doing search or rescue.
+Resilience Level 1 (None): No visible recovery effort or rescue work."""
+
+
+def classification_request(summary, caption):
+    prompt = f"""
+Given the following information from an earthquake-related image, classify the degree of LOSS and RESILIENCE.
+
+--- INFORMATION ---
+News Summary: "{summary}"
+Image Caption: "{caption}"
+
+{RULES}
+
+Return your answer in the format:
+Loss Level: [1-3]
+Resilience Level: [1-3]
+"""
+    return {
+        "model": CLASSIFIER_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0
+    }
+
+
+def parse_levels(content):
+    # Use regex to extract the levels
+    loss_match = re.search(r"Loss Level:\s*(\d)", content)
+    resilience_match = re.search(r"Resilience Level:\s*(\d)", content)
+
+    if loss_match and resilience_match:
+        return int(loss_match.group(1)), int(resilience_match.group(1))
+    else:
+        print(f"[WARNING] Could not parse response:\n{content}\n")
+        return None, None
+
+
+def prompt_fingerprint():
+    """Short hash of the classifier model and prompts."""
+    templates = [classification_request("", ""), multi_classification_request([])]
+    return hashlib.sha256(json.dumps(templates, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+# ---------------------------
+# Multi-entry Requests
+# ---------------------------
+def multi_classification_request(items):
+    """
+    One request classifying several (id, summary, caption) items, with the
+    rules sent once. The model answers with a JSON object (JSON mode).
+    """
+    payload = json.dumps([{"id": item_id, "summary": summary, "caption": caption}
+                          for item_id, summary, caption in items], ensure_ascii=False, indent=1)
+    prompt = f"""
+Each item below holds the news summary and image caption of one earthquake-related image.
+Classify the degree of LOSS and RESILIENCE of every item independently.
+
+--- ITEMS ---
+{payload}
+
+{RULES}
+
+Return a JSON object of the form:
+{{"items": [{{"id": <item id>, "loss": <1-3>, "resilience": <1-3>}}, ...]}}
+with exactly one element for each of the {len(items)} item ids.
+"""
+    return {
+        "model": CLASSIFIER_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "response_format": {"type": "json_object"},
+        "temperature": 0
+    }
+
+
+def _level(value):
+    try:
+        level = int(value)
+    except (TypeError, ValueError):
+        return None
+    return level if level in LEVELS and float(value) == level else None
+
+
+def parse_multi_levels(content, item_ids):
+    """
+    Validates a multi-entry answer against the ids that were sent. Returns
+    {id: (loss, resilience)} for the items answered correctly; ids that are
+    missing, duplicated or out of range are left out so they can be re-asked.
+    """
+    try:
+        answer = json.loads(content)
+    except (TypeError, ValueError):
+        return {}
+    rows = answer.get("items") if isinstance(answer, dict) else answer
+    if not isinstance(rows, list):
+        return {}
+
+    expected = set(item_ids)
+    levels, seen = {}, set()
+    for row in rows:
+        if not isinstance(row, dict):
+            continue
+        item_id = row.get("id")
+        # JSON mode sometimes quotes the ids ("3")
+        if isinstance(item_id, str) and item_id.strip().isdigit():
+            item_id = int(item_id)
+        if item_id not in expected:
+            continue
+        if item_id in seen:
+            # Conflicting duplicates are not trusted
+            levels.pop(item_id, None)
+            continue
+        seen.add(item_id)
+        loss, resilience = _level(row.get("loss")), _level(row.get("resilience"))
+        if loss is not None and resilience is not None:
+            levels[item_id] = (loss, resilience)
+    return levels
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class IncompleteAnswer(ValueError):
+    """A multi-entry answer that does not classify every item sent; `levels` holds the valid ones."""
+
+    def __init__(self, levels, missing):
+        super().__init__(f"{missing} items missing or invalid")
+        self.levels = levels
+
+
+def complete_levels_text(item_ids):
+    """
+    Extractor for a multi-entry response: returns its text only when every
+    item id is answered validly, so incomplete answers are never cached.
+    """
+    def extract(response):
+        content = chat_text(response)
+        levels = parse_multi_levels(content, item_ids)
+        if len(levels) < len(item_ids):
+            raise IncompleteAnswer(levels, len(item_ids) - len(levels))
+        return content
+    return extract
+
+
+async def _classify_chunk(client, caller, chunk, semaphore):
+    item_ids = [item_id for item_id, _, _ in chunk]
+    async with semaphore:
+        try:
+            with span("levels.classify", items=len(chunk)):
+                content = await caller.call("chat.completions", client.chat.completions.create,
+                                            multi_classification_request(chunk), complete_levels_text(item_ids))
+        except IncompleteAnswer as e:
+            # Keep the valid part for this run; the rest is re-asked
+            return e.levels
+        except Exception as e:
+            print(f"Error classifying items {chunk[0][0]}..{chunk[-1][0]}: {e}")
+            return {}
+    return parse_multi_levels(content, item_ids)
+
+
+async def classify_multi(items, items_per_request=10, concurrency=4, rpm=500, tpm=200_000, api_key=None,
+                         base_url=None, cache=None, max_rounds=3):
+    """
+    Classifies (id, summary, caption) items, `items_per_request` at a time,
+    with up to `concurrency` requests in flight. Items whose answers fail
+    validation are re-issued in halved groups for up to `max_rounds` rounds.
+    Only answers that classify every item of their request are cached, in
+    every round, so a rerun replays them and re-asks nothing that succeeded.
+    Returns {id: (loss, resilience)} for every item that was classified.
+    """
+    # Imported here: gallery_annotation reads RULES from this module
+    from gallery_async import AdaptiveRateLimiter, CachedCaller
+
+    client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+    limiter = AdaptiveRateLimiter(rpm, tpm)
+    semaphore = asyncio.Semaphore(concurrency)
+    levels = {}
+    pending = list(items)
+    size = items_per_request
+    caller = CachedCaller(cache, limiter)
+    try:
+        for round_no in range(max_rounds):
+            if not pending:
+                break
+            results = await asyncio.gather(*(_classify_chunk(client, caller, chunk, semaphore)
+                                             for chunk in _chunks(pending, size)))
+            for result in results:
+                levels.update(result)
+            pending = [item for item in pending if item[0] not in levels]
+            if pending:
+                print(f"⚠️ {len(pending)} items failed validation in round {round_no + 1}")
+                count("levels.reasked", len(pending))
+            size = max(1, size // 2)
+    finally:
+        await client.close()
+    return levels
+
+
+def run_classify_multi(items, **kwargs):
+    return asyncio.run(classify_multi(items, **kwargs))
@@ -0,0 +1,191 @@
+# Geohash-bucketed map data for loss-resilience-mapping.html: per-cell aggregates, marker tiles, lazy popups
+
+import os
+import json
+import math
+import shutil
+import argparse
+
+from gallery_stream import iter_records
+
+INPUT_JSON = "gallery_data_augmented.json"
+MAP_DIR = "map_data"
+CELL_PRECISION = 3     # ~156 x 156 km aggregate cells, shown when zoomed out
+TILE_PRECISION = 4     # ~39 x 20 km marker tiles, fetched for the viewport when zoomed in
+DETAIL_BUCKET = 100    # popup details per lazily loaded file
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(lat, lon, precision):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    code, bits, n_bits, even = [], 0, 0, True
+    while len(code) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits, rng[0] = bits * 2 + 1, mid
+        else:
+            bits, rng[1] = bits * 2, mid
+        even = not even
+        n_bits += 1
+        if n_bits == 5:
+            code.append(_BASE32[bits])
+            bits, n_bits = 0, 0
+    return "".join(code)
+
+
+def geohash_bounds(code):
+    """(south, west, north, east) of a geohash cell."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in code:
+        value = _BASE32.index(char)
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if value >> shift & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def _coordinate(value):
+    """Float coordinate, or None for missing/zero values (the page never mapped those)."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value and not math.isnan(value) else None
+
+
+def _level(value):
+    return int(value) if value in (1, 2, 3) else None
+
+
+def _write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+
+class _Cell:
+    def __init__(self):
+        self.count = 0
+        self.lat = self.lon = 0.0
+        self.loss = [0, 0, 0]
+        self.resilience = [0, 0, 0]
+
+    def add(self, lat, lon, loss, resilience):
+        self.count += 1
+        self.lat += lat
+        self.lon += lon
+        if loss:
+            self.loss[loss - 1] += 1
+        if resilience:
+            self.resilience[resilience - 1] += 1
+
+    def to_json(self, code):
+        def mean(counts):
+            n = sum(counts)
+            return round(sum(level * c for level, c in enumerate(counts, start=1)) / n, 2) if n else None
+
+        return {"geohash": code, "lat": round(self.lat / self.count, 5), "lon": round(self.lon / self.count, 5),
+                "count": self.count, "loss": self.loss, "resilience": self.resilience,
+                "meanLoss": mean(self.loss), "meanResilience": mean(self.resilience)}
+
+
+def export_map_data(input_path=INPUT_JSON, out_dir=MAP_DIR, cell_precision=CELL_PRECISION,
+                    tile_precision=TILE_PRECISION, detail_bucket=DETAIL_BUCKET):
+    """
+    Streams the gallery file into `out_dir`:
+      index.json          summary matrix, per-cell aggregates and tile bounds (size grows with
+                          the number of occupied cells, not records)
+      tiles/<hash>.json   one marker per distinct location in the tile:
+                          [lat, lon, [[id, loss, resilience], ...]]
+      detail/<n>.json     popup fields of ids n*detail_bucket .. (n+1)*detail_bucket-1
+    The directory is built beside the old one and swapped in when complete.
+    Returns the index.
+    """
+    tmp_dir = f"{out_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(os.path.join(tmp_dir, "tiles"))
+    os.makedirs(os.path.join(tmp_dir, "detail"))
+
+    matrix = [[0] * 3 for _ in range(3)]
+    cells, tiles = {}, {}
+    details, total, geocoded = {}, 0, 0
+
+    def flush_details(bucket):
+        if details:
+            _write_json(os.path.join(tmp_dir, "detail", f"{bucket}.json"), details)
+            details.clear()
+
+    for entry_id, entry in enumerate(iter_records(input_path)):
+        total += 1
+        loss, resilience = _level(entry.get("lossLevel")), _level(entry.get("resilienceLevel"))
+        if loss and resilience:
+            matrix[loss - 1][resilience - 1] += 1
+
+        if entry_id and entry_id % detail_bucket == 0:
+            flush_details(entry_id // detail_bucket - 1)
+        details[entry_id] = {key: entry.get(key) for key in ("caption", "summary", "image_url", "thumbnail",
+                                                             "title", "url", "date")
+                             if entry.get(key)}
+
+        lat, lon = _coordinate(entry.get("latitude")), _coordinate(entry.get("longitude"))
+        if lat is None or lon is None:
+            continue
+        geocoded += 1
+        code = geohash(lat, lon, max(cell_precision, tile_precision))
+        cells.setdefault(code[:cell_precision], _Cell()).add(lat, lon, loss, resilience)
+        # Records geocoded to the same place (often a city centroid) share one marker
+        location = (round(lat, 5), round(lon, 5))
+        tiles.setdefault(code[:tile_precision], {}).setdefault(location, []).append([entry_id, loss, resilience])
+    flush_details(max(total - 1, 0) // detail_bucket)
+
+    for code, locations in tiles.items():
+        _write_json(os.path.join(tmp_dir, "tiles", f"{code}.json"),
+                    [[lat, lon, entries] for (lat, lon), entries in locations.items()])
+
+    index = {
+        "total": total,
+        "geocoded": geocoded,
+        "matrix": matrix,
+        "cellPrecision": cell_precision,
+        "detailBucket": detail_bucket,
+        "cells": [cell.to_json(code) for code, cell in sorted(cells.items())],
+        "tiles": {code: {"bounds": geohash_bounds(code), "count": sum(len(entries) for entries in locations.values())}
+                  for code, locations in sorted(tiles.items())},
+    }
+    _write_json(os.path.join(tmp_dir, "index.json"), index)
+
+    old_dir = f"{out_dir}.old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.rename(out_dir, old_dir)
+    os.rename(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export geohash-bucketed map data for loss-resilience-mapping.html")
+    parser.add_argument("--input", default=INPUT_JSON, help="gallery .json or .jsonl with levels")
+    parser.add_argument("--output", default=MAP_DIR)
+    parser.add_argument("--cell-precision", type=int, default=CELL_PRECISION,
+                        help="geohash length of the aggregate cells")
+    parser.add_argument("--tile-precision", type=int, default=TILE_PRECISION,
+                        help="geohash length of the marker tiles")
+    parser.add_argument("--detail-bucket", type=int, default=DETAIL_BUCKET)
+    args = parser.parse_args()
+
+    index = export_map_data(args.input, args.output, args.cell_precision, args.tile_precision, args.detail_bucket)
+    size = os.path.getsize(os.path.join(args.output, "index.json")) / 1024
+    print(f"🗺️ {index['geocoded']}/{index['total']} records mapped into {len(index['cells'])} cells and "
+          f"{len(index['tiles'])} tiles; index.json is {size:.1f} KB -> {args.output}/")
+
+
+if __name__ == "__main__":
+    main()
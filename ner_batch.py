@@ -0,0 +1,121 @@
+# Batched spaCy location extraction, and a mode that refreshes extracted_locations in entry_record.csv
+
+import os
+import argparse
+import pandas as pd
+import spacy
+
+from geocode_cache import GeocodeCache, CachedGeocoder, DEFAULT_GEOCODE_CACHE
+from scraper_pipeline import RateLimiter
+
+SPACY_MODEL = "en_core_web_sm"
+LOCATION_LABELS = ("GPE", "LOC")
+
+# Components en_core_web_sm ships that NER does not depend on
+UNUSED_COMPONENTS = ["parser", "lemmatizer", "tagger", "attribute_ruler", "senter"]
+
+
+def load_ner(model=SPACY_MODEL):
+    """Loads the spaCy model with only the components entity recognition needs."""
+    return spacy.load(model, exclude=UNUSED_COMPONENTS)
+
+
+def locations_from_doc(doc):
+    """
+    Location names of `doc`, de-duplicated in first-mention order. locations[0]
+    (the place that gets geocoded) is the one the article names first; the
+    original scraper took it from a set, so it was arbitrary.
+    """
+    return list(dict.fromkeys(ent.text for ent in doc.ents if ent.label_ in LOCATION_LABELS))
+
+
+def extract_locations_batch(texts, nlp, batch_size=64, n_process=1):
+    """Location lists for every text, in input order, from a single nlp.pipe pass."""
+    return [locations_from_doc(doc) for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process)]
+
+
+def read_texts(text_files, texts_dir="texts"):
+    texts = []
+    for text_file in text_files:
+        path = os.path.join(texts_dir, str(text_file))
+        if isinstance(text_file, str) and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                texts.append(f.read())
+        else:
+            texts.append("")
+    return texts
+
+
+def refresh_entry_record(record_file="entry_record.csv", texts_dir="texts", batch_size=64, n_process=1,
+                         model=SPACY_MODEL, geocoder=None):
+    """
+    Re-runs NER over the saved article texts and rewrites the
+    extracted_locations column. Nothing is refetched from NewsAPI.
+
+    Rows whose first location changed get latitude/longitude from
+    `geocoder(name)` (e.g. a geocode_cache.CachedGeocoder); without one
+    their coordinates are left as they were and still point at the old
+    place. Returns (rows whose locations changed, rows re-geocoded).
+    """
+    df = pd.read_csv(record_file)
+    texts = read_texts(df["text_file"], texts_dir)
+    locations = extract_locations_batch(texts, load_ner(model), batch_size=batch_size, n_process=n_process)
+
+    refreshed = pd.Series([", ".join(locs) for locs in locations], index=df.index)
+    previous = df["extracted_locations"].fillna("")
+    changed = int((refreshed != previous).sum())
+    first_changed = {i: locs[0] if locs else "" for i, locs, old in zip(df.index, locations, previous)
+                     if (locs[0] if locs else "") != old.split(", ")[0]}
+    df["extracted_locations"] = refreshed
+
+    if geocoder is not None:
+        for i, place in first_changed.items():
+            df.loc[i, ["latitude", "longitude"]] = geocoder(place) if place else (None, None)
+    elif first_changed:
+        print(f"⚠️ {len(first_changed)} rows now name a different first location; "
+              f"their latitude/longitude were not refreshed")
+    df.to_csv(record_file, index=False)
+    return changed, len(first_changed) if geocoder is not None else 0
+
+
+def nominatim_geocoder(cache_path=DEFAULT_GEOCODE_CACHE, rate=1.0):
+    """The scraper's geocoding chain: gazetteer, geocode_cache, then rate-limited Nominatim."""
+    from geopy.geocoders import Nominatim
+
+    geolocator = Nominatim(user_agent="mandalay_earthquake_locator",
+                           domain=os.getenv("NOMINATIM_DOMAIN", "nominatim.openstreetmap.org"),
+                           scheme=os.getenv("NOMINATIM_SCHEME", "https"))
+
+    def lookup(name):
+        location = geolocator.geocode(name)
+        return (location.latitude, location.longitude) if location else (None, None)
+
+    return CachedGeocoder(lookup, cache=GeocodeCache(cache_path), limiter=RateLimiter(rate))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh extracted_locations in entry_record.csv from texts/")
+    parser.add_argument("--record-file", default="entry_record.csv")
+    parser.add_argument("--texts-dir", default="texts")
+    parser.add_argument("--model", default=SPACY_MODEL)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--n-process", type=int, default=1,
+                        help="worker processes for nlp.pipe (-1 for all cores)")
+    parser.add_argument("--geocode-cache", default=DEFAULT_GEOCODE_CACHE,
+                        help="SQLite file caching geocoding answers across runs")
+    parser.add_argument("--no-geocode", action="store_true",
+                        help="keep the old latitude/longitude of rows whose first location changed")
+    args = parser.parse_args()
+
+    geocoder = None if args.no_geocode else nominatim_geocoder(args.geocode_cache)
+    changed, regeocoded = refresh_entry_record(args.record_file, args.texts_dir, batch_size=args.batch_size,
+                                               n_process=args.n_process, model=args.model, geocoder=geocoder)
+    if geocoder is not None:
+        geocoder.report()
+        geocoder.cache.close()
+    print(f"✅ Refreshed extracted_locations in {args.record_file} ({changed} rows changed, "
+          f"{regeocoded} re-geocoded)")
+
+
+if __name__ == "__main__":
+    main()
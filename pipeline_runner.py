@@ -0,0 +1,398 @@
+# Incremental runner for the scrape -> gallery -> loss/resilience -> stats workflow
+
+import os
+import sys
+import json
+import shlex
+import hashlib
+import argparse
+import threading
+import subprocess
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+STATE_FILE = "pipeline_state.json"
+ENTRY_CSV = "entry_record.csv"
+TEXTS_DIR = "texts"
+IMAGES_DIR = "images"
+GALLERY_JSON = "gallery_data.json"
+AUGMENTED_JSON = "gallery_data_augmented.json"
+LEVELS_INPUT = "gallery_data.levels_input.json"
+PARQUET_PATH = "gallery_data.parquet"
+ARROW_PATH = "gallery_data.arrow"
+
+
+def _digest(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def code_version(*scripts):
+    """Hash of the scripts a stage runs, so editing them triggers a rebuild."""
+    return _digest(*(file_digest(script) for script in scripts))
+
+
+_print_lock = threading.Lock()
+
+
+def say(message):
+    """print() for messages coming from parallel stages, one whole line at a time."""
+    with _print_lock:
+        sys.stdout.write(f"{message}\n")
+        sys.stdout.flush()
+
+
+def _load_json(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ---------------------------
+# Stages
+# ---------------------------
+class Stage:
+    """
+    One node of the DAG. `plan(runner)` returns (fingerprint, records, dirty):
+    the stage-level input fingerprint, per-record input fingerprints and the
+    keys of records that must be redone. `command(runner, dirty)` returns the
+    argv to run. A stage is skipped when its fingerprint matches the last
+    successful run and its outputs exist.
+    """
+
+    name = None
+    deps = ()
+    outputs = ()
+
+    def plan(self, runner):
+        raise NotImplementedError
+
+    def command(self, runner, dirty):
+        raise NotImplementedError
+
+    def finish(self, runner):
+        pass
+
+
+class ScrapeStage(Stage):
+    name = "scrape"
+    outputs = (ENTRY_CSV,)
+
+    def plan(self, runner):
+        # NewsAPI has no change feed: scraping always runs when requested
+        return None, {}, ["*"]
+
+    def command(self, runner, dirty):
+        return [sys.executable, "MandalayEarthquake_data_scraper.py", *runner.stage_args["scrape"]]
+
+
+class ClusterStage(Stage):
+    name = "clusters"
+    deps = ("scrape",)
+    outputs = (ENTRY_CSV,)
+
+    def plan(self, runner):
+        df = pd.read_csv(ENTRY_CSV)
+        records = {}
+        for idx, text_file in zip(df["idx"], df["text_file"]):
+            path = os.path.join(TEXTS_DIR, str(text_file))
+            records[str(idx)] = file_digest(path) if os.path.exists(path) else None
+        # Only the columns clustering reads, since the stage rewrites entry_record.csv itself
+        fingerprint = _digest(records, code_version("article_dedup.py"), runner.stage_args["clusters"])
+        dirty = list(records) if "cluster_id" not in df.columns or df["cluster_id"].isna().any() else \
+            runner.changed_records(self.name, records)
+        return fingerprint, records, dirty
+
+    def command(self, runner, dirty):
+        return [sys.executable, "article_dedup.py", *runner.stage_args["clusters"]]
+
+
+class ImageHashStage(Stage):
+    name = "hashes"
+    deps = ("scrape",)
+    outputs = ("image_hashes.sqlite",)
+
+    def plan(self, runner):
+        records = {}
+        for name in sorted(os.listdir(IMAGES_DIR)):
+            st = os.stat(os.path.join(IMAGES_DIR, name))
+            records[name] = [st.st_size, st.st_mtime_ns]
+        fingerprint = _digest(records, code_version("image_dedup.py"))
+        return fingerprint, records, runner.changed_records(self.name, records)
+
+    def command(self, runner, dirty):
+        return [sys.executable, "image_dedup.py"]
+
+
+class GalleryStage(Stage):
+    name = "gallery"
+    deps = ("clusters", "hashes")
+    outputs = (GALLERY_JSON,)
+
+    def plan(self, runner):
+        # The generator's own journal decides which entries are redone (--resume)
+        import Generate_gallerydata_enhanced as gallery
+        from gallery_journal import GalleryJournal, pending_tasks
+
+        args = gallery.parse_args(runner.stage_args["gallery"])
+        tasks = gallery.prepare_tasks(args)
+        records = {str(task["idx"]): task["input_hash"] for task in tasks}
+        dirty = [str(task["idx"]) for task in pending_tasks(tasks, GalleryJournal(args.journal).load())]
+        fingerprint = _digest(records, code_version("Generate_gallerydata_enhanced.py"), runner.stage_args["gallery"])
+        return fingerprint, records, dirty
+
+    def command(self, runner, dirty):
+        return [sys.executable, "Generate_gallerydata_enhanced.py", "--resume", *runner.stage_args["gallery"]]
+
+
+class ThumbsStage(Stage):
+    """thumbnails.py keeps its own per-image hash manifest and rewrites gallery_data.json in place."""
+
+    name = "thumbs"
+    deps = ("gallery",)
+    outputs = (os.path.join("thumbs", "manifest.json"),)
+
+    def plan(self, runner):
+        records = {}
+        for entry in _load_json(GALLERY_JSON) or []:
+            path = entry["image_file"]
+            if os.path.exists(path):
+                st = os.stat(path)
+                records[path] = [st.st_size, st.st_mtime_ns]
+        fingerprint = _digest(records, code_version("thumbnails.py"), runner.stage_args["thumbs"])
+        return fingerprint, records, runner.changed_records(self.name, records)
+
+    def command(self, runner, dirty):
+        return [sys.executable, "thumbnails.py", "--input", GALLERY_JSON, *runner.stage_args["thumbs"]]
+
+
+class LevelsStage(Stage):
+    """
+    Records whose summary, caption and classifier prompts are unchanged keep
+    their levels from the previous gallery_data_augmented.json; the classifier
+    script leaves records that already carry levels alone.
+    """
+
+    name = "levels"
+    deps = ("thumbs",)
+    outputs = (AUGMENTED_JSON,)
+
+    def plan(self, runner):
+        from loss_resilience import prompt_fingerprint
+
+        prompts = prompt_fingerprint()
+        records = {entry["image_file"]: _digest(prompts, entry["summary"], entry["caption"])
+                   for entry in _load_json(GALLERY_JSON) or []}
+        previous = {entry["image_file"]: entry for entry in _load_json(AUGMENTED_JSON) or []}
+        changed = set(runner.changed_records(self.name, records))
+        # Records the last run failed to classify are retried too
+        dirty = [key for key in records if key in changed or previous.get(key, {}).get("lossLevel") is None]
+        # Other field changes (e.g. thumbnails) rerun the stage without reclassifying anything
+        fingerprint = _digest(records, file_digest(GALLERY_JSON),
+                              code_version("Generate_loss_resilience_stats_enhanced.py"), runner.stage_args["levels"])
+        return fingerprint, records, dirty
+
+    def command(self, runner, dirty):
+        entries = _load_json(GALLERY_JSON)
+        previous = {entry["image_file"]: entry for entry in _load_json(AUGMENTED_JSON) or []}
+        redo = set(dirty)
+        for entry in entries:
+            kept = previous.get(entry["image_file"])
+            if entry["image_file"] not in redo and kept is not None:
+                entry["lossLevel"] = kept.get("lossLevel")
+                entry["resilienceLevel"] = kept.get("resilienceLevel")
+        with open(LEVELS_INPUT, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+        return [sys.executable, "Generate_loss_resilience_stats_enhanced.py", "--input", LEVELS_INPUT,
+                *runner.stage_args["levels"]]
+
+    def finish(self, runner):
+        if os.path.exists(LEVELS_INPUT):
+            os.remove(LEVELS_INPUT)
+
+
+class ColumnarStage(Stage):
+    name = "columnar"
+    deps = ("levels",)
+    outputs = (PARQUET_PATH, ARROW_PATH)
+
+    def plan(self, runner):
+        fingerprint = _digest(file_digest(AUGMENTED_JSON), code_version("gallery_columnar.py"),
+                              runner.stage_args["columnar"])
+        return fingerprint, {}, ["*"]
+
+    def command(self, runner, dirty):
+        return [sys.executable, "gallery_columnar.py", "export", "--input", AUGMENTED_JSON,
+                *runner.stage_args["columnar"]]
+
+
+class MapStage(Stage):
+    name = "map"
+    deps = ("levels",)
+    outputs = (os.path.join("map_data", "index.json"),)
+
+    def plan(self, runner):
+        fingerprint = _digest(file_digest(AUGMENTED_JSON), code_version("map_tiles.py"), runner.stage_args["map"])
+        return fingerprint, {}, ["*"]
+
+    def command(self, runner, dirty):
+        return [sys.executable, "map_tiles.py", "--input", AUGMENTED_JSON, *runner.stage_args["map"]]
+
+
+class ShardsStage(Stage):
+    name = "shards"
+    deps = ("levels",)
+    outputs = (os.path.join("gallery_shards", "manifest.json"),)
+
+    def plan(self, runner):
+        fingerprint = _digest(file_digest(AUGMENTED_JSON), code_version("gallery_shards.py"),
+                              runner.stage_args["shards"])
+        return fingerprint, {}, ["*"]
+
+    def command(self, runner, dirty):
+        return [sys.executable, "gallery_shards.py", "--input", AUGMENTED_JSON, *runner.stage_args["shards"]]
+
+
+class StatsStage(Stage):
+    name = "stats"
+    deps = ("levels",)
+
+    def plan(self, runner):
+        fingerprint = _digest(file_digest(AUGMENTED_JSON), code_version("Generate_disaster_scene_stats.py"),
+                              runner.stage_args["stats"])
+        return fingerprint, {}, ["*"]
+
+    def command(self, runner, dirty):
+        # The script keeps its own per-figure hashes, so unchanged figures are not redrawn
+        return [sys.executable, "Generate_disaster_scene_stats.py", "--report", *runner.stage_args["stats"]]
+
+
+STAGES = [ScrapeStage(), ClusterStage(), ImageHashStage(), GalleryStage(), ThumbsStage(), LevelsStage(),
+          ColumnarStage(), MapStage(), ShardsStage(), StatsStage()]
+
+
+# ---------------------------
+# Runner
+# ---------------------------
+class PipelineRunner:
+    def __init__(self, stages, stage_args, state_path=STATE_FILE, skip=(), force=(), dry_run=False):
+        self.stages = {stage.name: stage for stage in stages}
+        self.stage_args = stage_args
+        self.state_path = state_path
+        self.skip = set(skip)
+        self.force = set(force)
+        self.dry_run = dry_run
+        self.state = _load_json(state_path) or {}
+        self._lock = threading.Lock()
+
+    def changed_records(self, stage_name, records):
+        """Keys of `records` whose fingerprint differs from the last successful run."""
+        previous = self.state.get(stage_name, {}).get("records", {})
+        return [key for key, fp in records.items() if previous.get(key) != fp]
+
+    def _save(self, stage_name, fingerprint, records):
+        with self._lock:
+            self.state[stage_name] = {"fingerprint": fingerprint, "records": records}
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, indent=1)
+            os.replace(tmp_path, self.state_path)
+
+    def _stream(self, name, argv):
+        env = dict(os.environ, MPLBACKEND="Agg", PYTHONUNBUFFERED="1")
+        process = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env)
+        for line in process.stdout:
+            say(f"[{name}] {line.rstrip()}")
+        return process.wait()
+
+    def run_stage(self, name):
+        """Returns 'skipped', 'up to date', 'would run' (dry run), 'ok' or 'failed'."""
+        stage = self.stages[name]
+        if name in self.skip:
+            return "skipped"
+
+        fingerprint, records, dirty = stage.plan(self)
+        previous = self.state.get(name, {})
+        outputs_exist = all(os.path.exists(path) for path in stage.outputs)
+        if (name not in self.force and fingerprint is not None and previous.get("fingerprint") == fingerprint
+                and outputs_exist and (not dirty or dirty == ["*"])):
+            say(f"✅ {name}: up to date")
+            return "up to date"
+        if records:
+            say(f"🔁 {name}: {len(dirty)}/{len(records)} records changed")
+        if self.dry_run:
+            return "would run"
+
+        argv = stage.command(self, dirty)
+        say(f"▶️ {name}: {shlex.join(argv[1:])}")
+        try:
+            code = self._stream(name, argv)
+        finally:
+            stage.finish(self)
+        if code != 0:
+            say(f"❗ {name} failed with exit code {code}")
+            return "failed"
+        if fingerprint is not None:
+            self._save(name, fingerprint, records)
+        return "ok"
+
+    def run(self, jobs=1):
+        """Runs stages as their dependencies finish, up to `jobs` at a time."""
+        results, running = {}, {}
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            while len(results) < len(self.stages):
+                for name, stage in self.stages.items():
+                    if name in results or name in running:
+                        continue
+                    dep_results = [results.get(dep) for dep in stage.deps if dep in self.stages]
+                    if any(r is None for r in dep_results):
+                        continue
+                    if "failed" in dep_results or "blocked" in dep_results:
+                        results[name] = "blocked"
+                        continue
+                    running[name] = pool.submit(self.run_stage, name)
+                if not running:
+                    continue
+                done, _ = wait(running.values(), return_when=FIRST_COMPLETED)
+                for name in [n for n, future in running.items() if future in done]:
+                    results[name] = running.pop(name).result()
+
+        print("\n📋 Pipeline summary")
+        for name in self.stages:
+            print(f"   {name:<9} {results[name]}")
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the data pipeline, redoing only what changed")
+    parser.add_argument("--jobs", type=int, default=1, help="stages run in parallel when independent")
+    parser.add_argument("--scrape", action="store_true", help="fetch new articles first (network)")
+    parser.add_argument("--force", nargs="*", default=[], choices=[s.name for s in STAGES],
+                        help="rerun these stages even when up to date")
+    parser.add_argument("--skip", nargs="*", default=[], choices=[s.name for s in STAGES])
+    parser.add_argument("--dry-run", action="store_true", help="report what would run without running it")
+    parser.add_argument("--state", default=STATE_FILE)
+    for stage in STAGES:
+        parser.add_argument(f"--{stage.name}-args", default="",
+                            help=f"extra arguments for the {stage.name} stage, e.g. --{stage.name}-args='--flag value'")
+    args = parser.parse_args()
+
+    stage_args = {stage.name: shlex.split(getattr(args, f"{stage.name}_args")) for stage in STAGES}
+    skip = set(args.skip)
+    if not args.scrape:
+        skip.add("scrape")
+    runner = PipelineRunner(STAGES, stage_args, args.state, skip=skip, force=args.force, dry_run=args.dry_run)
+    results = runner.run(jobs=args.jobs)
+    sys.exit(1 if any(r in ("failed", "blocked") for r in results.values()) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+# SQLite (WAL) store of articles, images, annotations and classifications, with JSON/CSV export
+
+import os
+import json
+import time
+import sqlite3
+import argparse
+import threading
+import pandas as pd
+
+from thumbnails import apply_thumbnails, load_manifest, THUMB_DIR
+
+DEFAULT_STORE = "records.sqlite"
+
+ARTICLE_COLUMNS = ("idx", "url", "title", "date", "text_file", "extracted_locations",
+                   "latitude", "longitude", "cluster_id")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    idx INTEGER PRIMARY KEY,
+    url TEXT,
+    title TEXT,
+    date TEXT,
+    text_file TEXT,
+    extracted_locations TEXT,
+    latitude REAL,
+    longitude REAL,
+    cluster_id INTEGER,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_articles_url ON articles (url);
+CREATE INDEX IF NOT EXISTS idx_articles_date ON articles (date);
+
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    idx INTEGER NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_images_idx ON images (idx, position);
+
+-- Every change to an image's annotation is a new version; the latest one is current
+CREATE TABLE IF NOT EXISTS annotations (
+    image_file TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    input_hash TEXT,
+    summary TEXT,
+    sentiment TEXT,
+    caption TEXT,
+    tags TEXT,
+    discrepancy_score REAL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (image_file, version)
+);
+
+CREATE TABLE IF NOT EXISTS classifications (
+    image_file TEXT PRIMARY KEY,
+    loss_level INTEGER,
+    resilience_level INTEGER,
+    source TEXT,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+def _none_if_nan(value):
+    return None if value is None or (isinstance(value, float) and value != value) else value
+
+
+class RecordStore:
+    """
+    One SQLite file in WAL mode, so stages in other processes can read while
+    one writes, and writers wait on each other (busy timeout) rather than
+    failing. Within a process, a lock serializes the shared connection.
+    """
+
+    def __init__(self, path=DEFAULT_STORE, timeout=30):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def _write(self, sql, rows):
+        with self._lock:
+            self._conn.executemany(sql, rows)
+            self._conn.commit()
+
+    # ---------------------------
+    # Articles and Images
+    # ---------------------------
+    def upsert_articles(self, records):
+        """Inserts or updates entry_record.csv-style rows (dicts); image_files fill the images table."""
+        now = time.time()
+        article_rows, image_rows = [], []
+        for record in records:
+            article_rows.append(tuple(_none_if_nan(record.get(c)) for c in ARTICLE_COLUMNS) + (now,))
+            image_files = _none_if_nan(record.get("image_files")) or ""
+            for position, path in enumerate(p.strip() for p in image_files.split(",")):
+                if path:
+                    image_rows.append((path, int(record["idx"]), position))
+        updates = ", ".join(f"{c} = excluded.{c}" for c in ARTICLE_COLUMNS[1:])
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT INTO articles ({', '.join(ARTICLE_COLUMNS)}, updated_at) "
+                f"VALUES ({', '.join('?' * (len(ARTICLE_COLUMNS) + 1))}) "
+                f"ON CONFLICT(idx) DO UPDATE SET {updates}, updated_at = excluded.updated_at",
+                article_rows)
+            self._conn.executemany(
+                "INSERT INTO images (path, idx, position) VALUES (?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET idx = excluded.idx, position = excluded.position",
+                image_rows)
+            self._conn.commit()
+
+    def _articles(self, where="", params=()):
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT {', '.join(ARTICLE_COLUMNS)}, "
+                f"(SELECT group_concat(path, ', ') FROM "
+                f"(SELECT path FROM images i WHERE i.idx = a.idx ORDER BY position)) "
+                f"FROM articles a {where} ORDER BY idx", params)
+            rows = cursor.fetchall()
+        return [dict(zip(ARTICLE_COLUMNS + ("image_files",), row)) for row in rows]
+
+    def article(self, idx):
+        rows = self._articles("WHERE idx = ?", (idx,))
+        return rows[0] if rows else None
+
+    def articles_by_url(self, url):
+        return self._articles("WHERE url = ?", (url,))
+
+    def articles_by_date(self, date):
+        return self._articles("WHERE date = ?", (date,))
+
+    def idx_for_image(self, path):
+        with self._lock:
+            row = self._conn.execute("SELECT idx FROM images WHERE path = ?", (path,)).fetchone()
+        return row[0] if row else None
+
+    def next_idx(self):
+        with self._lock:
+            (max_idx,) = self._conn.execute("SELECT MAX(idx) FROM articles").fetchone()
+        return (max_idx or 0) + 1
+
+    # ---------------------------
+    # Annotations and Classifications
+    # ---------------------------
+    def add_annotations(self, items):
+        """
+        Records (entry, input_hash) gallery entries as new annotation versions
+        of their image_file. An entry identical to the current version is not
+        stored again. Returns the number of new versions.
+        """
+        added = 0
+        now = time.time()
+        with self._lock:
+            for entry, input_hash in items:
+                values = (entry["summary"], entry["sentiment"], entry["caption"],
+                          json.dumps(entry.get("tags", []), ensure_ascii=False), entry.get("discrepancy_score"))
+                current = self._conn.execute(
+                    "SELECT version, summary, sentiment, caption, tags, discrepancy_score FROM annotations "
+                    "WHERE image_file = ? ORDER BY version DESC LIMIT 1", (entry["image_file"],)).fetchone()
+                if current is not None and current[1:] == values:
+                    continue
+                version = current[0] + 1 if current else 1
+                self._conn.execute(
+                    "INSERT INTO annotations (image_file, version, input_hash, summary, sentiment, caption, "
+                    "tags, discrepancy_score, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (entry["image_file"], version, input_hash) + values + (now,))
+                added += 1
+            self._conn.commit()
+        return added
+
+    def annotation_history(self, image_file):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT version, input_hash, summary, sentiment, caption, tags, discrepancy_score, created_at "
+                "FROM annotations WHERE image_file = ? ORDER BY version", (image_file,)).fetchall()
+        keys = ("version", "input_hash", "summary", "sentiment", "caption", "tags", "discrepancy_score", "created_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def set_levels(self, items, source="llm"):
+        """Upserts (image_file, loss_level, resilience_level) classifications."""
+        now = time.time()
+        self._write(
+            "INSERT INTO classifications (image_file, loss_level, resilience_level, source, updated_at) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT(image_file) DO UPDATE SET loss_level = excluded.loss_level, "
+            "resilience_level = excluded.resilience_level, source = excluded.source, "
+            "updated_at = excluded.updated_at",
+            [(image_file, loss, resilience, source, now) for image_file, loss, resilience in items])
+
+    # ---------------------------
+    # Export
+    # ---------------------------
+    def gallery_entries(self, with_levels=False):
+        """Current annotation of every image, in scrape order, shaped like gallery_data.json entries."""
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT a.title, a.url, a.date, a.latitude, a.longitude,
+                       n.image_file, n.summary, n.sentiment, n.caption, n.tags, n.discrepancy_score,
+                       c.loss_level, c.resilience_level
+                FROM annotations n
+                JOIN (SELECT image_file, MAX(version) AS version FROM annotations GROUP BY image_file) latest
+                  ON latest.image_file = n.image_file AND latest.version = n.version
+                JOIN images i ON i.path = n.image_file
+                JOIN articles a ON a.idx = i.idx
+                LEFT JOIN classifications c ON c.image_file = n.image_file
+                ORDER BY i.idx, i.position
+            """).fetchall()
+        entries = []
+        for (title, url, date, lat, lon, image_file, summary, sentiment, caption, tags, score,
+             loss, resilience) in rows:
+            entry = {
+                "image_file": image_file, "title": title, "url": url, "date": date,
+                "latitude": lat, "longitude": lon, "summary": summary, "sentiment": sentiment,
+                "caption": caption, "tags": json.loads(tags) if tags else [], "discrepancy_score": score,
+            }
+            if with_levels:
+                entry["lossLevel"], entry["resilienceLevel"] = loss, resilience
+            entries.append(entry)
+        return entries
+
+    def export(self, gallery_json=None, augmented_json=None, entry_csv=None, thumb_dir=THUMB_DIR):
+        """
+        Writes the files the HTML pages and scripts read. Gallery entries get
+        the srcset fields of the thumbnails in `thumb_dir`, as the generator
+        adds them. Returns the paths written.
+        """
+        written = []
+        manifest = load_manifest(thumb_dir) if gallery_json or augmented_json else {}
+        # Same encoding as the writers of each file: the gallery generator keeps
+        # non-ASCII text as is, the classifier script escapes it
+        for path, with_levels in ((gallery_json, False), (augmented_json, True)):
+            if path:
+                entries = apply_thumbnails(self.gallery_entries(with_levels), manifest)
+                _write_json(path, entries, ensure_ascii=with_levels)
+                written.append(path)
+        if entry_csv:
+            columns = list(ARTICLE_COLUMNS[:5]) + ["image_files"] + list(ARTICLE_COLUMNS[5:])
+            tmp_path = f"{entry_csv}.tmp"
+            pd.DataFrame(self._articles(), columns=columns).to_csv(tmp_path, index=False)
+            os.replace(tmp_path, entry_csv)
+            written.append(entry_csv)
+        return written
+
+    def counts(self):
+        with self._lock:
+            return {table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                    for table in ("articles", "images", "annotations", "classifications")}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _write_json(path, data, ensure_ascii=False):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=ensure_ascii, indent=2)
+    os.replace(tmp_path, path)
+
+
+def import_files(store, entry_csv="entry_record.csv", gallery_json="gallery_data.json",
+                 augmented_json="gallery_data_augmented.json"):
+    """Loads the existing CSV/JSON outputs into the store (idempotent)."""
+    if os.path.exists(entry_csv):
+        store.upsert_articles(pd.read_csv(entry_csv, float_precision="round_trip").to_dict("records"))
+    for path in (gallery_json, augmented_json):
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        entries = [e for e in entries if store.idx_for_image(e["image_file"]) is not None]
+        store.add_annotations([(e, None) for e in entries])
+        levels = [(e["image_file"], e["lossLevel"], e["resilienceLevel"]) for e in entries
+                  if e.get("lossLevel") is not None]
+        if levels:
+            store.set_levels(levels)
+
+
+def add_store_arguments(parser):
+    parser.add_argument("--store", default=None,
+                        help=f"also record results in this SQLite record store (e.g. {DEFAULT_STORE})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import into / export from the SQLite record store")
+    parser.add_argument("command", choices=("import", "export", "stats"))
+    parser.add_argument("--store", default=DEFAULT_STORE)
+    parser.add_argument("--entry-csv", default="entry_record.csv")
+    parser.add_argument("--gallery-json", default="gallery_data.json")
+    parser.add_argument("--augmented-json", default="gallery_data_augmented.json")
+    args = parser.parse_args()
+
+    store = RecordStore(args.store)
+    if args.command == "import":
+        import_files(store, args.entry_csv, args.gallery_json, args.augmented_json)
+        print(f"🗄️ Imported into {args.store}: {store.counts()}")
+    elif args.command == "export":
+        for path in store.export(args.gallery_json, args.augmented_json, args.entry_csv):
+            print(f"📁 Wrote {path}")
+    else:
+        print(f"🗄️ {args.store}: {store.counts()}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
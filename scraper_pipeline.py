@@ -0,0 +1,154 @@
+# Staged producer/consumer ingestion pipeline for MandalayEarthquake_data_scraper.py
+
+import time
+import queue
+import threading
+from datetime import datetime, timedelta
+
+# Sentinel telling a stage worker that its upstream has finished
+_DONE = object()
+
+
+class RateLimiter:
+    """Thread-safe limiter spacing calls at least 1/per_second apart."""
+
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second if per_second else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Stage:
+    """
+    A pool of worker threads applying `func(record)` to items from `in_q`.
+    Results other than None are forwarded to `out_q` (or collected when
+    `out_q` is None); None drops the record.
+    """
+
+    def __init__(self, name, func, in_q, out_q=None, workers=1):
+        self.name = name
+        self.func = func
+        self.in_q = in_q
+        self.out_q = out_q
+        self.workers = workers
+        self.results = []
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+                         for i in range(workers)]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def _run(self):
+        while True:
+            record = self.in_q.get()
+            if record is _DONE:
+                return
+            start_time = time.time()
+            try:
+                result = self.func(record)
+            except Exception as e:
+                print(f"❗ {self.name} failed for article {record.get('idx')}: {e}")
+                result = None
+            with self._lock:
+                self.busy_seconds += time.time() - start_time
+            if result is None:
+                continue
+            if self.out_q is not None:
+                self.out_q.put(result)
+            else:
+                with self._lock:
+                    self.results.append(result)
+
+    def finish(self):
+        """Signals end of input and waits for every worker to drain."""
+        for _ in self._threads:
+            self.in_q.put(_DONE)
+        for thread in self._threads:
+            thread.join()
+
+
+def day_ranges(date_list):
+    for date_str in date_list:
+        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+        yield date_str, (date_obj + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def page_articles(fetch_page, query, date_list, out_q, start_idx=1, limiter=None, page_size=100):
+    """
+    Producer: pages through NewsAPI for every date and queues one record per
+    article, numbered from `start_idx` in discovery order. Returns the
+    number of articles queued per date.
+    """
+    global_idx = start_idx
+    counts = {}
+    for from_date, to_date in day_ranges(date_list):
+        print(f"\n🔍 Searching articles for date: {from_date}")
+        counts[from_date] = 0
+        page = 1
+        while True:
+            if limiter is not None:
+                limiter.wait()
+            news_data = fetch_page(query, from_date, to_date, page)
+            articles = news_data.get("articles") if news_data else None
+            if not articles:
+                break
+            for article in articles:
+                # Blocks when the cleaning stage falls behind (bounded queue)
+                out_q.put({"idx": global_idx, "date": from_date, "article": article,
+                           "start_time": time.time()})
+                counts[from_date] += 1
+                global_idx += 1
+            if len(articles) < page_size:
+                break
+            page += 1
+    return counts
+
+
+def run_pipeline(fetch_page, clean_and_extract, geocode, download_images, query, date_list,
+                 start_idx=1, clean_workers=2, geocode_workers=1, download_workers=8,
+                 newsapi_rate=1.0, queue_size=64):
+    """
+    Runs paging -> cleaning/NER -> geocoding -> image download with one
+    bounded queue between each pair of stages, so the stages overlap instead
+    of adding up per article. Each stage function takes and returns a record
+    dict (None drops it) and applies its own rate limit where it touches the
+    network. Returns the finished records sorted by idx.
+    """
+    clean_q = queue.Queue(maxsize=queue_size)
+    geocode_q = queue.Queue(maxsize=queue_size)
+    download_q = queue.Queue(maxsize=queue_size)
+
+    stages = [
+        Stage("clean/NER", clean_and_extract, clean_q, geocode_q, workers=clean_workers),
+        Stage("geocode", geocode, geocode_q, download_q, workers=geocode_workers),
+        Stage("download", download_images, download_q, None, workers=download_workers),
+    ]
+    for stage in stages:
+        stage.start()
+
+    start_time = time.time()
+    counts = page_articles(fetch_page, query, date_list, clean_q, start_idx=start_idx,
+                           limiter=RateLimiter(newsapi_rate))
+    # Drain stages front to back so each sees its upstream's sentinel last
+    for stage in stages:
+        stage.finish()
+
+    records = sorted(stages[-1].results, key=lambda r: r["idx"])
+    elapsed = time.time() - start_time
+    print(f"\n⏱️ Pipeline finished {len(records)}/{sum(counts.values())} articles in {elapsed:.2f}s")
+    for stage in stages:
+        print(f"   {stage.name:<10} {stage.workers} workers, {stage.busy_seconds:.2f}s busy")
+    return records
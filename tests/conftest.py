@@ -0,0 +1,44 @@
+# Shared fixtures: the scripts are top-level modules of the repository root
+
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+
+@pytest.fixture
+def write_jpeg():
+    """Writes a small distinct JPEG to `path` (colour derived from `seed`)."""
+    from PIL import Image
+
+    def write(path, seed=0, size=(64, 48)):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        colour = ((seed * 67) % 256, (seed * 131) % 256, (seed * 29) % 256)
+        Image.new("RGB", size, colour).save(path, format="JPEG")
+        return path
+
+    return write
+
+
+@pytest.fixture
+def place_ner(monkeypatch):
+    """
+    Makes spacy.load return a blank English pipeline that tags the stand-in
+    corpus' place names (benchmark_pipeline.PLACES) as GPE, so NER results
+    are exact and en_core_web_sm is not needed.
+    """
+    import spacy
+    from benchmark_pipeline import PLACES
+
+    def load(name, **kwargs):
+        nlp = spacy.blank("en")
+        ruler = nlp.add_pipe("entity_ruler")
+        ruler.add_patterns([{"label": "GPE", "pattern": place} for place in PLACES])
+        return nlp
+
+    monkeypatch.setattr(spacy, "load", load)
+    return load
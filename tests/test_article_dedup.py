@@ -0,0 +1,22 @@
+# cluster_id refresh of entry_record.csv
+
+from article_dedup import refresh_clusters
+
+STORY = "A magnitude 7.7 earthquake struck near Mandalay on Friday, toppling pagodas and bridges."
+
+
+def test_refresh_clusters_only_adds_the_column(tmp_path):
+    (tmp_path / "texts").mkdir()
+    for idx, text in ((1, STORY), (2, STORY), (10, "Rescuers in Bangkok searched the collapsed tower.")):
+        (tmp_path / "texts" / f"text_{idx}.txt").write_text(text, encoding="utf-8")
+    rows = ["idx,title,text_file,latitude,longitude",
+            "1,Quake,text_1.txt,26.045475779882622,-109.03306119553015",
+            "10,Tower,text_10.txt,,",
+            "2,Quake copy,text_2.txt,21.9596834,96.0948743"]
+    record_file = tmp_path / "entry_record.csv"
+    record_file.write_text("\n".join(rows) + "\n", encoding="utf-8")
+
+    refresh_clusters(str(record_file), str(tmp_path / "texts"))
+
+    expected = [rows[0] + ",cluster_id", rows[1] + ",1", rows[2] + ",10", rows[3] + ",1"]
+    assert record_file.read_text(encoding="utf-8").splitlines() == expected
@@ -0,0 +1,181 @@
+# Batch API paths of the gallery generator and the classifier, through LocalBatchBackend
+
+import argparse
+import json
+import os
+import re
+
+import pytest
+
+from batch_api import LocalBatchBackend, RESPONSES_URL, CHAT_URL
+from gallery_annotation import upload_data_url, is_complete, FAILED_SUMMARY, FAILED_CAPTION
+from gallery_batch import run_batch, run_structured_batch
+from llm_cache import LLMCache
+from Generate_loss_resilience_stats_enhanced import classify_batch
+
+
+class ReversedBackend(LocalBatchBackend):
+    """The Batch API does not keep input order in its output file; neither does this."""
+
+    def download(self, batch_id, output_path):
+        super().download(batch_id, output_path)
+        with open(output_path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.writelines(reversed(lines))
+
+
+def _responses_body(text):
+    return {"output": [{"type": "message", "content": [{"type": "output_text", "text": text}]}],
+            "model": "gpt-4o-mini", "usage": {"input_tokens": 10, "output_tokens": 5}}
+
+
+def _chat_body(text):
+    return {"choices": [{"index": 0, "message": {"role": "assistant", "content": text}}],
+            "model": "gpt-4o", "usage": {"prompt_tokens": 10, "completion_tokens": 5}}
+
+
+def _title(prompt):
+    return re.search(r"Title: (.*)", prompt).group(1)
+
+
+class Responder:
+    """Answers derived from each request, failing the first request that mentions `fail_once`."""
+
+    def __init__(self, captions, fail_once=None):
+        self.captions = captions
+        self.fail_once = fail_once
+        self.requests = []
+
+    def __call__(self, url, body):
+        self.requests.append((url, body))
+        if self.fail_once and self.fail_once in json.dumps(body):
+            self.fail_once = None
+            raise RuntimeError("server_error")
+        if url == RESPONSES_URL:
+            if "sentiment" in body["instructions"]:
+                return _responses_body(f"**Hopeful** - {body['input'].rsplit('Summary: ', 1)[1]}")
+            return _responses_body(f"**News Summary:** {_title(body['input'])}")
+        assert url == CHAT_URL
+        content = body["messages"][-1]["content"]
+        data_url = content[1]["image_url"]["url"]
+        if body.get("response_format"):
+            return _chat_body(json.dumps({
+                "summary": _title(content[0]["text"]), "sentiment": "Concerned",
+                "caption": self.captions[data_url], "tags": ["Debris"], "loss_level": 2, "resilience_level": 1}))
+        return _chat_body(f"{self.captions[data_url]}\n\nRelevant Tags: [Debris, Rescue]")
+
+
+@pytest.fixture
+def tasks(tmp_path, write_jpeg):
+    tasks = []
+    for i in range(5):
+        text_path = tmp_path / f"{i}.txt"
+        text_path.write_text(f"Article {i}", encoding="utf-8")
+        tasks.append({"idx": i + 1, "text_path": str(text_path),
+                      "image_path": write_jpeg(str(tmp_path / f"{i}.jpg"), seed=i),
+                      "title": f"Title {i}", "url": f"https://news.example/{i}", "date": "2025-03-29",
+                      "latitude": None, "longitude": None})
+    return tasks
+
+
+def _captions(tasks):
+    return {upload_data_url(task): f"(Damage) caption {task['idx']}" for task in tasks}
+
+
+def test_run_batch_round_trips_custom_ids_and_retries_failures(tasks, tmp_path):
+    cache = LLMCache(":memory:")
+    workdir = str(tmp_path / "batch")
+    responder = Responder(_captions(tasks), fail_once="Title 2")
+    entries = run_batch(tasks, ReversedBackend(responder, workdir), cache=cache, workdir=workdir, poll_interval=0)
+
+    with open(os.path.join(workdir, "gallery_summary_requests.jsonl"), encoding="utf-8") as f:
+        custom_ids = [json.loads(line)["custom_id"] for line in f]
+    assert custom_ids == [f"idx-{task['idx']}-summary" for task in tasks]
+
+    # Results are matched by custom_id, not by position in the output file
+    assert [entry["image_file"] for entry in entries] == [task["image_path"] for task in tasks]
+    for task, entry in zip(tasks, entries):
+        if task["title"] == "Title 2":
+            assert entry["summary"] == FAILED_SUMMARY
+            assert entry["caption"] == f"(Damage) caption {task['idx']}\n\nRelevant Tags: [Debris, Rescue]"
+            continue
+        assert entry["summary"] == f"**News Summary:** {task['title']}"
+        assert entry["sentiment"] == f"**Hopeful** - **News Summary:** {task['title']}"
+        assert entry["caption"].startswith(f"(Damage) caption {task['idx']}")
+        assert entry["tags"] == ["Debris", "Rescue"]
+    # One summary and caption per task, then sentiment for the four summaries that came back
+    assert len(responder.requests) == 5 + 5 + 4
+
+    # Rerun: the failed entry's summary and sentiment are the only requests sent again
+    responder.requests.clear()
+    entries = run_batch(tasks, ReversedBackend(responder, workdir), cache=cache, workdir=workdir, poll_interval=0)
+    assert all(is_complete(entry) for entry in entries)
+    assert entries[2]["summary"] == "**News Summary:** Title 2"
+    assert [url for url, _ in responder.requests] == [RESPONSES_URL, RESPONSES_URL]
+
+
+def test_run_structured_batch_failures_are_retried(tasks, tmp_path):
+    cache = LLMCache(":memory:")
+    workdir = str(tmp_path / "batch")
+    captions = _captions(tasks)
+    responder = Responder(captions, fail_once=list(captions)[3])
+    entries = run_structured_batch(tasks, ReversedBackend(responder, workdir), cache=cache, workdir=workdir,
+                                   poll_interval=0)
+    assert [entry["image_file"] for entry in entries] == [task["image_path"] for task in tasks]
+    assert [entry["caption"] for entry in entries] == \
+        [FAILED_CAPTION if i == 3 else f"(Damage) caption {i + 1}" for i in range(5)]
+    assert entries[0]["lossLevel"] == 2 and entries[0]["resilienceLevel"] == 1
+
+    responder.requests.clear()
+    entries = run_structured_batch(tasks, ReversedBackend(responder, workdir), cache=cache, workdir=workdir,
+                                   poll_interval=0)
+    assert len(responder.requests) == 1
+    assert entries[3]["summary"] == "Title 3"
+    assert all(is_complete(entry) for entry in entries)
+
+
+def test_classify_batch_failures_are_retried(tmp_path):
+    def answer(url, body):
+        calls.append(body)
+        prompt = body["messages"][0]["content"]
+        if "summary 1" in prompt and not failed:
+            failed.append(body)
+            raise RuntimeError("server_error")
+        level = int(re.search(r"summary (\d)", prompt).group(1)) % 3 + 1
+        return _chat_body(f"Loss Level: {level}\nResilience Level: {4 - level}")
+
+    calls, failed = [], []
+    cache = LLMCache(":memory:")
+    workdir = str(tmp_path / "batch")
+    data = [{"summary": f"summary {i}", "caption": f"caption {i}"} for i in range(4)]
+    classify_batch(ReversedBackend(answer, workdir), data, cache, workdir=workdir, poll_interval=0)
+    assert [(item["lossLevel"], item["resilienceLevel"]) for item in data] == \
+        [(1, 3), (None, None), (3, 1), (1, 3)]
+
+    calls.clear()
+    classify_batch(ReversedBackend(answer, workdir), data, cache, workdir=workdir, poll_interval=0)
+    assert len(calls) == 1
+    assert (data[1]["lossLevel"], data[1]["resilienceLevel"]) == (2, 2)
+
+
+def test_classify_records_chunks_keep_their_own_ids_and_files(tmp_path, monkeypatch):
+    import Generate_loss_resilience_stats_enhanced as classifier
+
+    def answer(url, body):
+        return _chat_body("Loss Level: 2\nResilience Level: 3")
+
+    workdir = str(tmp_path / "batch")
+    monkeypatch.setattr(classifier, "OpenAIBatchBackend", lambda client: ReversedBackend(answer, workdir))
+    args = argparse.Namespace(batch=True, batch_dir=workdir, poll_interval=0, reclassify=False)
+    # Records 1-3 and 4-6 of the input; the second record of each chunk already has levels
+    for start in (0, 3):
+        chunk = [{"image_file": f"images/image_{start + i + 1}_1.jpg", "summary": f"summary {start + i}",
+                  "caption": ""} for i in range(3)]
+        chunk[1].update(lossLevel=1, resilienceLevel=1)
+        classifier.classify_records(chunk, args, client=None, start=start)
+        assert [(item["lossLevel"], item["resilienceLevel"]) for item in chunk] == [(2, 3), (1, 1), (2, 3)]
+
+    for first, ids in ((1, ["record-1-levels", "record-3-levels"]), (4, ["record-4-levels", "record-6-levels"])):
+        with open(os.path.join(workdir, f"loss_resilience_{first}_requests.jsonl"), encoding="utf-8") as f:
+            assert [json.loads(line)["custom_id"] for line in f] == ids
@@ -0,0 +1,75 @@
+# Async annotation engine against the local OpenAI stand-in of benchmark_pipeline
+
+import asyncio
+import types
+
+import gallery_async
+from gallery_async import AdaptiveRateLimiter, annotate_all
+from gallery_annotation import is_complete
+from benchmark_pipeline import MockServices
+
+
+def _tasks(tmp_path, write_jpeg, n):
+    tasks = []
+    for i in range(n):
+        text_path = tmp_path / f"{i}.txt"
+        text_path.write_text(f"Article {i} about the Mandalay earthquake.", encoding="utf-8")
+        tasks.append({
+            "idx": i + 1,
+            "text_path": str(text_path),
+            "image_path": write_jpeg(str(tmp_path / f"{i}.jpg"), seed=i),
+            "title": f"Title {i}",
+            "url": f"https://news.example/{i}",
+            "date": "2025-03-29",
+            "latitude": 21.97,
+            "longitude": 96.08,
+        })
+    return tasks
+
+
+def test_annotate_all_keeps_task_order_and_retries_429(tmp_path, write_jpeg, monkeypatch):
+    rate_limited = []
+    on_rate_limited = AdaptiveRateLimiter.on_rate_limited
+    monkeypatch.setattr(AdaptiveRateLimiter, "on_rate_limited",
+                        lambda self: (rate_limited.append(1), on_rate_limited(self))[1])
+    tasks = _tasks(tmp_path, write_jpeg, 12)
+    finished = []
+
+    with MockServices(0, rate_limit={"openai": 0.25}, seed=1) as services:
+        entries = asyncio.run(annotate_all(
+            tasks, concurrency=6, api_key="test", base_url=f"http://{services.address}/v1",
+            on_entry=lambda task, entry: finished.append((task["idx"], entry))))
+        statuses = [status for service, status, _ in services.take_timings()]
+
+    assert [entry["image_file"] for entry in entries] == [task["image_path"] for task in tasks]
+    assert all(is_complete(entry) for entry in entries)
+    assert entries[0]["summary"].startswith("**News Summary:**")
+    assert sorted(idx for idx, _ in finished) == [task["idx"] for task in tasks]
+    assert {idx: entry["image_file"] for idx, entry in finished} == {t["idx"]: t["image_path"] for t in tasks}
+    assert 429 in statuses
+    assert len(rate_limited) == statuses.count(429)
+    # Every 429 was retried: one successful call per summary, sentiment and caption
+    assert statuses.count(200) == 3 * len(tasks)
+
+
+def test_acquire_returns_when_bucket_shrinks_while_waiting(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(gallery_async, "time", types.SimpleNamespace(monotonic=lambda: clock[0]))
+    limiter = AdaptiveRateLimiter(rpm=60, tpm=1000)
+    limiter._tokens = 0
+    real_sleep = asyncio.sleep
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+        assert len(sleeps) < 50, "acquire() never returned"
+        if len(sleeps) == 1:
+            # A 429 elsewhere halves the budget below the waiting request's size
+            limiter.on_rate_limited()
+        clock[0] += seconds
+        await real_sleep(0)
+
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+    asyncio.run(limiter.acquire(1000))
+    assert limiter.tpm == 500
+    assert len(sleeps) == 1
@@ -0,0 +1,48 @@
+# Resume decisions of the gallery journal when the upload settings change
+
+import pandas as pd
+
+import Generate_gallerydata_enhanced as gallery
+from gallery_journal import GalleryJournal, pending_tasks
+
+
+def _write_inputs(tmp_path, write_jpeg):
+    (tmp_path / "texts").mkdir()
+    rows = []
+    for idx in (1, 2):
+        (tmp_path / "texts" / f"text_{idx}.txt").write_text(f"Article {idx} about Mandalay.", encoding="utf-8")
+        # The same picture twice: the second entry is captioned via the first
+        write_jpeg(str(tmp_path / "images" / f"image_{idx}_1.jpg"), seed=7)
+        rows.append({"idx": idx, "url": f"https://news.example/{idx}", "title": f"Story {idx}",
+                     "date": "2025-03-28", "text_file": f"text_{idx}.txt",
+                     "image_files": f"images/image_{idx}_1.jpg", "latitude": 21.96, "longitude": 96.09})
+    pd.DataFrame(rows).to_csv(tmp_path / "entry_record.csv", index=False)
+
+
+def _journal_all(tasks, path):
+    journal = GalleryJournal(path)
+    journal.open(resume=False)
+    for task in tasks:
+        journal.append(task, {"summary": "**News Summary:** Walls fell.", "caption": "(Damage) Rubble."})
+    journal.close()
+    return journal.load()
+
+
+def _pending(*argv):
+    tasks = gallery.prepare_tasks(gallery.parse_args(["--preprocess-workers", "1", *argv]))
+    return [task["idx"] for task in pending_tasks(tasks, GalleryJournal("journal.jsonl").load())]
+
+
+def test_resume_redoes_entries_when_upload_settings_change(tmp_path, monkeypatch, write_jpeg):
+    monkeypatch.chdir(tmp_path)
+    _write_inputs(tmp_path, write_jpeg)
+    tasks = gallery.prepare_tasks(gallery.parse_args(["--preprocess-workers", "1", "--max-edge", "1024"]))
+    assert tasks[1]["caption_source"] == tasks[0]["image_path"]
+    _journal_all(tasks, "journal.jsonl")
+
+    assert _pending("--max-edge", "1024") == []
+    assert _pending("--max-edge", "512") == [1, 2]
+    assert _pending("--jpeg-quality", "60") == [1, 2]
+    assert _pending("--no-preprocess") == [1, 2]
+    # Without grouping only the copy is captioned from a different image
+    assert _pending("--no-image-dedup") == [2]
@@ -0,0 +1,44 @@
+# Streaming gallery writer/reader, with and without orjson
+
+import json
+import math
+
+import pytest
+
+import gallery_stream
+from gallery_stream import RecordWriter, iter_records
+
+RECORDS = [
+    {"image_file": "images/image_1_1.jpg", "title": "Mandalay — ရန်ကုန်", "latitude": 21.96, "longitude": 96.09,
+     "tags": ["Debris"], "discrepancy_score": 0.25},
+    # pandas leaves NaN coordinates for articles without a geocoded place
+    {"image_file": "images/image_2_1.jpg", "title": "Bangkok", "latitude": float("nan"),
+     "longitude": float("nan"), "tags": [], "discrepancy_score": None},
+]
+
+
+@pytest.fixture(params=["orjson", "json"])
+def backend(request, monkeypatch):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(gallery_stream, "orjson", None)
+    return request.param
+
+
+@pytest.mark.parametrize("name", ["gallery.json", "gallery.jsonl"])
+def test_writer_matches_json_and_keeps_nan(tmp_path, backend, name):
+    path = str(tmp_path / name)
+    with RecordWriter(path) as writer:
+        writer.write_many(RECORDS)
+
+    if name.endswith(".jsonl"):
+        expected = "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in RECORDS)
+    else:
+        expected = json.dumps(RECORDS, ensure_ascii=False, indent=2)
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == expected
+
+    records = list(iter_records(path))
+    assert records[0] == RECORDS[0]
+    assert math.isnan(records[1]["latitude"]) and math.isnan(records[1]["longitude"])
@@ -0,0 +1,29 @@
+# Near-duplicate grouping of images by perceptual hash
+
+from PIL import Image, ImageFilter
+
+from image_dedup import group_near_duplicates, phash, dhash, DEFAULT_THRESHOLD
+
+
+def test_chains_do_not_merge_distant_images():
+    # a~b and b~c are 6 bits apart, a and c 12
+    a, b, c = 0, (1 << 6) - 1, (1 << 12) - 1
+    groups = group_near_duplicates({"a": (a, a), "b": (b, b), "c": (c, c)}, threshold=8)
+    assert groups == {"a": "a", "b": "a", "c": "c"}
+
+
+def test_close_phash_with_distant_dhash_is_not_a_duplicate():
+    hashes = {"a": (0, 0), "b": (1, (1 << 20) - 1)}
+    assert group_near_duplicates(hashes, threshold=8) == {"a": "a", "b": "b"}
+
+
+def test_resized_copy_shares_group_with_its_source():
+    # A detailed image, a resized blurred copy of it, and an unrelated image
+    original = Image.effect_mandelbrot((320, 240), (-2, -1.2, 1, 1.2), 60).convert("RGB")
+    copy = original.resize((200, 150)).filter(ImageFilter.GaussianBlur(1))
+    other = original.transpose(Image.Transpose.ROTATE_180)
+    hashes = {name: (phash(img), dhash(img)) for name, img in
+              (("original", original), ("copy", copy), ("other", other))}
+    groups = group_near_duplicates(hashes, DEFAULT_THRESHOLD)
+    assert groups["copy"] == "original"
+    assert groups["other"] == "other"
@@ -0,0 +1,83 @@
+# Run metrics: opt-in JSONL, span errors and token costs
+
+import argparse
+import json
+
+import pytest
+
+import instrumentation
+from instrumentation import Metrics, add_metrics_arguments, metrics_from_args
+
+
+def _args(*argv):
+    parser = argparse.ArgumentParser()
+    add_metrics_arguments(parser)
+    return parser.parse_args(argv)
+
+
+@pytest.fixture(autouse=True)
+def restore_current():
+    current = instrumentation.current()
+    yield
+    instrumentation._current = current
+
+
+def test_metrics_are_opt_in(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    metrics = metrics_from_args(_args(), "test")
+    with instrumentation.span("stage"):
+        pass
+    metrics.report()
+    assert metrics.spans["stage"]
+    assert list(tmp_path.iterdir()) == []
+    assert capsys.readouterr().out == ""
+
+    metrics = metrics_from_args(_args("--metrics", "run.jsonl"), "test")
+    with instrumentation.span("stage"):
+        pass
+    metrics.report()
+    metrics.close()
+    events = [json.loads(line) for line in (tmp_path / "run.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert [event["type"] for event in events] == ["span", "summary"]
+    assert "Run metrics (test" in capsys.readouterr().out
+
+
+def test_batch_usage_is_priced_at_the_discount():
+    metrics = Metrics()
+    usage = {"model": "gpt-4o-mini", "usage": {"prompt_tokens": 1_000_000, "completion_tokens": 1_000_000}}
+    metrics.record_usage(usage)
+    metrics.record_usage(usage, batch=True)
+    tokens = metrics.summary()["tokens"]["gpt-4o-mini"]
+    assert tokens["calls"] == 2
+    assert tokens["cost_usd"] == pytest.approx((0.15 + 0.60) * 1.5)
+
+
+class _Tracer:
+    """Records what start_as_current_span(...).__exit__ receives, like the OpenTelemetry API."""
+
+    def __init__(self):
+        self.exits = []
+
+    def start_as_current_span(self, name, attributes=None):
+        tracer = self
+
+        class Span:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                tracer.exits.append((name, exc_info[0]))
+                return False
+
+        return Span()
+
+
+def test_span_passes_exceptions_to_the_otel_span():
+    metrics = Metrics()
+    metrics._tracer = _Tracer()
+    with metrics.span("ok"):
+        pass
+    with pytest.raises(KeyError):
+        with metrics.span("failing"):
+            raise KeyError("x")
+    assert metrics._tracer.exits == [("ok", None), ("failing", KeyError)]
@@ -0,0 +1,50 @@
+# Multi-entry loss/resilience classification against a local chat.completions stand-in
+
+import json
+
+from benchmark_pipeline import MockServices
+from llm_cache import LLMCache
+from loss_resilience import run_classify_multi, parse_multi_levels
+
+
+class ClassifierStandIn(MockServices):
+    """Answers with quoted ids and leaves out item 2 whenever it is asked along with others."""
+
+    def __init__(self):
+        super().__init__(0)
+        self.requests = []
+
+    def _openai(self, path, body):
+        content = body["messages"][-1]["content"]
+        items = json.loads(content.split("--- ITEMS ---\n", 1)[1].split("\n\n", 1)[0])
+        ids = [item["id"] for item in items]
+        self.requests.append(ids)
+        rows = [{"id": str(item_id), "loss": item_id % 3 + 1, "resilience": 3 - item_id % 3}
+                for item_id in ids if item_id != 2 or len(ids) == 1]
+        return {"id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": json.dumps({"items": rows})}}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120}}
+
+
+def test_parse_multi_levels_accepts_quoted_ids():
+    content = json.dumps({"items": [{"id": "3", "loss": 2, "resilience": "1"}, {"id": "x", "loss": 1}]})
+    assert parse_multi_levels(content, [3, 4]) == {3: (2, 1)}
+
+
+def test_only_complete_answers_are_cached_and_retries_are_reused():
+    items = [(i, f"summary {i}", f"caption {i}") for i in range(1, 7)]
+    expected = {i: (i % 3 + 1, 3 - i % 3) for i in range(1, 7)}
+    cache = LLMCache(":memory:")
+
+    with ClassifierStandIn() as services:
+        kwargs = dict(items_per_request=3, api_key="test", base_url=f"http://{services.address}/v1", cache=cache)
+        assert run_classify_multi(items, **kwargs) == expected
+        assert sorted(services.requests) == [[1, 2, 3], [2], [4, 5, 6]]
+        # The incomplete answer for 1..3 is not stored
+        assert cache.stats()["entries"] == 2
+
+        services.requests.clear()
+        assert run_classify_multi(items, **kwargs) == expected
+        # Only the request that came back incomplete goes out again; item 2's retry is a cache hit
+        assert services.requests == [[1, 2, 3]]
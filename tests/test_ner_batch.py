@@ -0,0 +1,49 @@
+# Offline re-extraction of extracted_locations in entry_record.csv
+
+import pandas as pd
+
+from ner_batch import refresh_entry_record
+
+
+def _write_record(tmp_path):
+    texts = tmp_path / "texts"
+    texts.mkdir()
+    (texts / "text_1.txt").write_text("Rescuers in Mandalay searched a monastery near Sagaing.", encoding="utf-8")
+    (texts / "text_2.txt").write_text("Yangon hospitals took in people from Bago.", encoding="utf-8")
+    record_file = tmp_path / "entry_record.csv"
+    pd.DataFrame([
+        # Set order put Sagaing first
+        {"idx": 1, "text_file": "text_1.txt", "extracted_locations": "Sagaing, Mandalay",
+         "latitude": 21.8787, "longitude": 95.9797},
+        {"idx": 2, "text_file": "text_2.txt", "extracted_locations": "Yangon",
+         "latitude": 16.7967, "longitude": 96.1610},
+    ]).to_csv(record_file, index=False)
+    return record_file
+
+
+def test_refresh_regeocodes_rows_whose_first_location_changed(tmp_path, place_ner):
+    record_file = _write_record(tmp_path)
+    looked_up = []
+
+    def geocoder(name):
+        looked_up.append(name)
+        return (21.9597, 96.0949)
+
+    changed, regeocoded = refresh_entry_record(str(record_file), str(tmp_path / "texts"), geocoder=geocoder)
+    df = pd.read_csv(record_file)
+
+    assert list(df["extracted_locations"]) == ["Mandalay, Sagaing", "Yangon, Bago"]
+    assert (changed, regeocoded) == (2, 1)
+    assert looked_up == ["Mandalay"]
+    assert (df.loc[0, "latitude"], df.loc[0, "longitude"]) == (21.9597, 96.0949)
+    # Same first location: coordinates untouched
+    assert (df.loc[1, "latitude"], df.loc[1, "longitude"]) == (16.7967, 96.1610)
+
+
+def test_refresh_without_geocoder_keeps_coordinates(tmp_path, place_ner, capsys):
+    record_file = _write_record(tmp_path)
+    assert refresh_entry_record(str(record_file), str(tmp_path / "texts")) == (2, 0)
+    df = pd.read_csv(record_file)
+    assert df.loc[0, "extracted_locations"] == "Mandalay, Sagaing"
+    assert df.loc[0, "latitude"] == 21.8787
+    assert "1 rows now name a different first location" in capsys.readouterr().out
@@ -0,0 +1,58 @@
+# Import/export round trip of the SQLite record store
+
+import json
+
+import pandas as pd
+
+from record_store import RecordStore, import_files
+from thumbnails import save_manifest, apply_thumbnails
+
+
+def _write_inputs(tmp_path):
+    pd.DataFrame([
+        {"idx": 1, "url": "https://news.example/1", "title": "Mandalay — ရန်ကုန် quake", "date": "2025-03-28",
+         "text_file": "text_1.txt", "image_files": "images/image_1_1.jpg", "extracted_locations": "Mandalay",
+         "latitude": 21.9596834, "longitude": 96.0948743, "cluster_id": 1},
+        {"idx": 2, "url": "https://news.example/2", "title": "Bangkok tower", "date": "2025-03-29",
+         "text_file": "text_2.txt", "image_files": "images/image_2_1.jpg, images/image_2_2.jpg",
+         "extracted_locations": "", "latitude": None, "longitude": None, "cluster_id": 2},
+    ]).to_csv(tmp_path / "entry_record.csv", index=False)
+    entries = []
+    for idx, image_file in ((1, "images/image_1_1.jpg"), (2, "images/image_2_1.jpg"), (2, "images/image_2_2.jpg")):
+        entries.append({"image_file": image_file, "title": "Mandalay — ရန်ကုန် quake" if idx == 1 else "Bangkok tower",
+                        "url": f"https://news.example/{idx}", "date": "2025-03-28" if idx == 1 else "2025-03-29",
+                        "latitude": 21.9596834 if idx == 1 else None, "longitude": 96.0948743 if idx == 1 else None,
+                        "summary": "**News Summary:** Monks’ quarters collapsed.", "sentiment": "Tragic",
+                        "caption": "(Damage) Rubble.", "tags": ["Debris"], "discrepancy_score": 0.42})
+    # Only the first image has thumbnails (thumbnails.py manifest)
+    (tmp_path / "thumbs").mkdir()
+    manifest = {"images/image_1_1.jpg": {"width": 768, "height": 512, "jpeg": "thumbs/image_1_1_320.jpg",
+                                         "webp": [[320, "thumbs/image_1_1_320.webp"]]}}
+    save_manifest(manifest, str(tmp_path / "thumbs"))
+    apply_thumbnails(entries, manifest)
+    # Writers of the two files: the gallery generator keeps UTF-8, the classifier escapes it
+    with open(tmp_path / "gallery_data.json", "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False, indent=2)
+    augmented = [dict(entry, lossLevel=3, resilienceLevel=1) for entry in entries]
+    # gallery_data_augmented.json has the thumbnail fields after the levels
+    for entry, original in zip(augmented, entries):
+        for key in ("thumbnail", "srcset", "srcset_jpeg", "width", "height"):
+            if key in original:
+                entry[key] = entry.pop(key)
+    with open(tmp_path / "gallery_data_augmented.json", "w", encoding="utf-8") as f:
+        json.dump(augmented, f, indent=2)
+
+
+def test_export_reproduces_imported_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write_inputs(tmp_path)
+    store = RecordStore(str(tmp_path / "records.sqlite"))
+    import_files(store)
+    written = store.export("gallery_out.json", "augmented_out.json", "entry_out.csv")
+    store.close()
+
+    assert written == ["gallery_out.json", "augmented_out.json", "entry_out.csv"]
+    for original, exported in (("gallery_data.json", "gallery_out.json"),
+                               ("gallery_data_augmented.json", "augmented_out.json"),
+                               ("entry_record.csv", "entry_out.csv")):
+        assert (tmp_path / exported).read_bytes() == (tmp_path / original).read_bytes(), exported
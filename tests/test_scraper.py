@@ -0,0 +1,115 @@
+# MandalayEarthquake_data_scraper end to end against local NewsAPI, Nominatim and image servers
+
+import importlib
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+from benchmark_pipeline import MockServices, DATES
+from scraper_pipeline import run_pipeline
+
+CORPUS_SIZE = 10
+
+
+@pytest.fixture
+def services():
+    with MockServices(CORPUS_SIZE, seed=3) as services:
+        yield services
+
+
+@pytest.fixture
+def run_scraper(services, place_ner, tmp_path, monkeypatch):
+    """Runs the scraper's main() in tmp_path with the stand-ins' addresses."""
+    for key, value in services.env().items():
+        monkeypatch.setenv(key, value)
+    # Endpoints and the spaCy model are read at import
+    monkeypatch.delitem(sys.modules, "MandalayEarthquake_data_scraper", raising=False)
+    scraper = importlib.import_module("MandalayEarthquake_data_scraper")
+    monkeypatch.delitem(sys.modules, "MandalayEarthquake_data_scraper")
+    monkeypatch.chdir(tmp_path)
+
+    def run(*argv):
+        monkeypatch.setattr(sys, "argv", ["MandalayEarthquake_data_scraper.py", "--no-gazetteer",
+                                          "--geocode-rate", "0", "--newsapi-rate", "0", *argv])
+        scraper.main()
+        return pd.read_csv("entry_record.csv")
+
+    return run
+
+
+def _coords(services, place):
+    answer = services._geocode(place)[0]
+    return float(answer["lat"]), float(answer["lon"])
+
+
+def test_scraper_records_texts_locations_and_images(services, run_scraper, tmp_path):
+    df = run_scraper()
+
+    assert list(df["idx"]) == list(range(1, CORPUS_SIZE + 1))
+    assert set(df["date"]) == set(DATES)
+    for row in df.itertuples():
+        article = services._article(row.idx - 1)
+        assert row.url == article["url"]
+        assert row.title == article["title"]
+        with open(tmp_path / "texts" / row.text_file, encoding="utf-8") as f:
+            assert f.read().startswith(article["title"])
+
+        # The title names the first place, which is the one geocoded
+        place = article["title"].split(" earthquake:")[0]
+        assert row.extracted_locations.split(", ")[0] == place
+        assert (row.latitude, row.longitude) == pytest.approx(_coords(services, place))
+
+        assert row.image_files == f"images/image_{row.idx}_1.jpg"
+        with open(tmp_path / row.image_files, "rb") as f:
+            assert f.read() == services._image(f"/img/{row.idx - 1}.jpg")
+
+
+def test_rerun_continues_idx_without_overwriting_texts(run_scraper, tmp_path):
+    first = run_scraper()
+    texts = {name: (tmp_path / "texts" / name).read_text(encoding="utf-8") for name in first["text_file"]}
+
+    df = run_scraper()
+    assert list(df["idx"]) == list(range(1, 2 * CORPUS_SIZE + 1))
+    assert {name: (tmp_path / "texts" / name).read_text(encoding="utf-8") for name in first["text_file"]} == texts
+    assert os.path.exists(tmp_path / "texts" / f"text_{2 * CORPUS_SIZE}.txt")
+    # The second copy of every story joins the cluster of the first
+    assert list(df["cluster_id"][CORPUS_SIZE:]) == list(first["idx"])
+
+
+@pytest.mark.parametrize("failing", [{"error_rate": {"nominatim": 1.0}}, {"rate_limit": {"images": 1.0}}])
+def test_failing_service_leaves_other_stages_running(failing, services, run_scraper, tmp_path):
+    for attribute, rates in failing.items():
+        getattr(services, attribute).update(rates)
+    df = run_scraper()
+
+    assert list(df["idx"]) == list(range(1, CORPUS_SIZE + 1))
+    assert all(os.path.exists(tmp_path / "texts" / name) for name in df["text_file"])
+    assert df["extracted_locations"].str.len().gt(0).all()
+    if "nominatim" in failing.get("error_rate", {}):
+        assert df["latitude"].isna().all() and df["longitude"].isna().all()
+        assert all(os.path.exists(tmp_path / path) for path in df["image_files"])
+    else:
+        assert df["image_files"].isna().all()
+        assert df["latitude"].notna().all()
+
+
+def test_pipeline_drops_only_the_failing_record():
+    def fetch_page(query, from_date, to_date, page):
+        return {"articles": [{"n": i} for i in range(3)]} if page == 1 and from_date == DATES[0] else None
+
+    def clean(record):
+        return record
+
+    def geocode(record):
+        if record["idx"] == 6:
+            raise IOError("status code 500")
+        return record
+
+    def download(record):
+        return {"idx": record["idx"], "date": record["date"]}
+
+    records = run_pipeline(fetch_page, clean, geocode, download, "query", list(DATES), start_idx=5,
+                           newsapi_rate=0)
+    assert [record["idx"] for record in records] == [5, 7]
@@ -0,0 +1,25 @@
+# Incremental thumbnail builds
+
+import os
+
+from thumbnails import build_thumbnails, load_manifest
+
+
+def test_manifest_is_independent_of_file_times(tmp_path, write_jpeg, capsys):
+    images = [write_jpeg(str(tmp_path / "images" / f"image_{i}_1.jpg"), seed=i, size=(800, 600)) for i in range(3)]
+    thumb_dir = str(tmp_path / "thumbs")
+    build_thumbnails(images, thumb_dir=thumb_dir, workers=1)
+    manifest = load_manifest(thumb_dir)
+    assert all(set(meta) == {"hash", "settings", "width", "height", "webp", "jpeg"} for meta in manifest.values())
+
+    # Same content with a new mtime (e.g. a fresh checkout): rehashed, not re-rendered, manifest unchanged
+    os.utime(images[0], (1, 1))
+    capsys.readouterr()
+    build_thumbnails(images, thumb_dir=thumb_dir, workers=1)
+    assert "0 images rendered, 1 rehashed unchanged, 2 untouched" in capsys.readouterr().out
+    assert load_manifest(thumb_dir) == manifest
+
+    write_jpeg(images[1], seed=9, size=(800, 600))
+    build_thumbnails(images, thumb_dir=thumb_dir, workers=1)
+    assert "1 images rendered" in capsys.readouterr().out
+    assert load_manifest(thumb_dir)[images[1]]["hash"] != manifest[images[1]]["hash"]
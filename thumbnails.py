@@ -0,0 +1,197 @@
+# Multi-resolution WebP/JPEG thumbnails of the gallery images, with srcset fields for gallery_data.json
+
+import os
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
+
+from gallery_stream import iter_records, RecordWriter
+
+GALLERY_JSON = "gallery_data.json"
+THUMB_DIR = "thumbs"
+MANIFEST_NAME = "manifest.json"
+# Local (gitignored) size/mtime of each source image, so unchanged images are
+# not even read; kept out of the manifest, which is committed with thumbs/
+STAT_CACHE_NAME = ".stat_cache.json"
+DEFAULT_WIDTHS = (320, 640)
+WEBP_QUALITY = 75
+JPEG_QUALITY = 80
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _settings(widths, webp_quality, jpeg_quality):
+    return {"widths": sorted(widths), "webp_quality": webp_quality, "jpeg_quality": jpeg_quality}
+
+
+def _outputs(meta):
+    return [path for _, path in meta["webp"]] + ([meta["jpeg"]] if meta["jpeg"] else [])
+
+
+def render_thumbnails(image_path, widths=DEFAULT_WIDTHS, thumb_dir=THUMB_DIR, webp_quality=WEBP_QUALITY,
+                      jpeg_quality=JPEG_QUALITY):
+    """
+    Writes a WebP per width narrower than the image, plus a progressive JPEG
+    at the smallest width for browsers without WebP. The original stays the
+    largest candidate, so nothing is upscaled or re-encoded at full size.
+    Returns {"width", "height", "webp": [[width, path], ...], "jpeg": path or None}.
+    """
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    with Image.open(image_path) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        width, height = img.size
+        webp, jpeg = [], None
+        for target in sorted(w for w in widths if w < width):
+            resized = img.resize((target, max(1, round(height * target / width))), Image.LANCZOS)
+            webp_path = os.path.join(thumb_dir, f"{stem}_{target}.webp")
+            resized.save(webp_path, format="WEBP", quality=webp_quality, method=4)
+            webp.append([target, webp_path])
+            if jpeg is None:
+                jpeg = os.path.join(thumb_dir, f"{stem}_{target}.jpg")
+                resized.save(jpeg, format="JPEG", quality=jpeg_quality, optimize=True, progressive=True)
+    return {"width": width, "height": height, "webp": webp, "jpeg": jpeg}
+
+
+def _build_one(args):
+    """Worker: re-renders an image unless its content hash and settings match the manifest."""
+    image_path, previous, settings, thumb_dir = args
+    st = os.stat(image_path)
+    source_hash = file_sha256(image_path)
+    if (previous and previous["hash"] == source_hash and previous["settings"] == settings
+            and all(os.path.exists(p) for p in _outputs(previous))):
+        meta, rendered = dict(previous), False
+    else:
+        meta = render_thumbnails(image_path, settings["widths"], thumb_dir, settings["webp_quality"],
+                                 settings["jpeg_quality"])
+        rendered = True
+    meta.update(hash=source_hash, settings=settings)
+    return image_path, meta, [st.st_size, st.st_mtime_ns, source_hash], rendered
+
+
+def _load(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save(path, data, indent=None):
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=indent, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def load_manifest(thumb_dir=THUMB_DIR):
+    return _load(os.path.join(thumb_dir, MANIFEST_NAME))
+
+
+def save_manifest(manifest, thumb_dir=THUMB_DIR):
+    _save(os.path.join(thumb_dir, MANIFEST_NAME), manifest, indent=1)
+
+
+def build_thumbnails(image_paths, widths=DEFAULT_WIDTHS, thumb_dir=THUMB_DIR, webp_quality=WEBP_QUALITY,
+                     jpeg_quality=JPEG_QUALITY, workers=None, force=False):
+    """
+    Brings the thumbnails of `image_paths` up to date in a process pool and
+    returns the manifest {image path: metadata}. The manifest only records
+    content hashes, so it is the same on every machine. Images whose size
+    and mtime match the local stat cache are not even read; the rest are
+    hashed and only re-rendered when their content (or the settings) changed.
+    """
+    os.makedirs(thumb_dir, exist_ok=True)
+    settings = _settings(widths, webp_quality, jpeg_quality)
+    manifest = {} if force else load_manifest(thumb_dir)
+    stat_cache_path = os.path.join(thumb_dir, STAT_CACHE_NAME)
+    stats = _load(stat_cache_path)
+
+    jobs = []
+    for path in dict.fromkeys(image_paths):
+        if not os.path.exists(path):
+            print(f"⚠️ Missing image {path}")
+            continue
+        previous = manifest.get(path)
+        st = os.stat(path)
+        if (previous and stats.get(path) == [st.st_size, st.st_mtime_ns, previous["hash"]]
+                and previous["settings"] == settings and all(os.path.exists(p) for p in _outputs(previous))):
+            continue
+        jobs.append((path, previous, settings, thumb_dir))
+
+    rendered = 0
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for path, meta, stat, was_rendered in pool.map(_build_one, jobs, chunksize=4):
+                manifest[path] = meta
+                stats[path] = stat
+                rendered += was_rendered
+    save_manifest(manifest, thumb_dir)
+    _save(stat_cache_path, stats)
+    print(f"🖼️ Thumbnails: {rendered} images rendered, {len(jobs) - rendered} rehashed unchanged, "
+          f"{len(manifest) - len(jobs)} untouched")
+    return manifest
+
+
+def srcset_fields(image_file, meta):
+    """
+    Gallery entry fields: `thumbnail` (small JPEG, the <img> src), `srcset`
+    (WebP ladder), `srcset_jpeg` (for browsers without WebP), both ending
+    with the original at its own width, and the intrinsic size.
+    """
+    original = f"{image_file} {meta['width']}w"
+    thumbnail = meta["jpeg"] or image_file
+    small_width = meta["webp"][0][0] if meta["webp"] else meta["width"]
+    return {
+        "thumbnail": thumbnail,
+        "srcset": ", ".join([f"{path} {width}w" for width, path in meta["webp"]] + [original]),
+        "srcset_jpeg": original if thumbnail == image_file else f"{thumbnail} {small_width}w, {original}",
+        "width": meta["width"],
+        "height": meta["height"],
+    }
+
+
+def apply_thumbnails(entries, manifest):
+    """Sets the srcset fields on every entry whose image has thumbnails. Returns the entries."""
+    for entry in entries:
+        meta = manifest.get(entry["image_file"])
+        if meta is not None:
+            entry.update(srcset_fields(entry["image_file"], meta))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate gallery thumbnails and write srcset fields into the gallery JSON")
+    parser.add_argument("--input", default=GALLERY_JSON, help="gallery .json/.jsonl, rewritten with the srcset fields")
+    parser.add_argument("--thumb-dir", default=THUMB_DIR)
+    parser.add_argument("--widths", type=int, nargs="+", default=list(DEFAULT_WIDTHS))
+    parser.add_argument("--webp-quality", type=int, default=WEBP_QUALITY)
+    parser.add_argument("--jpeg-quality", type=int, default=JPEG_QUALITY)
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="re-render every image")
+    args = parser.parse_args()
+
+    image_paths = [entry["image_file"] for entry in iter_records(args.input)]
+    manifest = build_thumbnails(image_paths, args.widths, args.thumb_dir, args.webp_quality, args.jpeg_quality,
+                                args.workers, args.force)
+
+    with RecordWriter(args.input, indent=2) as writer:
+        for entry in iter_records(args.input):
+            writer.write(apply_thumbnails([entry], manifest)[0])
+
+    original = sum(os.path.getsize(p) for p in set(image_paths) if os.path.exists(p))
+    grid = sum(os.path.getsize(manifest[p]["webp"][0][1]) if manifest[p]["webp"] else os.path.getsize(p)
+               for p in set(image_paths) if p in manifest)
+    print(f"✅ {writer.count} entries updated in {args.input}; grid images {grid / 1e6:.1f} MB (WebP) "
+          f"vs {original / 1e6:.1f} MB originals")
+
+
+if __name__ == "__main__":
+    main()